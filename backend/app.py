@@ -1,53 +1,418 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Request, Response, g, request, jsonify, send_file
 from flask_cors import CORS
 import os
 import io
 import numpy as np
-import librosa
+import librosa  # lazy package: its submodules load on first use
 import soundfile as sf
-from scipy.signal import butter, filtfilt
-from scipy.interpolate import interp1d
+import scipy.fft
 import tempfile
 import logging
+import tracemalloc
+import functools
+import struct
 from werkzeug.utils import secure_filename
-from pydub import AudioSegment
 import json
+import re
+import base64
+import time
+import zipfile
+import hashlib
+import uuid
+import threading
+import queue
+from collections import OrderedDict
+from contextlib import contextmanager
+from jobs import JobScheduler, QueueFull, report_metrics, report_progress
+from metrics import Metrics, server_timing
+from flask_sock import Sock
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class InMemoryRequest(Request):
+    """Request that keeps uploaded files in memory instead of spooling to disk
+
+    Uploads are capped by MAX_CONTENT_LENGTH, so holding them in a BytesIO is
+    bounded and lets the decode path run without touching the filesystem.
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
 app = Flask(__name__)
+app.request_class = InMemoryRequest
 CORS(app)
+sock = Sock(app)
 
 # Configuration
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
 UPLOAD_FOLDER = 'uploads'
 PROCESSED_FOLDER = 'processed'
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'ogg', 'flac', 'm4a'}
+STREAM_BLOCK_SIZE = 65536  # samples read and rendered per step by /process-stream
+REALTIME_N_FFT = 1024  # STFT size of the /realtime pitch shifter; sets most of its latency
+REALTIME_HOP_LENGTH = 256
+REALTIME_FRAME_SIZE = 512  # default samples per /realtime message
+REALTIME_SAMPLE_RATES = (8000, 192000)  # lowest and highest sr a /realtime client may stream at
+RENDER_SLOTS = int(os.environ.get('RENDER_SLOTS', 2))  # renders run at once in request threads, one AutoTuneProcessor each
+# Render processes; by default each server worker process's share of the cores, less its render slots
+JOB_WORKERS = (int(os.environ.get('JOB_WORKERS', 0))
+               or max(1, (os.cpu_count() or 1) // int(os.environ.get('WEB_CONCURRENCY', 1)) - RENDER_SLOTS))
+JOB_QUEUE_DEPTH = 32  # queued plus running jobs before /jobs answers 503
+JOB_RESULT_TTL = 600  # seconds a finished job's result is kept
+JOB_MAX_FINISHED = 64  # finished jobs kept for their results; the oldest go first
+RENDER_QUEUE_DEPTH = 8  # requests waiting for a render slot before they get 503
+RENDER_QUEUE_TIMEOUT = 30  # seconds a request waits for a render slot before it gets 503
+RETRY_AFTER = 5  # seconds a 503 asks the client to wait before trying again
+RESULT_CACHE_MEMORY = 256 * 1024 * 1024  # bytes of rendered WAVs kept in memory
+RESULT_CACHE_DISK = 2 * 1024 * 1024 * 1024  # bytes kept under PROCESSED_FOLDER; 0 disables
+UPLOAD_STORE_DISK = 2 * 1024 * 1024 * 1024  # bytes of decoded uploads kept under UPLOAD_FOLDER; 0 disables
+ANALYSIS_SESSION_MEMORY = 512 * 1024 * 1024  # bytes of decoded takes and analysis kept for /sessions
+RESULT_CACHE_VERSION = 4  # bump whenever a change to the processing alters its output
+METRICS_ENABLED = True  # stage and request histograms served by /metrics
+METRICS_TRACE_MEMORY = False  # also record bytes allocated per stage; slows every allocation down
+SERVER_TIMING = False  # add a Server-Timing header with the request's stage times
+WARMUP_SAMPLE_RATE = 22050  # rate of the synthetic take rendered before /health reports ready
+INSTRUMENTALS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend', 'public', 'instrumentals')
+BEAT_CACHE_FOLDER = 'beats'  # decoded instrumentals as memory-mapped float32 .npy files
+USER_PRESETS_FILE = 'presets.json'  # presets registered through PUT /presets/<id>
+
+PITCH_DETECTORS = ('piptrack', 'yin')  # choices for effects['pitch_detector']
+QUALITY_TIERS = ('final', 'preview')  # choices for effects['quality']
+# Effect settings that must be numbers; PresetRegistry accepts these plus SOUND_SETTINGS and nothing else
+NUMERIC_SETTINGS = ('pitch_shift', 'autotune_strength', 'retune_speed', 'reverb_amount', 'room_size', 'delay_time',
+                    'analysis_rate', 'instrumental_gain', 'instrumental_offset', 'preview_start', 'preview_duration')
+SOUND_SETTINGS = ('key', 'scale', 'pitch_detector', 'instrumental', 'key_lock')
+PREVIEW_SAMPLE_RATE = 22050  # highest rate quality='preview' renders at
+PREVIEW_N_FFT = 1024  # preview STFT: shorter, with half the overlap of the final one
+PREVIEW_HOP_LENGTH = 512
+SILENCE_TOP_DB = 50  # frames this far below a take's loudest are silence to the shift stage
+SILENCE_FLOOR = 1e-3  # RMS (-60 dBFS) below which a frame is silence however quiet the take
+SEGMENT_PAD = 0.1  # seconds kept either side of a voiced region; its outer half is the crossfade
+SEGMENT_MIN_GAP = 0.5  # silences shorter than this are shifted along with the phrases around them
+SEGMENT_MAX_COVERAGE = 0.8  # voiced fraction above which one pass over the whole take is used
+
+metrics = Metrics(METRICS_ENABLED, METRICS_TRACE_MEMORY)
+if METRICS_TRACE_MEMORY:
+    tracemalloc.start()
+
+# Musical scales as semitone offsets from the key's root
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+FLAT_NAMES = {'DB': 'C#', 'EB': 'D#', 'GB': 'F#', 'AB': 'G#', 'BB': 'A#'}
+SCALES = {
+    'chromatic': tuple(range(12)),
+    'major': (0, 2, 4, 5, 7, 9, 11),
+    'minor': (0, 2, 3, 5, 7, 8, 10),
+    'major_pentatonic': (0, 2, 4, 7, 9),
+    'minor_pentatonic': (0, 3, 5, 7, 10),
+    'blues': (0, 3, 5, 6, 7, 10),
+}
+
+# Krumhansl-Kessler key profiles, from the tonic up, for detect_key
+KEY_PROFILES = {
+    'major': (6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88),
+    'minor': (6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17),
+}
+
+# Built-in effect presets served by /presets
+PRESETS = {
+    "kanye": {
+        "name": "Kanye Mode",
+        "description": "808s & Heartbreak style auto-tune",
+        "effects": {
+            "pitch_shift": 2,
+            "autotune_strength": 85,
+            "reverb_amount": 40,
+            "delay_time": 120
+        }
+    },
+    "tpain": {
+        "name": "T-Pain Mode", 
+        "description": "Heavy auto-tune effect",
+        "effects": {
+            "pitch_shift": 4,
+            "autotune_strength": 95,
+            "reverb_amount": 60,
+            "delay_time": 200
+        }
+    },
+    "robot": {
+        "name": "Robot Mode",
+        "description": "Robotic voice effect",
+        "effects": {
+            "pitch_shift": -8,
+            "autotune_strength": 100,
+            "reverb_amount": 20,
+            "delay_time": 80
+        }
+    },
+    "clear": {
+        "name": "Clear",
+        "description": "No effects applied",
+        "effects": {
+            "pitch_shift": 0,
+            "autotune_strength": 0,
+            "reverb_amount": 0,
+            "delay_time": 0
+        }
+    }
+}
 
 # Create necessary directories
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+os.makedirs(BEAT_CACHE_FOLDER, exist_ok=True)
+
+def lfilter(b, a, x, axis=-1, zi=None):
+    """scipy.signal.lfilter, imported on first call
+
+    Importing scipy.signal takes over a second (it pulls in scipy.stats), so
+    it stays out of the import of this module.
+    """
+    from scipy.signal import lfilter
+    return lfilter(b, a, x, axis=axis, zi=zi)
+
+def hann_window(n_fft):
+    """Periodic Hann window, as scipy.signal.get_window('hann', n_fft) and librosa.stft use"""
+    return (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)).astype(np.float32)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def effects_from_form(form):
+    """Effect parameters from a multipart form: an 'effects' JSON field, a preset name or individual fields"""
+    if 'effects' in form:
+        return json.loads(form['effects'])
+    if 'preset' in form:
+        return {'preset': form['preset']}
+    
+    # Get individual parameters
+    return {
+        'pitch_shift': int(form.get('pitch_shift', 0)),
+        'autotune_strength': int(form.get('autotune_strength', 50)),
+        'reverb_amount': int(form.get('reverb_amount', 30)),
+        'delay_time': int(form.get('delay_time', 150))
+    }
+
+def check_effects(effects):
+    """Raise ValueError unless effects is a dict a render can use: known beat, preset, detector and so on"""
+    if not isinstance(effects, dict):
+        raise ValueError("effects must be a JSON object")
+    processor._plan_chain(effects)
+    return effects
+
+def wav_header(sr, n_frames, channels=1):
+    """44-byte header of a 16-bit PCM WAV file, for writing the samples after it"""
+    data_size = n_frames * channels * 2
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, channels, sr, sr * channels * 2, channels * 2, 16,
+        b'data', data_size
+    )
+
+def wav_sample_rate(wav_bytes):
+    """Sample rate field of a WAV header written by wav_header"""
+    return struct.unpack_from('<I', wav_bytes, 24)[0]
+
+def pcm16_bytes(audio):
+    """Float samples in [-1, 1] as little-endian 16-bit PCM, channels interleaved
+
+    audio is mono (samples,) or (channels, samples).
+    """
+    return (np.clip(audio.T, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+def encode_wav(audio, sr):
+    """Mono or (channels, samples) float samples as the bytes of a 16-bit PCM WAV file"""
+    channels = 1 if audio.ndim == 1 else audio.shape[0]
+    with metrics.stage('encode', audio.shape[-1], sr):
+        return wav_header(sr, audio.shape[-1], channels) + pcm16_bytes(audio)
+
+def audio_suffix(audio_bytes):
+    """Guess a file extension from the first few bytes of an audio file"""
+    # WebM files start with specific magic bytes
+    if audio_bytes[:4] == b'\x1a\x45\xdf\xa3':
+        return '.webm'
+    elif audio_bytes[:4] == b'RIFF':
+        return '.wav'
+    elif audio_bytes[:3] == b'ID3' or audio_bytes[:2] == b'\xff\xfb':
+        return '.mp3'
+    elif audio_bytes[:4] == b'fLaC':
+        return '.flac'
+    elif audio_bytes[:4] == b'OggS':
+        return '.ogg'
+    elif audio_bytes[4:8] == b'ftyp':
+        return '.m4a'
+    # Default to webm as that's what MediaRecorder typically produces
+    return '.webm'
+
+def decode_audio(source, suffix=None, mono=True):
+    """Decode an audio file to float32 at its native rate
+
+    source is the file's bytes or a readable, seekable binary file such as an
+    upload's stream. Everything libsndfile reads (WAV, FLAC, OGG and, with
+    libsndfile 1.1+, MP3) decodes straight from memory. Containers it cannot
+    parse, such as M4A or MediaRecorder's WebM, go through librosa's
+    audioread/ffmpeg fallback, which needs a real file; suffix names its
+    format and is sniffed from the data when not given. With mono (the
+    default) channels are averaged into a 1-D array; otherwise files with
+    more than one channel come back as (channels, samples).
+    """
+    with metrics.stage('decode') as stage:
+        audio, sr = _decode_audio(source, suffix, mono)
+        stage.update(samples=audio.shape[-1], sr=sr)
+    return audio, sr
+
+def _decode_audio(source, suffix, mono):
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    start = source.tell()
+    try:
+        audio, sr = sf.read(source, dtype='float32', always_2d=True)
+        if audio.shape[1] == 1:
+            return np.ascontiguousarray(audio[:, 0]), sr
+        if mono:
+            # Downmix to mono, as librosa.load does
+            return audio.mean(axis=1), sr
+        return np.ascontiguousarray(audio.T), sr
+    except RuntimeError:
+        source.seek(start)
+    
+    audio_bytes = source.read()
+    suffix = suffix or audio_suffix(audio_bytes)
+    logger.info(f"Decoding {suffix} through ffmpeg")
+    temp_input = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    try:
+        temp_input.write(audio_bytes)
+        temp_input.close()
+        return librosa.load(temp_input.name, sr=None, mono=mono)
+    finally:
+        os.unlink(temp_input.name)
+
+def write_npy(path, audio):
+    """Save audio as float32 .npy, writing then renaming so readers never map a truncated file"""
+    temp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(temp_path, np.ascontiguousarray(audio, dtype=np.float32))
+    os.replace(temp_path, path)
+
+def write_json(path, data):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+def detect_key(audio, sr, block_size=2 ** 20):
+    """Most likely key of audio as (root, 'major' or 'minor')
+
+    Correlates the average chroma of the mid signal with the Krumhansl-Kessler
+    profile of all 24 keys. audio is mono or (channels, samples), e.g. a
+    memory-mapped beat, and is read block_size samples at a time.
+    """
+    chroma = np.zeros(12)
+    for start in range(0, audio.shape[-1], block_size):
+        block = audio[..., start:start + block_size]
+        mid = np.asarray(block if block.ndim == 1 else block.mean(axis=0), dtype=np.float32)
+        if len(mid) >= 2048:
+            chroma += librosa.feature.chroma_stft(y=mid, sr=sr).sum(axis=1)
+    
+    scores = [(np.corrcoef(chroma, np.roll(profile, root))[0, 1], NOTE_NAMES[root], scale)
+              for scale, profile in KEY_PROFILES.items() for root in range(12)]
+    _, root, scale = max(scores)
+    return root, scale
+
+@functools.lru_cache(maxsize=16)
+def reverb_impulse_response(sr, room_size):
+    """Synthetic room impulse response: early reflections plus a decaying noise tail
+
+    room_size (0-1) scales the pre-delay, the reflection spacing and the RT60,
+    and larger rooms get a darker tail. The noise is seeded so the same room
+    always sounds the same. The IR is normalized to unit energy.
+    """
+    rt60 = 0.3 + 2.2 * room_size  # seconds for the tail to fall by 60 dB
+    length = int(rt60 * sr)
+    t = np.arange(length) / sr
+    
+    rng = np.random.default_rng(808)
+    impulse_response = rng.standard_normal(length) * 10 ** (-3 * t / rt60)
+    
+    # Air absorption: one-pole lowpass on the tail
+    damping = 0.2 + 0.6 * room_size
+    impulse_response = lfilter([1 - damping], [1, -damping], impulse_response)
+    
+    # Nothing arrives before the first wall reflection
+    pre_delay = int((0.005 + 0.025 * room_size) * sr)
+    impulse_response[:pre_delay] = 0.0
+    
+    for i, gain in enumerate((0.8, 0.6, 0.45, 0.35, 0.25)):
+        tap = pre_delay + int((i + 1) * (0.004 + 0.012 * room_size) * sr)
+        if tap < length:
+            impulse_response[tap] += gain
+    
+    impulse_response /= np.sqrt(np.sum(impulse_response ** 2))
+    return impulse_response.astype(np.float32)
+
+@functools.lru_cache(maxsize=32)
+def reverb_ir_spectrum(sr, room_size, block_size):
+    """FFT size and real spectrum of the room IR for overlap-add in blocks of block_size"""
+    impulse_response = reverb_impulse_response(sr, room_size)
+    fft_size = scipy.fft.next_fast_len(block_size + len(impulse_response) - 1, real=True)
+    return fft_size, scipy.fft.rfft(impulse_response, fft_size)
+
+@functools.lru_cache(maxsize=32)
+def reverb_ir_partitions(sr, room_size, partition_size):
+    """Spectra of the room IR cut into partition_size pieces, for partitioned convolution
+
+    Row k is the 2 * partition_size point real FFT of IR samples
+    [k * partition_size, (k + 1) * partition_size).
+    """
+    impulse_response = reverb_impulse_response(sr, room_size)
+    n_partitions = -(-len(impulse_response) // partition_size)
+    pieces = np.zeros((n_partitions, partition_size), dtype=np.float32)
+    pieces.ravel()[:len(impulse_response)] = impulse_response
+    return scipy.fft.rfft(pieces, 2 * partition_size, axis=1).astype(np.complex64)
+
 class AutoTuneProcessor:
-    def __init__(self):
-        self.sample_rate = 22050
+    """Pitch correction and effects chain
+
+    float32 mono (samples,) or (channels, samples) audio, copied at most once and then worked on in place.
+    """
+    
+    dtype = np.float32
+    
+    def __init__(self, n_fft=2048, hop_length=512, beats=None, presets=None):
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.reverb_block_size = 16384
+        self.work_size = 65536
+        self.chunk_frames = 64
+        # Shift only the voiced segments of a take, passing silence through
+        self.skip_silence = True
+        self._window = hann_window(n_fft)
+        self._analysis_processors = {}
+        self._previewer = None
+        # BeatLibrary the mix stage reads instrumentals from
+        self.beats = beats
+        # PresetRegistry that effects={'preset': name} is looked up in
+        self.presets = presets
+        self._preset_chains = {}
+        self._preset_version = None
         self.note_frequencies = self._get_note_frequencies()
+        self._scale_tables = {}
     
-    def _get_note_frequencies(self):
-        """Generate frequencies for musical notes (C4 to C6)"""
-        notes = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+    def _get_note_frequencies(self, key='C', scale='chromatic'):
+        """Generate frequencies for the notes of a key and scale (C1 to B7)"""
+        root = NOTE_NAMES.index(FLAT_NAMES.get(key.upper(), key.upper()))
+        degrees = {(root + offset) % 12 for offset in SCALES[scale]}
         frequencies = {}
         
         # A4 = 440 Hz as reference
         a4_freq = 440.0
         
-        for octave in range(3, 7):  # C3 to C6
-            for i, note in enumerate(notes):
+        for octave in range(1, 8):  # C1 to B7
+            for i, note in enumerate(NOTE_NAMES):
+                if i not in degrees:
+                    continue
                 # Calculate frequency using the equal temperament formula
                 semitones_from_a4 = (octave - 4) * 12 + (i - 9)  # A is the 10th note (index 9)
                 freq = a4_freq * (2 ** (semitones_from_a4 / 12))
@@ -55,192 +420,2031 @@ class AutoTuneProcessor:
         
         return frequencies
     
-    def _detect_pitch(self, audio, sr):
-        """Detect the fundamental frequency of audio using librosa"""
+    def _scale_table(self, key='C', scale='chromatic'):
+        """Pitch-class lookup for snapping to a key/scale, built once per key/scale
+
+        below[pc] and above[pc] are the semitones from pitch class pc down (or
+        level) and strictly up to the nearest note of the scale; lowest and
+        highest are the MIDI bounds of the note table.
+        """
+        table = self._scale_tables.get((key, scale))
+        if table is None:
+            frequencies = np.fromiter(self._get_note_frequencies(key, scale).values(), dtype=np.float64)
+            notes = np.rint(69 + 12 * np.log2(frequencies / 440.0))
+            degrees = np.unique(notes.astype(np.intp) % 12)
+            steps = (np.arange(12)[:, None] - degrees[None, :]) % 12
+            above = (-steps) % 12
+            above[above == 0] = 12
+            table = (steps.min(axis=1), above.min(axis=1), notes.min(), notes.max())
+            self._scale_tables[(key, scale)] = table
+        return table
+    
+    def _detect_pitch(self, audio, sr, detector='piptrack'):
+        """Detect the fundamental frequency of audio with librosa's piptrack or YIN"""
         try:
-            # Use librosa's pitch detection
-            pitches, magnitudes = librosa.piptrack(y=audio, sr=sr, threshold=0.1)
-            
-            # Extract the most prominent pitch for each frame
-            pitch_values = []
-            for t in range(pitches.shape[1]):
-                index = magnitudes[:, t].argmax()
-                pitch = pitches[index, t]
-                if pitch > 0:
-                    pitch_values.append(pitch)
-            
-            return np.array(pitch_values) if pitch_values else np.array([])
+            if detector == 'yin':
+                pitch_track = self._yin_track(audio, sr)[0]
+            else:
+                stft = librosa.stft(audio, n_fft=self.n_fft, hop_length=self.hop_length)
+                pitch_track = self._pitch_track(np.abs(stft), sr)
+            return pitch_track[pitch_track > 0]
         except Exception as e:
             logger.error(f"Pitch detection error: {e}")
             return np.array([])
     
-    def _find_nearest_note(self, frequency):
+    def _quantize_pitch(self, frequencies, key='C', scale='chromatic'):
+        """Snap an array of frequencies to the nearest note in key/scale
+
+        Closed form in the log2 (MIDI) domain: floor to a semitone, then look
+        up the neighbouring scale notes by pitch class. Distances are measured
+        in semitones and non-positive values (unvoiced frames) pass through.
+        """
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        quantized = frequencies.copy()
+        voiced = frequencies > 0
+        if not np.any(voiced):
+            return quantized
+        
+        below, above, lowest, highest = self._scale_table(key, scale)
+        midi = 69 + 12 * np.log2(frequencies[voiced] / 440.0)
+        np.clip(midi, lowest, highest, out=midi)
+        base = np.floor(midi)
+        pitch_class = (base - 12 * np.floor(base / 12)).astype(np.intp)
+        lower = base - below[pitch_class]
+        upper = base + above[pitch_class]
+        nearest = np.where(midi - lower <= upper - midi, lower, upper)
+        quantized[voiced] = 440.0 * 2 ** ((nearest - 69) / 12)
+        return quantized
+    
+    def _find_nearest_note(self, frequency, key='C', scale='chromatic'):
         """Find the nearest musical note frequency"""
         if frequency <= 0:
             return frequency
         
-        note_freqs = list(self.note_frequencies.values())
-        nearest_freq = min(note_freqs, key=lambda x: abs(x - frequency))
-        return nearest_freq
+        return float(self._quantize_pitch([frequency], key, scale)[0])
     
     def _apply_pitch_shift(self, audio, sr, shift_semitones):
         """Apply pitch shift to audio"""
+        if shift_semitones == 0:
+            return audio
+        
+        return self._apply_shift(audio, sr, semitones=shift_semitones)
+    
+    def _pitch_track(self, magnitude, sr):
+        """Per-frame fundamental frequency from a magnitude spectrogram (0 = unvoiced)"""
+        pitches, magnitudes = librosa.piptrack(
+            S=magnitude, sr=sr, n_fft=self.n_fft, hop_length=self.hop_length, threshold=0.1
+        )
+        strongest = magnitudes.argmax(axis=0)
+        return pitches[strongest, np.arange(pitches.shape[1])]
+    
+    def _stft_pitch_track(self, stft, sr):
+        """_pitch_track of a whole STFT, chunk_frames frames at a time
+
+        piptrack thresholds every frame on its own, so the chunks give the
+        same track as one call without a full-size magnitude and piptrack's
+        full-size outputs. A (channels, bins, frames) STFT is tracked on the
+        mid signal, whose spectrum is the mean of the channels' spectra.
+        """
+        def magnitude(chunk):
+            if chunk.ndim == 2:
+                return np.abs(chunk)
+            # Summed channel by channel: complex mean() is several times slower
+            mid = chunk[0].copy()
+            for channel in chunk[1:]:
+                mid += channel
+            mid *= 1.0 / len(chunk)
+            return np.abs(mid)
+        
+        return np.concatenate([
+            self._pitch_track(magnitude(stft[..., start:start + self.chunk_frames]), sr)
+            for start in range(0, stft.shape[-1], self.chunk_frames)
+        ])
+    
+    def _analysis_track(self, audio, sr, detector, analysis_rate):
+        """Pitch track of audio's mid signal computed at analysis_rate, one value per STFT frame
+
+        Analysis at a lower rate uses a resampled copy and an STFT scaled to
+        the same frame duration, then picks the nearest analysis frame for
+        every frame of the native-rate STFT.
+        """
+        mid = audio if audio.ndim == 1 else audio.mean(axis=0)
+        y = librosa.resample(mid, orig_sr=sr, target_sr=analysis_rate)
+        scale = analysis_rate / sr
+        n_fft = 2 * max(16, round(self.n_fft * scale / 2))
+        hop_length = max(1, round(self.hop_length * scale))
+        if (n_fft, hop_length) not in self._analysis_processors:
+            self._analysis_processors[n_fft, hop_length] = AutoTuneProcessor(n_fft, hop_length)
+        analyser = self._analysis_processors[n_fft, hop_length]
+        if detector == 'yin':
+            track = analyser._yin_track(y, analysis_rate)[0]
+        else:
+            track = analyser._stft_pitch_track(librosa.stft(y, n_fft=n_fft, hop_length=hop_length), analysis_rate)
+        
+        n_frames = 1 + audio.shape[-1] // self.hop_length
+        times = np.arange(n_frames) * (self.hop_length / sr)
+        nearest = np.minimum(np.rint(times * analysis_rate / hop_length).astype(np.intp), len(track) - 1)
+        return track[nearest]
+    
+    def _yin(self, frames, sr, fmin=50.0, fmax=2000.0, threshold=0.15):
+        """YIN (f0, confidence) of each row of (n_frames, frame_length) frames, f0 = 0 when unvoiced
+
+        Rows are decimated to about 11 kHz and differenced by FFT cross-correlation.
+        """
+        frames = np.asarray(frames, dtype=np.float32)
+        # Analyse at about 11 kHz: plenty for fmax, and every array shrinks
+        factor = 1 << max(int(np.log2(sr / 11025.0)), 0)
+        if factor > 1:
+            frame_length = frames.shape[1] - frames.shape[1] % factor
+            decimated = frames[:, 0:frame_length:factor] * (1.0 / factor)
+            for phase in range(1, factor):
+                decimated += frames[:, phase:frame_length:factor] * (1.0 / factor)
+            frames = decimated
+            sr = sr / factor
+        
+        n_frames, frame_length = frames.shape
+        window = frame_length // 2
+        min_lag = max(int(sr / fmax), 2)
+        max_lag = min(int(sr / fmin), frame_length - window - 2)
+        n_lags = max_lag + 2
+        if n_frames == 0 or max_lag <= min_lag:
+            return np.zeros(n_frames), np.zeros(n_frames)
+        
+        # Only window + n_lags samples take part; centre the window in the
+        # frame if the longest lag allows it
+        span = window + n_lags
+        start = min((frame_length - window) // 2, frame_length - span)
+        frames = frames[:, start:start + span]
+        
+        # r(tau) = sum_j x[j] * x[j + tau] over the first window samples
+        fft_size = scipy.fft.next_fast_len(span, real=True)
+        spectrum = scipy.fft.rfft(frames, fft_size, axis=1)
+        head = scipy.fft.rfft(frames[:, :window], fft_size, axis=1)
+        autocorrelation = scipy.fft.irfft(np.conj(head) * spectrum, fft_size, axis=1)[:, :n_lags]
+        
+        # d(tau) = E[0:W] + E[tau:tau+W] - 2 r(tau)
+        energy = np.zeros((n_frames, span + 1), dtype=np.float32)
+        np.cumsum(frames ** 2, axis=1, out=energy[:, 1:])
+        lagged_energy = energy[:, window:window + n_lags] - energy[:, :n_lags]
+        difference = np.maximum(energy[:, window:window + 1] + lagged_energy - 2 * autocorrelation, 0.0)
+        
+        # Cumulative mean normalized difference, 1 at lag 0
+        running_sum = np.cumsum(difference[:, 1:], axis=1)
+        normalized = np.ones_like(difference)
+        np.divide(difference[:, 1:] * np.arange(1, n_lags, dtype=np.float32), running_sum,
+                  out=normalized[:, 1:], where=running_sum > 1e-9)
+        
+        # Local minima below threshold; the first one along the lag axis wins
+        search = normalized[:, min_lag - 1:]
+        dips = (search[:, 1:-1] < search[:, :-2]) & (search[:, 1:-1] <= search[:, 2:]) & (search[:, 1:-1] < threshold)
+        voiced = dips.any(axis=1)
+        lag = min_lag + dips.argmax(axis=1)
+        
+        rows = np.arange(n_frames)
+        before, at, after = normalized[rows, lag - 1], normalized[rows, lag], normalized[rows, lag + 1]
+        curvature = before - 2 * at + after
+        offset = np.divide(before - after, 2 * curvature, out=np.zeros_like(at), where=np.abs(curvature) > 1e-9)
+        refined_lag = lag + np.clip(offset, -1.0, 1.0)
+        
+        f0 = np.where(voiced, sr / refined_lag, 0.0)
+        confidence = np.where(voiced, np.clip(1.0 - at, 0.0, 1.0), 0.0)
+        return f0, confidence
+    
+    def _yin_track(self, audio, sr):
+        """YIN pitch and confidence on the same frames as librosa.stft (centered, n_fft, hop_length)"""
+        padded = np.pad(np.asarray(audio, dtype=np.float32), self.n_fft // 2)
+        n_frames = 1 + len(audio) // self.hop_length
+        frames = np.lib.stride_tricks.sliding_window_view(padded, self.n_fft)[::self.hop_length][:n_frames]
+        return self._yin(frames, sr)
+    
+    def _correction_curve(self, pitch_track, sr, strength, retune_speed, key='C', scale='chromatic',
+                          state=None):
+        """Per-frame correction in semitones towards the nearest note in key/scale
+
+        retune_speed is the time constant (seconds) of a one-pole glide towards
+        the target; 0 snaps instantly, larger values give a more natural slur.
+        When rendering block by block, pass the same state dict each time so the
+        glide carries across blocks.
+        """
+        voiced = pitch_track > 0
+        correction = np.zeros(len(pitch_track))
+        if np.any(voiced):
+            target = self._quantize_pitch(pitch_track[voiced], key, scale)
+            correction[voiced] = 12 * np.log2(target / pitch_track[voiced])
+        
+        if retune_speed > 0:
+            alpha = 1 - np.exp(-self.hop_length / (sr * retune_speed))
+            glide = None if state is None else state.get('glide')
+            correction, glide = lfilter([alpha], [1, alpha - 1], correction,
+                                        zi=np.zeros(1) if glide is None else glide)
+            if state is not None:
+                state['glide'] = glide
+        
+        return correction * strength
+    
+    def _shift_spectrum(self, stft, semitones, state=None):
+        """Shift each STFT frame by its own number of semitones
+
+        Phase-vocoder bin remapping: every bin's magnitude moves to bin k * ratio
+        and its true phase advance is scaled by the same ratio, then the output
+        phase is re-accumulated per bin so frames stay coherent across changes
+        in ratio. Frames with a ratio of 1 reconstruct exactly. For block-wise
+        rendering, state carries the last input and output phases.
+        """
+        n_bins, n_frames = stft.shape
+        ratios = 2.0 ** (np.asarray(semitones, dtype=np.float64) / 12.0)
+        magnitude = np.abs(stft)
+        phase = np.angle(stft).astype(np.float64)
+        two_pi = 2 * np.pi
+        
+        # True phase advance per hop; the very first frame keeps its absolute phase
+        expected = (two_pi * self.hop_length / self.n_fft) * np.arange(n_bins)[:, None]
+        previous = None if state is None else state.get('phase')
+        if previous is None:
+            advance = np.diff(phase, axis=1, prepend=0.0)
+            deviation = advance[:, 1:]
+        else:
+            advance = np.diff(phase, axis=1, prepend=previous[:, None])
+            deviation = advance
+        deviation -= expected
+        deviation -= two_pi * np.rint(deviation / two_pi)
+        deviation += expected
+        advance *= ratios
+        
+        # Destination of every (bin, frame) as a flat index; bins shifted past
+        # Nyquist land in a spill row that is dropped afterwards
+        target = np.rint(np.arange(n_bins, dtype=np.float32)[:, None] * ratios.astype(np.float32))
+        target = np.minimum(target, n_bins).astype(np.intp)
+        target *= n_frames
+        target += np.arange(n_frames)
+        target = target.ravel()
+        size = n_bins * n_frames
+        
+        shifted_magnitude = np.bincount(
+            target, weights=magnitude.ravel(), minlength=size + n_frames
+        )[:size].reshape(n_bins, n_frames).astype(np.float32)
+        shifted_phase = np.zeros(size + n_frames)
+        shifted_phase[target] = advance.ravel()
+        shifted_phase = shifted_phase[:size].reshape(n_bins, n_frames)
+        if state is not None and previous is not None:
+            shifted_phase[:, 0] += state['output_phase']
+        shifted_phase = np.cumsum(shifted_phase, axis=1)
+        shifted_phase -= two_pi * np.rint(shifted_phase / two_pi)
+        if state is not None:
+            state['phase'] = phase[:, -1].copy()
+            state['output_phase'] = shifted_phase[:, -1].copy()
+        shifted_phase = shifted_phase.astype(np.float32)
+        
+        shifted = np.empty((n_bins, n_frames), dtype=np.complex64)
+        shifted.real = shifted_magnitude * np.cos(shifted_phase)
+        shifted.imag = shifted_magnitude * np.sin(shifted_phase)
+        return shifted
+    
+    def _stft(self, audio):
+        """librosa.stft of mono or (channels, samples) audio
+
+        Channels are transformed one at a time into a (channels, bins, frames)
+        array whose channels are stored one after another; librosa's own
+        multichannel STFT interleaves them, which makes every per-channel pass
+        strided.
+        """
+        if audio.ndim == 1:
+            return librosa.stft(audio, n_fft=self.n_fft, hop_length=self.hop_length)
+        # Each channel laid out as librosa lays out a mono STFT, frame by frame
+        stft = np.empty((audio.shape[0], 1 + audio.shape[-1] // self.hop_length, 1 + self.n_fft // 2),
+                        dtype=np.complex64 if audio.dtype == np.float32 else np.complex128).transpose(0, 2, 1)
+        for channel in range(audio.shape[0]):
+            librosa.stft(audio[channel], n_fft=self.n_fft, hop_length=self.hop_length, out=stft[channel])
+        return stft
+    
+    def _istft(self, stft, length, out=None):
+        """Inverse of librosa.stft (centered Hann frames) into out or a new float32 array
+
+        The same overlap-add and squared-window normalization as
+        librosa.istft, but frames are inverted chunk_frames at a time and the
+        window sum is tiled from one period instead of built at full length, so
+        the output is the only full-length buffer. A (channels, bins, frames)
+        STFT gives (channels, length).
+        """
+        if stft.ndim == 3:
+            output = np.zeros((stft.shape[0], length), dtype=np.float32) if out is None else out
+            for channel in range(stft.shape[0]):
+                self._istft(stft[channel], length, out=output[channel])
+            return output
+        
+        n_fft, hop_length = self.n_fft, self.hop_length
+        n_bins, n_frames = stft.shape
+        pad = n_fft // 2
+        output = np.zeros(length, dtype=np.float32) if out is None else out
+        if out is not None:
+            output.fill(0.0)
+        
+        for first in range(0, n_frames, self.chunk_frames):
+            frames = scipy.fft.irfft(stft[:, first:first + self.chunk_frames], n_fft, axis=0).T
+            frames *= self._window
+            # With hop dividing n_fft, each hop-sized slice of a frame is one strided add
+            for offset in range(0, n_fft, hop_length):
+                start = first * hop_length + offset - pad
+                piece = frames[:, offset:offset + hop_length].ravel()
+                lo, hi = max(0, -start), min(len(piece), length - start)
+                if lo < hi:
+                    output[start + lo:start + hi] += piece[lo:hi]
+        
+        # Sum of squared windows over the frames covering each padded sample:
+        # periodic in the middle, worked out frame by frame near both ends
+        window_square = self._window ** 2
+        period = window_square.reshape(-1, hop_length).sum(axis=0)
+        edge = n_fft + hop_length
+        def exact_norm(begin, end):
+            norm = np.zeros(end - begin, dtype=np.float32)
+            for frame in range(max(0, (begin - n_fft) // hop_length), min(n_frames, end // hop_length + 1)):
+                lo, hi = max(begin, frame * hop_length), min(end, frame * hop_length + n_fft)
+                if lo < hi:
+                    norm[lo - begin:hi - begin] += window_square[lo - frame * hop_length:hi - frame * hop_length]
+            return norm
+        
+        tiny = np.finfo(np.float32).tiny
+        tail = (n_frames - 1) * hop_length
+        for begin in range(pad, pad + length, self.work_size):
+            end = min(begin + self.work_size, pad + length)
+            if begin < edge or end > tail:
+                norm = exact_norm(begin, end)
+            else:
+                norm = np.resize(np.roll(period, -(begin % hop_length)), end - begin)
+            chunk = output[begin - pad:end - pad]
+            np.divide(chunk, norm, out=chunk, where=norm > tiny)
+        return output
+    
+    def _voiced_segments(self, audio, sr):
+        """(start, end) sample ranges of audio that aren't silence
+
+        Energy-based voice activity on the mid signal: a hop_length frame is
+        active when its RMS is within SILENCE_TOP_DB of the loudest frame and
+        above SILENCE_FLOOR. Each run of active frames is widened by
+        SEGMENT_PAD, rounded up to whole frames so segments start on the
+        take's own frame grid, and runs less than SEGMENT_MIN_GAP apart are
+        merged, so the ranges never overlap.
+        """
+        mid = audio if audio.ndim == 1 else audio.mean(axis=0)
+        n_samples = len(mid)
+        n_frames = n_samples // self.hop_length
+        energy = np.square(mid[:n_frames * self.hop_length].reshape(n_frames, self.hop_length)).mean(axis=1)
+        if n_samples > n_frames * self.hop_length:
+            energy = np.append(energy, np.square(mid[n_frames * self.hop_length:]).mean())
+        if not len(energy):
+            return []
+        threshold = max(energy.max() * 10 ** (-SILENCE_TOP_DB / 10), SILENCE_FLOOR ** 2)
+        active = np.flatnonzero(energy > threshold)
+        if not len(active):
+            return []
+        
+        breaks = np.flatnonzero(np.diff(active) > 1)
+        starts = active[np.concatenate(([0], breaks + 1))] * self.hop_length
+        ends = (active[np.concatenate((breaks, [len(active) - 1]))] + 1) * self.hop_length
+        pad = -(-int(SEGMENT_PAD * sr) // self.hop_length) * self.hop_length
+        gap = int(SEGMENT_MIN_GAP * sr)
+        segments = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            start, end = max(start - pad, 0), min(end + pad, n_samples)
+            if segments and start - segments[-1][1] < gap:
+                segments[-1][1] = end
+            else:
+                segments.append([start, end])
+        return [tuple(segment) for segment in segments]
+    
+    def _apply_shift(self, audio, sr, semitones=0.0, strength=0.0, retune_speed=0.05,
+                     key='C', scale='chromatic', detector='piptrack', analysis_rate=0,
+                     analysis=None, in_place=False):
+        """Static pitch shift plus auto-tune correction in one STFT/ISTFT pass
+
+        The pitch track is read from the input spectrum and moved by the static
+        shift before quantizing, so the correction targets notes of the shifted
+        voice exactly as if the two effects had run one after the other.
+        detector picks the pitch tracker: 'piptrack' reads it from the STFT,
+        'yin' runs YIN on the same frames. An analysis_rate below sr tracks
+        pitch on a copy resampled to that rate; the shift itself always runs
+        at sr. Multichannel audio is tracked once, on its mid signal, and every
+        channel gets the same shift. analysis, if given, is a dict that
+        memoizes the input's STFT and pitch track across calls on the same
+        audio; without it the shifted spectrum overwrites the STFT in place.
+        With in_place the output overwrites audio once it has been analysed.
+
+        With skip_silence, a take that is at most SEGMENT_MAX_COVERAGE voiced
+        is shifted segment by segment (_voiced_segments) and the silence
+        between them is passed through, so the cost follows the sung length.
+        """
         try:
-            if shift_semitones == 0:
-                return audio
-            
-            # Use librosa's phase vocoder for pitch shifting
-            shifted_audio = librosa.effects.pitch_shift(
-                y=audio, 
-                sr=sr, 
-                n_steps=shift_semitones,
-                bins_per_octave=12
-            )
-            return shifted_audio
+            memo = analysis if analysis is not None else {}
+            n_samples = audio.shape[-1]
+            if self.skip_silence:
+                if 'segments' not in memo:
+                    with metrics.stage('segment', n_samples, sr):
+                        memo['segments'] = self._voiced_segments(audio, sr)
+                segments = memo['segments']
+                if sum(end - start for start, end in segments) <= SEGMENT_MAX_COVERAGE * n_samples:
+                    settings = dict(semitones=semitones, strength=strength, retune_speed=retune_speed, key=key,
+                                    scale=scale, detector=detector, analysis_rate=analysis_rate)
+                    return self._shift_segments(audio, sr, segments, settings, analysis, in_place)
+            return self._shift_pass(audio, sr, semitones, strength, retune_speed, key, scale, detector,
+                                    analysis_rate, analysis, in_place)
         except Exception as e:
             logger.error(f"Pitch shift error: {e}")
             return audio
     
-    def _apply_autotune(self, audio, sr, strength=0.5):
+    def _shift_segments(self, audio, sr, segments, settings, analysis=None, in_place=False):
+        """_shift_pass over each (start, end) of audio, crossfaded back into the untouched silence
+
+        Each segment's output fades in over the first half of its leading
+        SEGMENT_PAD and out over the last half of its trailing one, where the
+        input is silence anyway; the segment's STFT edges fall in the same
+        stretch. Every segment's STFT and pitch track are memoized in
+        analysis under ('segment', start, end).
+        """
+        output = audio if in_place and audio.flags.writeable else audio.copy()
+        fade = max(1, int(SEGMENT_PAD * sr) // 2)
+        ramp = (0.5 - 0.5 * np.cos(np.pi * (np.arange(fade) + 0.5) / fade)).astype(np.float32)
+        for start, end in segments:
+            memo = None if analysis is None else analysis.setdefault(('segment', start, end), {})
+            piece = audio[..., start:end]
+            shifted = self._shift_pass(piece, sr, **settings, analysis=memo)
+            if shifted is piece:
+                continue
+            weight = np.ones(end - start, dtype=np.float32)
+            if start > 0:
+                weight[:fade] = ramp
+            if end < audio.shape[-1]:
+                weight[-fade:] = ramp[::-1]
+            # Read before output[..., start:end], which may be the same memory, is written
+            output[..., start:end] = piece + (shifted - piece) * weight
+        return output
+    
+    def _shift_pass(self, audio, sr, semitones=0.0, strength=0.0, retune_speed=0.05,
+                    key='C', scale='chromatic', detector='piptrack', analysis_rate=0,
+                    analysis=None, in_place=False):
+        """The STFT/ISTFT pass of _apply_shift over all of audio, with the same arguments"""
+        memo = analysis if analysis is not None else {}
+        n_samples = audio.shape[-1]
+        if 'stft' not in memo:
+            with metrics.stage('stft', n_samples, sr):
+                memo['stft'] = self._stft(audio)
+        stft = memo['stft']
+        shift = np.full(stft.shape[-1], float(semitones))
+        
+        if strength > 0:
+            analysis_rate = analysis_rate if 0 < analysis_rate < sr else 0
+            track_key = ('pitch_track', detector, analysis_rate)
+            if track_key not in memo:
+                with metrics.stage(detector, n_samples, sr):
+                    if analysis_rate:
+                        memo[track_key] = self._analysis_track(audio, sr, detector, analysis_rate)
+                    elif detector == 'yin':
+                        mid = audio if audio.ndim == 1 else audio.mean(axis=0)
+                        memo[track_key] = self._yin_track(mid, sr)[0]
+                    else:
+                        memo[track_key] = self._stft_pitch_track(stft, sr)
+            pitch_track = memo[track_key] * 2 ** (semitones / 12)
+            shift += self._correction_curve(pitch_track, sr, strength, retune_speed, key, scale)
+        
+        if not np.any(np.abs(shift) > 1e-3):
+            return audio
+        
+        with metrics.stage('pitch_shift', n_samples, sr):
+            # Frame chunks carry their phases over in state, exactly as
+            # block-wise rendering does; a chunk is read before it is overwritten
+            shifted = stft if analysis is None else np.empty_like(stft)
+            channels = [(shifted, stft)] if stft.ndim == 2 else list(zip(shifted, stft))
+            states = [{} for _ in channels]
+            for start in range(0, stft.shape[-1], self.chunk_frames):
+                end = start + self.chunk_frames
+                for (target, source), state in zip(channels, states):
+                    target[:, start:end] = self._shift_spectrum(source[:, start:end], shift[start:end], state)
+            in_place = in_place and audio.dtype == np.float32
+            shifted_audio = self._istft(shifted, n_samples, out=audio if in_place else None)
+        return shifted_audio.astype(audio.dtype, copy=False)
+    
+    def _apply_autotune(self, audio, sr, strength=0.5, retune_speed=0.05, key='C', scale='chromatic'):
         """Apply auto-tune effect to snap pitches to nearest notes"""
-        try:
-            if strength == 0:
-                return audio
-            
-            # Detect pitches
-            pitches = self._detect_pitch(audio, sr)
-            
-            if len(pitches) == 0:
-                return audio
-            
-            # Calculate hop length for STFT
-            hop_length = 512
-            n_frames = len(audio) // hop_length
-            
-            # Create pitch correction curve
-            corrected_audio = audio.copy()
-            
-            # Apply auto-tune frame by frame using phase vocoder
-            if len(pitches) > 0:
-                avg_pitch = np.mean(pitches[pitches > 0]) if np.any(pitches > 0) else 0
-                if avg_pitch > 0:
-                    target_pitch = self._find_nearest_note(avg_pitch)
-                    shift_ratio = target_pitch / avg_pitch
-                    shift_semitones = 12 * np.log2(shift_ratio) * strength
-                    
-                    corrected_audio = librosa.effects.pitch_shift(
-                        y=corrected_audio,
-                        sr=sr,
-                        n_steps=shift_semitones,
-                        bins_per_octave=12
-                    )
-            
-            return corrected_audio
-        except Exception as e:
-            logger.error(f"Auto-tune error: {e}")
+        if strength == 0:
             return audio
+        
+        return self._apply_shift(audio, sr, strength=strength, retune_speed=retune_speed,
+                                 key=key, scale=scale)
     
-    def _apply_reverb(self, audio, sr, amount=0.3, room_size=0.5):
-        """Apply reverb effect"""
+    def _reverb_kernel(self, sr, room_size):
+        """IR length, overlap-add block size, FFT size and cached IR spectrum for a room"""
+        room_size = round(float(np.clip(room_size, 0.0, 1.0)), 2)
+        ir_length = len(reverb_impulse_response(sr, room_size))
+        # Blocks about as long as the IR keep the overlap-add FFTs efficient
+        block_size = max(self.reverb_block_size, 1 << (ir_length - 1).bit_length())
+        fft_size, ir_spectrum = reverb_ir_spectrum(sr, room_size, block_size)
+        return ir_length, block_size, fft_size, ir_spectrum
+    
+    def _apply_reverb(self, audio, sr, amount=0.3, room_size=0.5, in_place=False, kernel=None):
+        """Apply reverb effect
+
+        Convolution reverb by FFT overlap-add against a synthetic room IR. IR
+        spectra are cached per (sample rate, room size, block size), so repeated
+        renders of a preset never regenerate or re-transform the IR. Each
+        block's tail is carried into the next instead of being added ahead, so
+        a block is always read before it is written: with in_place the result
+        overwrites audio, otherwise one copy is the only full-length allocation.
+        All channels of (channels, samples) audio are convolved in one FFT.
+        kernel, if given, is what _reverb_kernel returns for sr and room_size.
+        """
         try:
             if amount == 0:
                 return audio
             
-            # Simple reverb using multiple delayed copies
-            delay_samples = int(0.03 * sr)  # 30ms delay
-            reverb_audio = audio.copy()
+            ir_length, block_size, fft_size, ir_spectrum = kernel or self._reverb_kernel(sr, room_size)
             
-            # Add multiple delayed and attenuated copies
-            for i in range(1, 6):
-                delay = delay_samples * i
-                attenuation = (0.6 ** i) * amount
-                
-                if delay < len(audio):
-                    delayed = np.zeros_like(audio)
-                    delayed[delay:] = audio[:-delay] * attenuation
-                    reverb_audio += delayed
+            reverb_audio = audio if in_place else audio.copy()
+            tail = np.zeros(audio.shape[:-1] + (ir_length - 1,), dtype=reverb_audio.dtype)
+            for start in range(0, reverb_audio.shape[-1], block_size):
+                block = reverb_audio[..., start:start + block_size]
+                length = block.shape[-1]
+                wet = scipy.fft.irfft(scipy.fft.rfft(block, fft_size) * ir_spectrum, fft_size)
+                wet = wet[..., :length + ir_length - 1]
+                wet *= amount
+                wet[..., :ir_length - 1] += tail
+                block += wet[..., :length]
+                tail = wet[..., length:]
             
             # Normalize to prevent clipping
-            max_val = np.max(np.abs(reverb_audio))
+            max_val = max(reverb_audio.max(), -reverb_audio.min())
             if max_val > 1.0:
-                reverb_audio = reverb_audio / max_val
+                reverb_audio /= max_val
             
             return reverb_audio
         except Exception as e:
             logger.error(f"Reverb error: {e}")
             return audio
     
-    def _apply_delay(self, audio, sr, delay_time=0.15, feedback=0.3, wet=0.2):
-        """Apply delay effect"""
+    def _feedback_chunks(self, audio, history, feedback):
+        """Yield (start, piece) of the feedback line s[n] = x[n] + feedback * s[n - D]
+
+        history holds the previous D samples of the line (zeros for a fresh
+        start). The line only couples samples exactly D apart, so whole rows of
+        D samples are viewed as a (rows, D) array without copying and the
+        recursion runs as a first-order IIR down each column, about work_size
+        samples at a time. Pieces are whole rows except a shorter last one, and
+        are fresh arrays in audio's dtype. (channels, samples) audio takes a
+        (channels, D) history and runs every channel in the same call.
+        """
+        delay_samples = history.shape[-1]
+        n_samples = audio.shape[-1]
+        channels = audio.shape[:-1]
+        b = np.ones(1, dtype=audio.dtype)
+        a = np.array([1.0, -feedback], dtype=audio.dtype)
+        state = (feedback * history).astype(audio.dtype)[..., None, :]
+        
+        step = max(1, self.work_size // delay_samples) * delay_samples
+        whole = n_samples - n_samples % delay_samples
+        for start in range(0, whole, step):
+            stop = min(start + step, whole)
+            rows, state = lfilter(b, a, audio[..., start:stop].reshape(channels + (-1, delay_samples)),
+                                  axis=-2, zi=state)
+            yield start, rows.reshape(channels + (-1,))
+        if whole < n_samples:
+            # The state is feedback times the last row of the line
+            yield whole, audio[..., whole:] + state[..., 0, :n_samples - whole]
+    
+    def _feedback_delay(self, audio, history, feedback):
+        """Run the feedback line s[n] = x[n] + feedback * s[n - D] over audio
+
+        history holds the previous D samples of the line (zeros for a fresh
+        start). Returns the line delayed by D samples (aligned with audio) and
+        the new history.
+        """
+        delay_samples = len(history)
+        n_samples = len(audio)
+        
+        pieces = [piece for _, piece in self._feedback_chunks(audio, history, feedback)]
+        line = pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+        
+        delayed = np.empty(n_samples, dtype=line.dtype)
+        head = min(delay_samples, n_samples)
+        delayed[:head] = history[:head]
+        delayed[head:] = line[:n_samples - head]
+        
+        if n_samples >= delay_samples:
+            history = line[n_samples - delay_samples:]
+        else:
+            history = np.concatenate([history[n_samples:], line])
+        return delayed, history
+    
+    def _apply_delay(self, audio, sr, delay_time=0.15, feedback=0.3, wet=0.2, in_place=False):
+        """Apply delay effect
+
+        The output taps the feedback line D samples late:
+        y[n] = x[n] + wet * s[n - D]. The line is worked out a chunk at a time
+        and each chunk only writes output samples already read, so with
+        in_place the result is written back into audio instead of a copy.
+        """
         try:
             if wet == 0:
                 return audio
             
             delay_samples = int(delay_time * sr)
-            delay_audio = audio.copy()
-            
-            # Create delay buffer
-            delay_buffer = np.zeros(delay_samples)
-            output = np.zeros_like(audio)
+            if delay_samples <= 0 or delay_samples >= audio.shape[-1]:
+                return audio
             
-            for i in range(len(audio)):
-                # Current sample plus delayed signal
-                delayed_sample = delay_buffer[0]
-                output[i] = audio[i] + delayed_sample * wet
-                
-                # Update delay buffer with feedback
-                delay_buffer[1:] = delay_buffer[:-1]
-                delay_buffer[0] = audio[i] + delayed_sample * feedback
+            output = audio if in_place else audio.copy()
+            # wet * s over the D samples before the current piece
+            history = np.zeros(audio.shape[:-1] + (delay_samples,), dtype=audio.dtype)
+            previous = history
+            for start, piece in self._feedback_chunks(audio, history, feedback):
+                piece *= wet
+                length = piece.shape[-1]
+                head = min(delay_samples, length)
+                output[..., start:start + head] += previous[..., :head]
+                if length > delay_samples:
+                    output[..., start + delay_samples:start + length] += piece[..., :length - delay_samples]
+                previous = piece[..., length - delay_samples:]
             
             return output
         except Exception as e:
             logger.error(f"Delay error: {e}")
             return audio
     
-    def process_audio(self, audio_data, sr, effects):
-        """Main audio processing function"""
+    def _apply_mix(self, audio, sr, instrumental, gain=0.3, offset=0.0, in_place=False):
+        """Add an instrumental from self.beats under audio
+
+        offset is where in the beat the take starts, in seconds; a negative
+        offset brings the beat in that far into the take. The beat is read
+        from its memory map work_size samples at a time. A mono take over a
+        multichannel beat comes out with the beat's channels, a beat whose
+        channels don't match a multichannel take is mixed down to mono first,
+        and the mix is scaled down only if it would clip.
+        """
         try:
-            processed_audio = audio_data.copy()
+            beat = self.beats.pcm(instrumental, sr)
+            n_samples = audio.shape[-1]
+            channels = audio.shape[:-1] if audio.ndim == 2 else beat.shape[:-1]
+            if in_place and audio.shape[:-1] == channels:
+                mixed = audio
+            else:
+                mixed = np.empty(channels + (n_samples,), dtype=np.float32)
+                mixed[...] = audio
             
-            # Apply pitch shift
-            if effects.get('pitch_shift', 0) != 0:
-                processed_audio = self._apply_pitch_shift(
-                    processed_audio, sr, effects['pitch_shift']
-                )
+            start = int(round(offset * sr))
+            for begin in range(max(0, -start), min(n_samples, beat.shape[-1] - start), self.work_size):
+                end = min(begin + self.work_size, n_samples, beat.shape[-1] - start)
+                piece = beat[..., start + begin:start + end]
+                if piece.ndim == 2 and piece.shape[:-1] != channels:
+                    piece = piece.mean(axis=0)
+                mixed[..., begin:end] += gain * piece
             
-            # Apply auto-tune
-            if effects.get('autotune_strength', 0) > 0:
-                processed_audio = self._apply_autotune(
-                    processed_audio, sr, effects['autotune_strength'] / 100.0
-                )
+            max_val = max(mixed.max(), -mixed.min())
+            if max_val > 1.0:
+                mixed *= 0.95 / max_val
+            return mixed
+        except Exception as e:
+            logger.error(f"Mix error: {e}")
+            return audio
+    
+    def _plan_chain(self, effects):
+        """Resolve an effects dict into the stages that will change the audio
+
+        Static pitch shift and auto-tune collapse into a single 'shift' stage;
+        stages whose settings are no-ops are left out entirely. An
+        'instrumental' adds a final 'mix' stage, and key_lock replaces key and
+        scale with the instrumental's detected key. quality='preview' adds a
+        'preview' entry with the window of the take to render. A 'preset' name
+        stands for that preset's effects, which the other settings override;
+        on its own it returns the preset's compiled plan.
+        """
+        name = effects.get('preset')
+        if name is not None:
+            if self.presets is None or not self.presets.exists(name):
+                raise ValueError(f"Unknown preset '{name}'")
+            if len(effects) == 1:
+                return self._preset_chain(name)[0]
+            effects = {**self.presets.effects(name), **effects}
+        for setting in NUMERIC_SETTINGS:
+            value = effects.get(setting)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValueError(f"'{setting}' must be a number")
+        
+        plan = {}
+        
+        semitones = effects.get('pitch_shift', 0)
+        strength = effects.get('autotune_strength', 0) / 100.0
+        if semitones != 0 or strength > 0:
+            plan['shift'] = {
+                'semitones': semitones,
+                'strength': max(strength, 0.0),
+                'retune_speed': effects.get('retune_speed', 50) / 1000.0,  # Convert ms to seconds
+                'key': effects.get('key', 'C'),
+                'scale': effects.get('scale', 'chromatic'),
+                'detector': effects.get('pitch_detector', 'piptrack'),
+                'analysis_rate': int(effects.get('analysis_rate') or 0),
+            }
+            if plan['shift']['detector'] not in PITCH_DETECTORS:
+                raise ValueError(f"Unknown pitch detector '{plan['shift']['detector']}'")
+        key = effects.get('key', 'C')
+        if not isinstance(key, str) or FLAT_NAMES.get(key.upper(), key.upper()) not in NOTE_NAMES:
+            raise ValueError(f"Unknown key '{key}'")
+        if effects.get('scale', 'chromatic') not in SCALES:
+            raise ValueError(f"Unknown scale '{effects['scale']}'")
+        
+        if effects.get('reverb_amount', 0) > 0:
+            plan['reverb'] = {
+                'amount': effects['reverb_amount'] / 100.0,
+                'room_size': effects.get('room_size', 50) / 100.0,
+            }
+        
+        if effects.get('delay_time', 0) > 0:
+            plan['delay'] = {
+                'delay_time': effects['delay_time'] / 1000.0,  # Convert ms to seconds
+                'feedback': 0.3,
+                'wet': 0.3,
+            }
+        
+        instrumental = effects.get('instrumental')
+        if instrumental:
+            if self.beats is None or not self.beats.exists(instrumental):
+                raise ValueError(f"Unknown instrumental '{instrumental}'")
+            plan['mix'] = {
+                'instrumental': instrumental,
+                'gain': effects.get('instrumental_gain', 30) / 100.0,
+                'offset': effects.get('instrumental_offset', 0) / 1000.0,  # Convert ms to seconds
+            }
+            if effects.get('key_lock') and 'shift' in plan:
+                plan['shift']['key'], plan['shift']['scale'] = self.beats.key(instrumental)
+        elif effects.get('key_lock'):
+            raise ValueError("key_lock needs an instrumental")
+        
+        quality = effects.get('quality', 'final')
+        if quality not in QUALITY_TIERS:
+            raise ValueError(f"Unknown quality '{quality}'")
+        if quality == 'preview':
+            plan['preview'] = {
+                'start': effects.get('preview_start', 0) / 1000.0,  # Convert ms to seconds
+                'duration': effects.get('preview_duration', 0) / 1000.0,
+            }
+            if plan['preview']['start'] < 0:
+                raise ValueError("preview_start can't be negative")
+        
+        return plan
+    
+    def _preset_chain(self, name, sr=None):
+        """A registered preset compiled for sr: its plan and the stage kernels it needs
+
+        Compiled once per preset and sample rate, and again only after the
+        registry changes, so a render that names a preset does no planning
+        and no kernel lookups. The reverb kernel is held here, out of reach of
+        the IR caches' eviction; the scale table is built ahead of the first
+        render. sr None compiles the plan alone.
+        """
+        version = self.presets.version()
+        if version != self._preset_version:
+            self._preset_chains.clear()
+            self._preset_version = version
+        chain = self._preset_chains.get((name, sr))
+        if chain is None:
+            plan = self._plan_chain(self.presets.effects(name))
+            kernels = {}
+            if 'shift' in plan:
+                self._scale_table(plan['shift']['key'], plan['shift']['scale'])
+            if sr is not None and 'reverb' in plan:
+                kernels['reverb'] = self._reverb_kernel(sr, plan['reverb']['room_size'])
+            chain = self._preset_chains[name, sr] = (plan, kernels)
+        return chain
+    
+    def output_rate(self, sr, effects):
+        """Sample rate of what process_audio returns for audio at sr"""
+        return min(sr, PREVIEW_SAMPLE_RATE) if effects.get('quality') == 'preview' else sr
+    
+    def _render_preview(self, audio, sr, effects, start, duration, progress=None, analysis=None):
+        """quality='preview': the chain on a window of the take, resampled to PREVIEW_SAMPLE_RATE
+
+        The window starts start seconds in and lasts duration seconds, or runs
+        to the end for a duration of 0. It renders on a processor with the
+        short PREVIEW_N_FFT STFT, so the output is at output_rate(sr). With
+        analysis, the resampled window and its memo are kept under 'preview'
+        until a render asks for a different window.
+        """
+        if 'preset' in effects:
+            # Expanded here: the previewer compiles no presets of its own
+            effects = {**self.presets.effects(effects['preset']), **effects}
+            del effects['preset']
+        first = min(int(start * sr), audio.shape[-1])
+        last = audio.shape[-1] if duration <= 0 else min(first + int(duration * sr), audio.shape[-1])
+        rate = min(sr, PREVIEW_SAMPLE_RATE)
+        memo = analysis.get('preview') if analysis is not None else None
+        if memo is None or memo['window'] != (first, last, rate):
+            window = np.asarray(audio[..., first:last], dtype=self.dtype)
+            if rate != sr:
+                with metrics.stage('resample', window.shape[-1], sr):
+                    window = librosa.resample(window, orig_sr=sr, target_sr=rate, res_type='soxr_qq')
+            memo = {'window': (first, last, rate), 'audio': window, 'analysis': {}}
+            if analysis is not None:
+                analysis['preview'] = memo
+        
+        final_effects = {name: value for name, value in effects.items()
+                         if name not in ('quality', 'preview_start', 'preview_duration')}
+        if final_effects.get('instrumental'):
+            # The beat lines up with the window's place in the take
+            final_effects['instrumental_offset'] = effects.get('instrumental_offset', 0) + first / sr * 1000
+        if self._previewer is None:
+            self._previewer = AutoTuneProcessor(PREVIEW_N_FFT, PREVIEW_HOP_LENGTH)
+        self._previewer.beats = self.beats
+        return self._previewer.process_audio(memo['audio'], rate, final_effects, progress,
+                                             memo['analysis'] if analysis is not None else None)
+    
+    def process_audio(self, audio_data, sr, effects, progress=None, analysis=None):
+        """Main audio processing function
+
+        progress, if given, is called with the fraction of the chain's stages
+        done after each one. analysis, if given, is a dict kept alongside
+        audio_data across calls: it memoizes the STFT, the pitch track and the
+        output of the shift stage, so renders that only change reverb or
+        delay skip all frequency-domain work. A preview (quality='preview')
+        comes back at output_rate(sr). Raises ValueError for effects that
+        _plan_chain rejects.
+        """
+        if len(effects) == 1 and 'preset' in effects and self.presets is not None:
+            if not self.presets.exists(effects['preset']):
+                raise ValueError(f"Unknown preset '{effects['preset']}'")
+            plan, kernels = self._preset_chain(effects['preset'], sr)
+        else:
+            plan, kernels = self._plan_chain(effects), {}
+        try:
+            if 'preview' in plan:
+                return self._render_preview(audio_data, sr, effects, **plan['preview'],
+                                            progress=progress, analysis=analysis)
+            processed_audio = np.asarray(audio_data, dtype=self.dtype)
+            # Whether processed_audio is a buffer this call may overwrite;
+            # converting the dtype already made a private copy, while a
+            # memory-mapped input comes back as a read-only view of the map
+            owned = processed_audio.flags.writeable and not np.may_share_memory(processed_audio, audio_data)
+            stages_done = 0
             
-            # Apply reverb
-            if effects.get('reverb_amount', 0) > 0:
-                processed_audio = self._apply_reverb(
-                    processed_audio, sr, effects['reverb_amount'] / 100.0
-                )
+            # Apply pitch shift and auto-tune in one frequency-domain pass
+            if 'shift' in plan:
+                shift_key = tuple(sorted(plan['shift'].items()))
+                if analysis is not None and analysis.get('shifted', (None,))[0] == shift_key:
+                    processed_audio = analysis['shifted'][1]
+                    owned = False
+                else:
+                    shifted_audio = self._apply_shift(processed_audio, sr, **plan['shift'], analysis=analysis,
+                                                      in_place=owned)
+                    if analysis is not None:
+                        analysis['shifted'] = (shift_key, shifted_audio)
+                        owned = False
+                    else:
+                        owned = owned or shifted_audio is not processed_audio
+                    processed_audio = shifted_audio
+                stages_done += 1
+                if progress:
+                    progress(stages_done / len(plan))
             
-            # Apply delay
-            if effects.get('delay_time', 0) > 0:
-                processed_audio = self._apply_delay(
-                    processed_audio, sr, 
-                    effects['delay_time'] / 1000.0,  # Convert ms to seconds
-                    feedback=0.3,
-                    wet=0.3
-                )
+            # Apply reverb, in place once the chain owns the buffer
+            if 'reverb' in plan:
+                with metrics.stage('reverb', processed_audio.shape[-1], sr):
+                    reverb_audio = self._apply_reverb(processed_audio, sr, **plan['reverb'], in_place=owned,
+                                                      kernel=kernels.get('reverb'))
+                owned = owned or reverb_audio is not processed_audio
+                processed_audio = reverb_audio
+                stages_done += 1
+                if progress:
+                    progress(stages_done / len(plan))
+            
+            # Apply delay, in place once the chain owns the buffer
+            if 'delay' in plan:
+                with metrics.stage('delay', processed_audio.shape[-1], sr):
+                    delay_audio = self._apply_delay(
+                        processed_audio, sr, **plan['delay'],
+                        in_place=owned
+                    )
+                owned = owned or delay_audio is not processed_audio
+                processed_audio = delay_audio
+                stages_done += 1
+                if progress:
+                    progress(stages_done / len(plan))
             
             # Normalize the final output
-            max_val = np.max(np.abs(processed_audio))
+            max_val = max(processed_audio.max(), -processed_audio.min())
             if max_val > 0:
-                processed_audio = processed_audio / max_val * 0.95  # Prevent clipping
+                if not owned:
+                    processed_audio = processed_audio * (0.95 / max_val)
+                    owned = True
+                else:
+                    processed_audio *= 0.95 / max_val  # Prevent clipping
+            
+            # Mix the tuned vocal over the instrumental
+            if 'mix' in plan:
+                with metrics.stage('mix', processed_audio.shape[-1], sr):
+                    processed_audio = self._apply_mix(processed_audio, sr, **plan['mix'], in_place=owned)
+                if progress:
+                    progress(1.0)
             
             return processed_audio
         except Exception as e:
             logger.error(f"Audio processing error: {e}")
             return audio_data
+    
+    def warmup(self, sr=WARMUP_SAMPLE_RATE, seconds=0.5):
+        """Render a short synthetic take through every stage and return the seconds it took
+
+        The first piptrack, stft, resample and chroma calls load librosa's
+        submodules and compile its numba kernels, which takes seconds; doing
+        that here keeps it off the first request. Both pitch detectors, a
+        lower analysis rate, reverb, delay, a stereo take, the realtime path,
+        key detection and the WAV round trip each run once. The mix stage is
+        plain numpy over a beat read from disk and is left out. Nothing is
+        recorded in the metrics.
+        """
+        start = time.perf_counter()
+        t = np.arange(int(sr * seconds)) / sr
+        take = (0.3 * np.sin(2 * np.pi * 220 * t + 2 * np.sin(2 * np.pi * 5 * t))).astype(self.dtype)
+        chain = {'autotune_strength': 80, 'reverb_amount': 30, 'delay_time': 100}
+        with metrics.muted():
+            for effects in ({**chain, 'pitch_detector': 'piptrack'},
+                            {**chain, 'pitch_detector': 'yin', 'pitch_shift': 2},
+                            {**chain, 'analysis_rate': sr // 2}):
+                self.process_audio(take, sr, effects)
+            self.process_audio(np.stack([take, take]), sr, chain)
+            
+            live = AutoTuneRealtime(self, sr, chain)
+            for first in range(0, len(take) - live.frame_size + 1, live.frame_size):
+                live.process(take[first:first + live.frame_size])
+            
+            detect_key(take, sr)
+            decode_audio(encode_wav(take, sr), '.wav')
+        return time.perf_counter() - start
+
+class AutoTuneStream:
+    """Block-by-block rendering of AutoTuneProcessor.process_audio
+
+    Feed blocks of any size to process() and call flush() once at the end;
+    the concatenated output is exactly as long as the input. State carried
+    from block to block: the STFT framing, overlap-add buffer and phases of
+    the pitch shifter, the retune glide, the reverb tail and the delay line.
+    The whole take is never in memory, so the final peak normalization of
+    process_audio is replaced by a running peak limiter. Output is the mono
+    vocal: an instrumental in the effects sets key_lock's key but is not
+    mixed in. Streams always render at final quality.
+    """
+    
+    def __init__(self, processor, sr, effects, limit=True):
+        self.processor = processor
+        self.sr = sr
+        self.plan = processor._plan_chain(effects)
+        self.limit = limit
+        self.samples_in = 0
+        self.samples_out = 0
+        self._gain = 1.0
+        
+        n_fft, hop_length = processor.n_fft, processor.hop_length
+        if 'shift' in self.plan:
+            self._window = hann_window(n_fft)
+            # Centered framing like librosa.stft: n_fft // 2 zeros in front
+            self._frame_buffer = np.zeros(n_fft // 2, dtype=np.float32)
+            self._overlap = np.zeros(n_fft - hop_length, dtype=np.float32)
+            self._overlap_norm = np.zeros(n_fft - hop_length, dtype=np.float32)
+            self._trim = n_fft // 2
+            self._shift_state = {}
+        
+        if 'reverb' in self.plan:
+            self._reverb = processor._reverb_kernel(sr, self.plan['reverb']['room_size'])
+            self._reverb_tail = np.zeros(self._reverb[0] - 1, dtype=np.float32)
+        
+        if 'delay' in self.plan:
+            self._delay_history = np.zeros(int(self.plan['delay']['delay_time'] * sr), dtype=np.float32)
+    
+    def _shift(self, block, final=False):
+        """Pitch shift / auto-tune the frames completed by this block"""
+        processor = self.processor
+        n_fft, hop_length = processor.n_fft, processor.hop_length
+        buffer = np.concatenate([self._frame_buffer, block])
+        if final:
+            buffer = np.concatenate([buffer, np.zeros(n_fft // 2, dtype=np.float32)])
+        
+        n_frames = 1 + (len(buffer) - n_fft) // hop_length if len(buffer) >= n_fft else 0
+        overlap = len(self._overlap)
+        output = np.zeros(n_frames * hop_length + overlap, dtype=np.float32)
+        norm = np.zeros_like(output)
+        output[:overlap] = self._overlap
+        norm[:overlap] = self._overlap_norm
+        
+        if n_frames > 0:
+            frames = np.lib.stride_tricks.sliding_window_view(buffer, n_fft)[::hop_length][:n_frames]
+            stft = scipy.fft.rfft(frames * self._window, axis=1).T
+            
+            settings = self.plan['shift']
+            shift = np.full(n_frames, float(settings['semitones']))
+            if settings['strength'] > 0:
+                if settings['detector'] == 'yin':
+                    pitch_track = processor._yin(frames, self.sr)[0]
+                else:
+                    pitch_track = processor._pitch_track(np.abs(stft), self.sr)
+                pitch_track = pitch_track * 2 ** (settings['semitones'] / 12)
+                shift += processor._correction_curve(
+                    pitch_track, self.sr, settings['strength'], settings['retune_speed'],
+                    settings['key'], settings['scale'], state=self._shift_state
+                )
+            
+            frames = scipy.fft.irfft(processor._shift_spectrum(stft, shift, state=self._shift_state),
+                                     n_fft, axis=0).T
+            frames *= self._window
+            window_square = self._window ** 2
+            # Overlap-add: with hop dividing n_fft, each hop-sized slice of a frame is one strided add
+            for offset in range(0, n_fft, hop_length):
+                end = offset + n_frames * hop_length
+                output[offset:end] += frames[:, offset:offset + hop_length].ravel()
+                norm[offset:end] += np.tile(window_square[offset:offset + hop_length], n_frames)
+            self._frame_buffer = buffer[n_frames * hop_length:]
+        else:
+            self._frame_buffer = buffer
+        
+        ready = len(output) if final else n_frames * hop_length
+        self._overlap = output[ready:]
+        self._overlap_norm = norm[ready:]
+        output = output[:ready]
+        norm = norm[:ready]
+        nonzero = norm > np.finfo(np.float32).tiny
+        output[nonzero] /= norm[nonzero]
+        
+        if self._trim:
+            trimmed = min(self._trim, len(output))
+            output = output[trimmed:]
+            self._trim -= trimmed
+        return output
+    
+    def _reverb_block(self, block):
+        """Convolve with the room IR, carrying the tail into the next block"""
+        ir_length, block_size, fft_size, ir_spectrum = self._reverb
+        amount = self.plan['reverb']['amount']
+        output = block.astype(np.float32, copy=True)
+        
+        for start in range(0, len(block), block_size):
+            piece = block[start:start + block_size]
+            wet = scipy.fft.irfft(scipy.fft.rfft(piece, fft_size) * ir_spectrum, fft_size)
+            wet = wet[:len(piece) + ir_length - 1]
+            wet[:ir_length - 1] += self._reverb_tail
+            output[start:start + len(piece)] += amount * wet[:len(piece)]
+            self._reverb_tail = wet[len(piece):].astype(np.float32)
+        return output
+    
+    def _delay_block(self, block):
+        """Feedback delay continuing the line from the previous block"""
+        settings = self.plan['delay']
+        if len(self._delay_history) == 0:
+            return block
+        delayed, self._delay_history = self.processor._feedback_delay(
+            block, self._delay_history, settings['feedback']
+        )
+        delayed *= settings['wet']
+        block += delayed
+        return block
+    
+    def _render(self, block, final=False):
+        if 'shift' in self.plan:
+            block = self._shift(block, final)
+        else:
+            block = block.copy()
+        if len(block) and 'reverb' in self.plan:
+            block = self._reverb_block(block)
+        if len(block) and 'delay' in self.plan:
+            block = self._delay_block(block)
+        
+        if final:
+            # Centered framing can leave a few samples over; never more or less than the input
+            block = np.concatenate([block, np.zeros(max(0, self.samples_in - self.samples_out - len(block)),
+                                                    dtype=np.float32)])
+            block = block[:self.samples_in - self.samples_out]
+        self.samples_out += len(block)
+        
+        if self.limit and len(block):
+            peak = np.max(np.abs(block))
+            if peak * self._gain > 0.95:
+                self._gain = 0.95 / peak
+            block *= self._gain
+        return block
+    
+    def process(self, block):
+        """Render one block of mono samples; returns whatever output is ready"""
+        block = np.asarray(block, dtype=np.float32)
+        self.samples_in += len(block)
+        return self._render(block)
+    
+    def flush(self):
+        """Render everything still buffered; call once after the last block"""
+        return self._render(np.zeros(0, dtype=np.float32), final=True)
+
+class AutoTuneRealtime:
+    """Fixed-latency, frame-in frame-out rendering for live input
+
+    Every process() call takes frame_size samples and returns exactly
+    frame_size samples, delayed by a constant latency. The pitch shifter is
+    an AutoTuneStream whose uneven output goes through a FIFO primed with
+    latency zeros; pass a processor with a short STFT (REALTIME_N_FFT) to
+    keep that small. Reverb and delay are linear and time-invariant, so they
+    run after the FIFO on whole frames: the reverb as uniformly partitioned
+    convolution with partitions of one frame, which adds no latency and
+    costs two frame-sized FFTs per frame however long the room.
+    """
+    
+    def __init__(self, processor, sr, effects, frame_size=REALTIME_FRAME_SIZE, limit=True):
+        self.processor = processor
+        self.sr = sr
+        self.frame_size = frame_size
+        self.plan = processor._plan_chain(effects)
+        self.limit = limit
+        self._gain = 1.0
+        
+        self._shifter = None
+        self.latency = 0
+        if 'shift' in self.plan:
+            self._shifter = AutoTuneStream(processor, sr, {**effects, 'reverb_amount': 0, 'delay_time': 0},
+                                           limit=False)
+            # Centered framing holds back at most n_fft - 1 samples
+            self.latency = processor.n_fft - 1
+            self._fifo = np.zeros(self.latency, dtype=np.float32)
+        
+        if 'reverb' in self.plan:
+            room_size = round(float(np.clip(self.plan['reverb']['room_size'], 0.0, 1.0)), 2)
+            self._partitions = reverb_ir_partitions(sr, room_size, frame_size)
+            # Frequency-domain delay line: spectra of the last len(partitions) input frames
+            self._spectra = np.zeros_like(self._partitions)
+            self._newest = 0
+            self._previous_frame = np.zeros(frame_size, dtype=np.float32)
+        
+        if 'delay' in self.plan:
+            self._delay_history = np.zeros(int(self.plan['delay']['delay_time'] * sr), dtype=np.float32)
+    
+    @property
+    def latency_ms(self):
+        """Algorithmic latency: one frame of buffering plus the shifter's delay"""
+        return (self.frame_size + self.latency) / self.sr * 1000
+    
+    def _reverb_frame(self, frame):
+        """Uniformly partitioned overlap-save convolution of one frame"""
+        n_partitions = len(self._partitions)
+        self._newest = (self._newest + 1) % n_partitions
+        self._spectra[self._newest] = scipy.fft.rfft(np.concatenate([self._previous_frame, frame]))
+        self._previous_frame = frame
+        # Partition k of the IR meets the input frame from k frames ago
+        ages = (self._newest - np.arange(n_partitions)) % n_partitions
+        wet_spectrum = np.einsum('kf,kf->f', self._spectra[ages], self._partitions)
+        wet = scipy.fft.irfft(wet_spectrum, 2 * self.frame_size)[self.frame_size:]
+        return frame + self.plan['reverb']['amount'] * wet.astype(np.float32)
+    
+    def process(self, frame):
+        """Render one frame of frame_size mono samples; returns frame_size samples"""
+        frame = np.asarray(frame, dtype=np.float32)
+        if len(frame) != self.frame_size:
+            raise ValueError(f"Expected {self.frame_size} samples, got {len(frame)}")
+        
+        if self._shifter is not None:
+            self._fifo = np.concatenate([self._fifo, self._shifter.process(frame)])
+            frame, self._fifo = self._fifo[:self.frame_size], self._fifo[self.frame_size:]
+            if len(frame) < self.frame_size:
+                frame = np.concatenate([np.zeros(self.frame_size - len(frame), dtype=np.float32), frame])
+        else:
+            frame = frame.copy()
+        
+        if 'reverb' in self.plan:
+            frame = self._reverb_frame(frame)
+        
+        if 'delay' in self.plan and len(self._delay_history):
+            delayed, self._delay_history = self.processor._feedback_delay(
+                frame, self._delay_history, self.plan['delay']['feedback']
+            )
+            frame += self.plan['delay']['wet'] * delayed
+        
+        if self.limit:
+            peak = np.max(np.abs(frame))
+            if peak * self._gain > 0.95:
+                self._gain = 0.95 / peak
+            frame *= self._gain
+        return frame
+
+class ResultCache:
+    """Content-addressed store of rendered WAV files
+
+    Entries are keyed by the SHA-256 of the input file, the effects chain it
+    resolves to and the output sample rate, so a re-render of the same take
+    with the same settings never reaches the processor. Two tiers: an LRU in
+    memory bounded by memory_budget bytes and, if folder is given, WAV files
+    there bounded by disk_budget bytes with the least recently used evicted
+    first. Memory misses that hit the disk are promoted back into memory.
+    The folder is its own index, so every process sharing it keeps it to one
+    disk_budget between them; file I/O never runs under the lock.
+    """
+    
+    def __init__(self, memory_budget, folder=None, disk_budget=0):
+        self.memory_budget = memory_budget
+        self.folder = folder if disk_budget > 0 else None
+        self.disk_budget = disk_budget
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # Size of the disk tier as of the last eviction pass
+        self._disk_entries = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        
+        if self.folder:
+            # Trim what earlier runs left behind
+            self._evict_disk()
+    
+    @staticmethod
+    def key(audio_bytes, plan, sr=None):
+        """Cache key for an input file, a resolved effects chain and an output rate
+
+        plan is what AutoTuneProcessor._plan_chain returns, so effects that
+        resolve to the same chain (2 vs 2.0, a zero delay_time with any
+        feedback...) share an entry. sr None means the input's own rate.
+        """
+        def canonical(value):
+            if isinstance(value, dict):
+                return {name: canonical(item) for name, item in value.items()}
+            if isinstance(value, (int, float)):
+                return round(float(value), 6)
+            return value
+        
+        digest = hashlib.sha256(audio_bytes)
+        digest.update(json.dumps([canonical(plan), sr, RESULT_CACHE_VERSION], sort_keys=True).encode())
+        return digest.hexdigest()
+    
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}.wav")
+    
+    def path(self, key):
+        """File of a cached render in the disk tier, or None"""
+        if self.folder is None or not os.path.exists(self._path(key)):
+            return None
+        return self._path(key)
+    
+    @staticmethod
+    def _touch(path):
+        """Mark a file as just used: the disk tier is ordered by mtime, set here at full resolution"""
+        now = time.time_ns()
+        try:
+            os.utime(path, ns=(now, now))
+        except OSError:
+            pass  # Evicted by another process meanwhile
+    
+    def _remember(self, key, data):
+        """Put data in the memory tier; caller holds the lock"""
+        if len(data) > self.memory_budget:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_budget:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+    
+    def _evict_disk(self):
+        """Delete the least recently used files until the folder's actual size fits the disk budget"""
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith('.wav') and len(entry.name) == 64 + 4:  # SHA-256 hex digest + .wav
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        kept = len(entries)
+        for _, size, path in entries:
+            if total <= self.disk_budget:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass  # Another process evicted it first
+            total -= size
+            kept -= 1
+        with self._lock:
+            self._disk_entries, self._disk_bytes = kept, total
+    
+    def get(self, key):
+        """The cached WAV bytes for key, or None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+        if data is not None:
+            if self.folder:
+                self._touch(self._path(key))
+            return data
+        
+        if self.folder:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                pass
+            else:
+                self._touch(self._path(key))
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self._remember(key, data)
+            self.hits += 1
+            self.disk_hits += 1
+            return data
+    
+    def put(self, key, data):
+        """Store rendered WAV bytes under key in both tiers"""
+        with self._lock:
+            self._remember(key, data)
+        if not self.folder or len(data) > self.disk_budget:
+            return
+        if os.path.exists(self._path(key)):
+            self._touch(self._path(key))
+            return
+        # Write then rename so a crash never leaves a truncated entry; the
+        # temporary name is per thread, so concurrent writers never share one
+        temp_path = f"{self._path(key)}.{os.getpid()}-{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self._path(key))
+        except OSError as e:
+            logger.error(f"Result cache write error: {e}")
+            return
+        self._touch(self._path(key))
+        self._evict_disk()
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": self._disk_entries,
+                "disk_bytes": self._disk_bytes,
+            }
+
+class AnalysisSession:
+    """A decoded take plus everything renders of it have computed so far
+
+    analysis is the memo dict process_audio fills in: the STFT, the pitch
+    track of each detector used and the output of the last shift stage.
+    """
+    
+    def __init__(self, audio, sr):
+        self.audio = audio
+        self.sr = sr
+        self.analysis = {}
+        # One render at a time, so the memo is never filled twice concurrently
+        self.lock = threading.Lock()
+        self._nbytes = 0
+        self.measure()
+    
+    def measure(self):
+        """Re-count the memory held after a render has grown the memo; caller holds lock"""
+        audio_bytes = 0 if isinstance(self.audio, np.memmap) else self.audio.nbytes
+        self._nbytes = audio_bytes + _memo_nbytes(self.analysis)
+    
+    def nbytes(self):
+        """Private memory held as of the last measure(), readable without the lock
+
+        Audio mapped from the upload store lives in the page cache and isn't counted.
+        """
+        return self._nbytes
+
+def _memo_nbytes(value):
+    """Bytes of the arrays in a process_audio memo, through nested dicts and tuples"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        value = value.values()
+    elif not isinstance(value, tuple):
+        return 0
+    return sum(_memo_nbytes(item) for item in value)
+
+class SessionStore:
+    """Analysis sessions by id, least recently used evicted past memory_budget bytes"""
+    
+    def __init__(self, memory_budget):
+        self.memory_budget = memory_budget
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def create(self, audio, sr):
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[session_id] = AnalysisSession(audio, sr)
+            self._evict()
+        return session_id
+    
+    def get(self, session_id):
+        """The session, marked as most recently used, or None if unknown or evicted"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+            return session
+    
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+    
+    def update(self):
+        """Re-check the budget after a render has grown a session's memo"""
+        with self._lock:
+            self._evict()
+    
+    def _evict(self):
+        """Drop least recently used sessions past the budget; caller holds the lock"""
+        total = sum(session.nbytes() for session in self._sessions.values())
+        # The newest session always stays, even if it alone is over budget
+        while total > self.memory_budget and len(self._sessions) > 1:
+            _, session = self._sessions.popitem(last=False)
+            total -= session.nbytes()
+    
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": sum(session.nbytes() for session in self._sessions.values()),
+                "budget": self.memory_budget,
+            }
+
+class Overloaded(Exception):
+    """Every render slot is busy and the queue for one is full or too slow"""
+
+class ProcessorPool:
+    """AutoTuneProcessor instances lent to request threads, one render each
+
+    At most size renders run at once in this process. Up to max_waiting
+    more requests wait for a free processor; get() turns away any beyond
+    that, and any that waited longer than timeout seconds, with Overloaded.
+    The most recently returned processor goes out first, so its caches stay
+    warm. The wait is timed as the 'queue' stage.
+    """
+    
+    def __init__(self, size, max_waiting, timeout, factory):
+        self.size = size
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(factory())
+        self._lock = threading.Lock()
+        self._admitted = 0  # running plus waiting
+        self.rejected = 0
+    
+    def get(self):
+        """Take a processor, waiting for one if needed; give it back with put()"""
+        with self._lock:
+            if self._admitted >= self.size + self.max_waiting:
+                self.rejected += 1
+                raise Overloaded(f"{self.size} renders running and {self.max_waiting} waiting")
+            self._admitted += 1
+        try:
+            with metrics.stage('queue'):
+                return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self._admitted -= 1
+                self.rejected += 1
+            raise Overloaded(f"no render slot free within {self.timeout} s")
+    
+    def put(self, processor):
+        self._idle.put(processor)
+        with self._lock:
+            self._admitted -= 1
+    
+    @contextmanager
+    def acquire(self):
+        processor = self.get()
+        try:
+            yield processor
+        finally:
+            self.put(processor)
+    
+    def stats(self):
+        with self._lock:
+            busy = self.size - self._idle.qsize()
+            return {'slots': self.size, 'busy': busy, 'waiting': max(self._admitted - busy, 0),
+                    'rejected': self.rejected}
+
+class BeatLibrary:
+    """Instrumentals decoded once and kept as memory-mapped float32 PCM
+
+    Beats are the audio files in folder, named by their file name without the
+    extension. The first use of a beat at a sample rate decodes it, resampled
+    if needed, into an .npy file under cache_folder; every later mix maps that
+    file read-only, so the beat is never decoded again and worker processes
+    share its pages. The beat's key is detected once and stored next to it.
+    Cached files are named after the source's size and modification time, so
+    replacing a beat re-decodes it.
+    """
+    
+    def __init__(self, folder, cache_folder):
+        self.folder = folder
+        self.cache_folder = cache_folder
+        self._maps = {}
+        self._lock = threading.Lock()
+    
+    def ids(self):
+        """Ids of every beat in the folder"""
+        if not os.path.isdir(self.folder):
+            return []
+        return sorted(os.path.splitext(name)[0] for name in os.listdir(self.folder) if allowed_file(name))
+    
+    def _source(self, beat_id):
+        """Path of a beat's audio file, or None"""
+        if beat_id != secure_filename(beat_id) or not os.path.isdir(self.folder):
+            return None
+        for name in os.listdir(self.folder):
+            if os.path.splitext(name)[0] == beat_id and allowed_file(name):
+                return os.path.join(self.folder, name)
+        return None
+    
+    def exists(self, beat_id):
+        return self._source(beat_id) is not None
+    
+    def fingerprint(self, beat_id):
+        """Short hash of the beat file's size and modification time"""
+        path = self._source(beat_id)
+        if path is None:
+            raise ValueError(f"Unknown instrumental '{beat_id}'")
+        stat = os.stat(path)
+        return hashlib.sha256(f"{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:12]
+    
+    def _cache_path(self, beat_id, fingerprint, suffix):
+        return os.path.join(self.cache_folder, f"{beat_id}-{fingerprint}{suffix}")
+    
+    def _info(self, beat_id):
+        """Native rate, shape and key of a beat, decoding it on first use; caller holds the lock"""
+        fingerprint = self.fingerprint(beat_id)
+        info_path = self._cache_path(beat_id, fingerprint, '.json')
+        try:
+            with open(info_path) as f:
+                return fingerprint, json.load(f)
+        except (OSError, ValueError):
+            pass
+        
+        logger.info(f"🥁 Decoding instrumental {beat_id}")
+        with open(self._source(beat_id), 'rb') as f:
+            audio, sr = decode_audio(f, os.path.splitext(self._source(beat_id))[1].lower(), mono=False)
+        write_npy(self._cache_path(beat_id, fingerprint, f"-{sr}.npy"), audio)
+        info = {
+            "sample_rate": sr,
+            "channels": 1 if audio.ndim == 1 else audio.shape[0],
+            "duration": audio.shape[-1] / sr,
+            "key": None,
+            "scale": None,
+        }
+        write_json(info_path, info)
+        return fingerprint, info
+    
+    def info(self, beat_id):
+        """Sample rate, channels, duration and detected key of a beat"""
+        with self._lock:
+            return dict(self._info(beat_id)[1], id=beat_id)
+    
+    def pcm(self, beat_id, sr):
+        """The beat at sr as a read-only memory map, mono (samples,) or (channels, samples)"""
+        with self._lock:
+            fingerprint, info = self._info(beat_id)
+            if (beat_id, sr) in self._maps and self._maps[beat_id, sr][0] == fingerprint:
+                return self._maps[beat_id, sr][1]
+            
+            path = self._cache_path(beat_id, fingerprint, f"-{sr}.npy")
+            if not os.path.exists(path):
+                native = np.load(self._cache_path(beat_id, fingerprint, f"-{info['sample_rate']}.npy"), mmap_mode='r')
+                logger.info(f"🥁 Resampling instrumental {beat_id} to {sr} Hz")
+                write_npy(path, librosa.resample(np.asarray(native), orig_sr=info['sample_rate'], target_sr=sr))
+            beat = np.load(path, mmap_mode='r')
+            self._maps[beat_id, sr] = (fingerprint, beat)
+            return beat
+    
+    def key(self, beat_id):
+        """The beat's detected (key, scale), computed once and cached"""
+        with self._lock:
+            fingerprint, info = self._info(beat_id)
+            if info['key'] is None:
+                native = np.load(self._cache_path(beat_id, fingerprint, f"-{info['sample_rate']}.npy"), mmap_mode='r')
+                info['key'], info['scale'] = detect_key(native, info['sample_rate'])
+                write_json(self._cache_path(beat_id, fingerprint, '.json'), info)
+                logger.info(f"🥁 Instrumental {beat_id} is in {info['key']} {info['scale']}")
+            return info['key'], info['scale']
+
+class PcmStore:
+    """Decoded uploads kept as float32 .npy files and read through memory maps
+
+    load() decodes an upload once into folder, named by the SHA-256 of its
+    bytes and whether it was mixed down, with a .json sidecar holding the
+    sample rate and shape. Every later load of the same file, in this process
+    or a worker, maps the .npy read-only instead of decoding again, so the
+    PCM is held once in the page cache however many processes use it. The
+    folder is kept under budget bytes, least recently loaded deleted first;
+    the state lives in the files themselves so every process sees the same.
+    """
+    
+    def __init__(self, folder, budget):
+        self.folder = folder if budget > 0 else None
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+    
+    def _paths(self, audio_bytes, mono):
+        name = f"{hashlib.sha256(audio_bytes).hexdigest()}-{'mono' if mono else 'channels'}"
+        return os.path.join(self.folder, f"{name}.npy"), os.path.join(self.folder, f"{name}.json")
+    
+    def load(self, audio_bytes, suffix=None, mono=True):
+        """Decoded audio of a file's bytes and its sample rate, as decode_audio returns them
+
+        The audio is a read-only np.memmap unless the store is disabled or
+        the file holds no samples.
+        """
+        if self.folder is None:
+            return decode_audio(audio_bytes, suffix, mono)
+        
+        pcm_path, info_path = self._paths(audio_bytes, mono)
+        try:
+            with open(info_path) as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            info = None
+        if info is not None:
+            try:
+                with metrics.stage('load', info['samples'], info['sample_rate']):
+                    audio = np.load(pcm_path, mmap_mode='r')
+                    os.utime(pcm_path)
+                self.hits += 1
+                return audio, info['sample_rate']
+            except (OSError, ValueError):
+                pass  # Evicted by another process since the sidecar was read
+        
+        self.misses += 1
+        audio, sr = decode_audio(audio_bytes, suffix, mono)
+        if audio.size == 0:
+            return audio, sr
+        try:
+            write_npy(pcm_path, audio)
+            write_json(info_path, {
+                "sample_rate": sr,
+                "channels": 1 if audio.ndim == 1 else audio.shape[0],
+                "samples": audio.shape[-1],
+                "format": suffix,
+            })
+            self._evict(keep=pcm_path)
+            return np.load(pcm_path, mmap_mode='r'), sr
+        except OSError as e:
+            logger.error(f"Upload store write error: {e}")
+            return audio, sr
+    
+    def _files(self):
+        """(mtime, size, path) of every stored upload"""
+        entries = []
+        for name in os.listdir(self.folder):
+            if name.endswith('.npy') and '.tmp' not in name:
+                path = os.path.join(self.folder, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+    
+    def _evict(self, keep):
+        """Delete least recently loaded uploads past the budget, never keep"""
+        entries = sorted(self._files())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.budget:
+                break
+            if path == keep:
+                continue
+            for stale in (path, path[:-4] + '.json'):
+                try:
+                    os.unlink(stale)
+                except OSError:
+                    pass
+            total -= size
+    
+    def stats(self):
+        entries = self._files() if self.folder else []
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "budget": self.budget,
+        }
+
+class PresetRegistry:
+    """The built-in presets plus user presets persisted to a JSON file
+
+    The file is re-read when another process changes it; version() counts changes.
+    """
+    
+    ID_PATTERN = re.compile(r'[a-z0-9_-]{1,40}')
+    # Settings of a render rather than of its sound, which a preset can't fix
+    RENDER_OPTIONS = ('preset', 'keep_channels', 'quality', 'preview_start', 'preview_duration')
+    RELOAD_INTERVAL = 1.0
+    
+    def __init__(self, builtin, path):
+        self.builtin = builtin
+        self.path = path
+        self._user = {}
+        self._mtime = None
+        self._checked = None
+        self._version = 0
+        self._response = None
+        self._lock = threading.Lock()
+    
+    def _refresh(self):
+        """Reload the user presets if the file changed; caller holds the lock"""
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self.RELOAD_INTERVAL:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            try:
+                with open(self.path) as f:
+                    self._user = json.load(f)
+            except (OSError, ValueError):
+                self._user = {}
+            self._mtime = mtime
+            self._version += 1
+            self._response = None
+    
+    def version(self):
+        with self._lock:
+            self._refresh()
+            return self._version
+    
+    def exists(self, preset_id):
+        with self._lock:
+            self._refresh()
+            return preset_id in self.builtin or preset_id in self._user
+    
+    def effects(self, preset_id):
+        """The effects dict of a preset; raises KeyError for an unknown one"""
+        with self._lock:
+            self._refresh()
+            preset = self.builtin.get(preset_id) or self._user[preset_id]
+            return preset['effects']
+    
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return {**self.builtin, **self._user}
+    
+    def response(self):
+        """(JSON body, ETag) of every preset, built once per version"""
+        with self._lock:
+            self._refresh()
+            if self._response is None:
+                body = json.dumps({**self.builtin, **self._user}).encode()
+                self._response = (body, hashlib.sha256(body).hexdigest()[:16])
+            return self._response
+    
+    def register(self, preset_id, name, description, effects):
+        """Add or replace a user preset; raises ValueError for a bad id or a built-in one"""
+        if not self.ID_PATTERN.fullmatch(preset_id):
+            raise ValueError("Preset ids are 1-40 lowercase letters, digits, '-' or '_'")
+        if preset_id in self.builtin:
+            raise ValueError(f"'{preset_id}' is a built-in preset")
+        if not isinstance(effects, dict) or any(option in effects for option in self.RENDER_OPTIONS):
+            raise ValueError(f"effects must be an object of effect settings, without {', '.join(self.RENDER_OPTIONS)}")
+        unknown = [setting for setting in effects if setting not in NUMERIC_SETTINGS + SOUND_SETTINGS]
+        if unknown:
+            raise ValueError(f"Unknown effect settings: {', '.join(unknown)}")
+        with self._lock:
+            self._refresh()
+            user = {**self._user, preset_id: {"name": name or preset_id, "description": description or "",
+                                              "effects": effects, "custom": True}}
+            self._save(user)
+    
+    def delete(self, preset_id):
+        """Remove a user preset; returns False if there is none by that id"""
+        with self._lock:
+            self._refresh()
+            if preset_id not in self._user:
+                return False
+            self._save({name: preset for name, preset in self._user.items() if name != preset_id})
+            return True
+    
+    def _save(self, user):
+        """Write the user presets and take them as the current version; caller holds the lock"""
+        write_json(self.path, user)
+        self._user = user
+        self._mtime = os.stat(self.path).st_mtime_ns
+        self._version += 1
+        self._response = None
 
 # Initialize processor
-processor = AutoTuneProcessor()
+ready = threading.Event()  # set once warm_up has run; /health answers 503 until then
+warmup_seconds = None
+_warmup_lock = threading.Lock()
+_warmup_thread = None
+
+def warm_up():
+    """Warm both processors and the job pool's workers up, then mark the process ready
+
+    A failed warmup is logged and the worker still becomes ready: the
+    requests it serves only pay the cold start themselves.
+    """
+    global warmup_seconds
+    try:
+        start = time.perf_counter()
+        processor.warmup()
+        realtime_processor.warmup()
+        scheduler.start()
+        warmup_seconds = time.perf_counter() - start
+        logger.info(f"🔥 Warmed up in {warmup_seconds:.2f} s")
+    except Exception as e:
+        logger.error(f"Warmup error: {e}")
+    ready.set()
+
+def start_warmup():
+    """Run warm_up on a background thread, once per process"""
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None and not ready.is_set():
+            _warmup_thread = threading.Thread(target=warm_up, name='warmup', daemon=True)
+            _warmup_thread.start()
+
+def warm_worker():
+    """Job pool initializer: warm the processor up before the worker takes its first job"""
+    try:
+        processor.warmup()
+    except Exception as e:
+        logger.error(f"Worker warmup error: {e}")
+
+beats = BeatLibrary(INSTRUMENTALS_FOLDER, BEAT_CACHE_FOLDER)
+presets = PresetRegistry(PRESETS, USER_PRESETS_FILE)
+processor = AutoTuneProcessor(beats=beats, presets=presets)
+realtime_processor = AutoTuneProcessor(n_fft=REALTIME_N_FFT, hop_length=REALTIME_HOP_LENGTH, presets=presets)
+# Renders in request threads borrow from here; processor serves the job workers
+processors = ProcessorPool(RENDER_SLOTS, RENDER_QUEUE_DEPTH, RENDER_QUEUE_TIMEOUT,
+                           lambda: AutoTuneProcessor(beats=beats, presets=presets))
+scheduler = JobScheduler(JOB_WORKERS, JOB_QUEUE_DEPTH, JOB_RESULT_TTL, on_metrics=metrics.merge,
+                         warmup=warm_worker, max_finished=JOB_MAX_FINISHED)
+result_cache = ResultCache(RESULT_CACHE_MEMORY, PROCESSED_FOLDER, RESULT_CACHE_DISK)
+sessions = SessionStore(ANALYSIS_SESSION_MEMORY)
+uploads = PcmStore(UPLOAD_FOLDER, UPLOAD_STORE_DISK)
+
+def render_key(audio_bytes, effects):
+    """Result cache key of rendering audio_bytes with effects"""
+    plan = processor._plan_chain(effects)
+    if effects.get('keep_channels'):
+        plan = dict(plan, channels='keep')
+    if 'mix' in plan:
+        # A replaced beat file must not hit renders of the old one
+        plan = dict(plan, beat=beats.fingerprint(plan['mix']['instrumental']))
+    return ResultCache.key(audio_bytes, plan)
+
+def render_job(job_id, audio_bytes, suffix, effects):
+    """Decode, process and encode one take inside a scheduler worker
+
+    Runs in a pool process with its own copy of the module-level processor;
+    the decoded take comes from the shared upload store. Returns the
+    processed audio as WAV bytes; stage timings go back to this
+    process's /metrics through report_metrics.
+    """
+    report_progress(job_id, 0.0)
+    with metrics.collect() as observations:
+        audio_data, sr = uploads.load(audio_bytes, suffix, mono=not effects.get('keep_channels'))
+        if audio_data.size == 0:
+            raise ValueError("No audio data could be loaded from the file")
+        
+        # Decoding and encoding are quick next to the effects chain
+        report_progress(job_id, 0.05)
+        processed_audio = processor.process_audio(
+            audio_data, sr, effects,
+            progress=lambda fraction: report_progress(job_id, 0.05 + 0.9 * fraction)
+        )
+        wav_bytes = encode_wav(processed_audio, processor.output_rate(sr, effects))
+    report_metrics(observations)
+    return wav_bytes
+
+def render_variants(job_id, audio_bytes, suffix, configs):
+    """Decode one take once and render it with every config in a scheduler worker
+
+    configs is a list of (name, effects). All renders share one analysis
+    memo, so the STFT and pitch track are computed once per take and configs
+    with the same shift settings share the shifted audio too. Returns the
+    take's duration in seconds and a list of (name, WAV bytes). The take
+    keeps its channels if any config sets keep_channels; every config then
+    renders them.
+    """
+    report_progress(job_id, 0.0)
+    with metrics.collect() as observations:
+        keep_channels = any(effects.get('keep_channels') for _, effects in configs)
+        audio_data, sr = uploads.load(audio_bytes, suffix, mono=not keep_channels)
+        if audio_data.size == 0:
+            raise ValueError("No audio data could be loaded from the file")
+        
+        analysis = {}
+        renders = []
+        for done, (name, effects) in enumerate(configs):
+            processed_audio = processor.process_audio(audio_data, sr, effects, analysis=analysis)
+            renders.append((name, encode_wav(processed_audio, processor.output_rate(sr, effects))))
+            report_progress(job_id, (done + 1) / len(configs))
+    report_metrics(observations)
+    return audio_data.shape[-1] / sr, renders
+
+def batch_configs(preset_names=None, effects_list=()):
+    """(name, effects) pairs for a batch: the named presets, then custom effects
+
+    With neither presets nor custom effects, every preset is rendered.
+    Raises ValueError for an unknown preset name or unusable custom effects.
+    """
+    if not preset_names and not effects_list:
+        preset_names = list(presets.all())
+    configs = []
+    for name in preset_names or ():
+        if not presets.exists(name):
+            raise ValueError(f"Unknown preset '{name}'")
+        configs.append((name, {'preset': name}))
+    for index, effects in enumerate(effects_list):
+        configs.append((f"custom{index + 1}", check_effects(effects)))
+    return configs
+
+def batch_report(durations, n_configs, wall_time):
+    """Throughput of a batch: files and renders per second and realtime factor"""
+    audio_seconds = sum(durations) * n_configs
+    return {
+        "files": len(durations),
+        "renders": len(durations) * n_configs,
+        "audio_seconds": round(audio_seconds, 2),
+        "wall_seconds": round(wall_time, 3),
+        "files_per_second": round(len(durations) / wall_time, 3),
+        "renders_per_second": round(len(durations) * n_configs / wall_time, 3),
+        "realtime_factor": round(audio_seconds / wall_time, 1),
+    }
+
+def render_cached(audio_bytes, effects, key=None):
+    """WAV bytes of audio_bytes rendered with effects, from the cache if possible
+
+    Renders in the calling thread on a processor from the pool, raising
+    Overloaded when none is free in time; the routes that return right away
+    go through the scheduler instead. key, if given, is the render_key the
+    caller already computed, so the upload isn't hashed twice.
+    """
+    if key is None:
+        key = render_key(audio_bytes, effects)
+    wav_bytes = result_cache.get(key)
+    if wav_bytes is None:
+        audio_data, sr = uploads.load(audio_bytes, mono=not effects.get('keep_channels'))
+        if audio_data.size == 0:
+            raise ValueError("No audio data could be loaded from the file")
+        with processors.acquire() as render_processor:
+            wav_bytes = encode_wav(render_processor.process_audio(audio_data, sr, effects),
+                                   render_processor.output_rate(sr, effects))
+        result_cache.put(key, wav_bytes)
+    return wav_bytes
+
+def busy_response(error):
+    """503 for a full job queue or render pool, with a Retry-After"""
+    return jsonify({"error": f"Server busy: {error}"}), 503, {'Retry-After': str(RETRY_AFTER)}
+
+def wav_response(key, wav_bytes, **kwargs):
+    """send_file of a render, from the result cache's file when it has one
+
+    Served from disk, Range requests read only the bytes asked for; kwargs
+    go to send_file.
+    """
+    path = result_cache.path(key) if key is not None else None
+    if path is not None:
+        try:
+            return send_file(os.path.abspath(path), mimetype='audio/wav', conditional=True, **kwargs)
+        except OSError:
+            pass  # Evicted since the lookup
+    return send_file(io.BytesIO(wav_bytes), mimetype='audio/wav', conditional=True, **kwargs)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if SERVER_TIMING:
+        g.timings_token = metrics.begin()
+
+@app.after_request
+def record_request_time(response):
+    if 'request_start' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_start
+    metrics.observe_request(request.endpoint or 'unknown', request.method, response.status_code, elapsed)
+    if 'timings_token' in g:
+        response.headers['Server-Timing'] = server_timing(metrics.end(g.pop('timings_token')), elapsed)
+    return response
 
 @app.route('/', methods=['GET'])
 def index():
@@ -248,61 +2452,99 @@ def index():
         "message": "808s & Mic Breaks - Auto-Tune API",
         "version": "1.0.0",
         "endpoints": {
+            "/realtime": "WebSocket - Live float32 PCM frames in, processed frames out",
             "/upload": "POST - Upload and process audio",
-            "/presets": "GET - Get available presets",
-            "/health": "GET - Health check"
+            "/process-stream": "POST - Upload and stream back processed audio block by block",
+            "/process-raw": "POST - Process raw audio bytes (effects in the query string), returns WAV",
+            "/jobs": "POST - Queue an upload for background processing, returns a job id",
+            "/jobs/<id>": "GET - Job status and progress; DELETE - cancel the job",
+            "/jobs/<id>/result": "GET - Processed audio of a finished job",
+            "/presets": "GET - Get available presets, with an ETag",
+            "/presets/<id>": "PUT - Register a user preset, DELETE - Remove one",
+            "/cache": "GET - Result cache, analysis session and upload store counts and sizes",
+            "/batch": "POST - Render several files with several presets/effects, returns a zip",
+            "/sessions": "POST - Upload a take once for repeated renders, returns a session id",
+            "/sessions/<id>/render": "POST - Render the session's take with new effects, returns WAV",
+            "/metrics": "GET - Stage and request timings in the Prometheus text format",
+            "/instrumentals": "GET - Instrumentals available for server-side mixing",
+            "/instrumentals/<id>": "GET - Sample rate, length and detected key of an instrumental",
+            "/health": "GET - Health check, 503 until warmed up"
         }
     })
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "message": "Auto-tune service is running"})
+    if not ready.is_set():
+        # Load balancers probe before sending traffic, so the first probe
+        # starts the warmup if the server did not
+        start_warmup()
+        return jsonify({"status": "warming", "message": "Auto-tune service is warming up"}), 503
+    return jsonify({"status": "healthy", "message": "Auto-tune service is running",
+                    "warmup_seconds": warmup_seconds})
+
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    return jsonify({**result_cache.stats(), "analysis_sessions": sessions.stats(), "uploads": uploads.stats()})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage timing histograms, request latencies and cache and queue gauges"""
+    cache = result_cache.stats()
+    pool = processors.stats()
+    extra = [
+        ('autotune_result_cache_hits_total', 'counter', 'Result cache hits', cache['hits']),
+        ('autotune_result_cache_misses_total', 'counter', 'Result cache misses', cache['misses']),
+        ('autotune_result_cache_memory_bytes', 'gauge', 'Bytes of rendered audio held in memory', cache['memory_bytes']),
+        ('autotune_jobs_pending', 'gauge', 'Queued and running render jobs', scheduler.pending()),
+        ('autotune_render_slots_busy', 'gauge', 'Request-thread renders running', pool['busy']),
+        ('autotune_render_waiting', 'gauge', 'Requests waiting for a render slot', pool['waiting']),
+        ('autotune_render_rejected_total', 'counter', 'Requests turned away with 503 by the render pool', pool['rejected']),
+        ('autotune_analysis_session_bytes', 'gauge', 'Bytes held by analysis sessions', sessions.stats()['bytes']),
+    ]
+    return Response(metrics.render(extra), mimetype='text/plain; version=0.0.4')
 
 @app.route('/presets', methods=['GET'])
 def get_presets():
-    presets = {
-        "kanye": {
-            "name": "Kanye Mode",
-            "description": "808s & Heartbreak style auto-tune",
-            "effects": {
-                "pitch_shift": 2,
-                "autotune_strength": 85,
-                "reverb_amount": 40,
-                "delay_time": 120
-            }
-        },
-        "tpain": {
-            "name": "T-Pain Mode", 
-            "description": "Heavy auto-tune effect",
-            "effects": {
-                "pitch_shift": 4,
-                "autotune_strength": 95,
-                "reverb_amount": 60,
-                "delay_time": 200
-            }
-        },
-        "robot": {
-            "name": "Robot Mode",
-            "description": "Robotic voice effect",
-            "effects": {
-                "pitch_shift": -8,
-                "autotune_strength": 100,
-                "reverb_amount": 20,
-                "delay_time": 80
-            }
-        },
-        "clear": {
-            "name": "Clear",
-            "description": "No effects applied",
-            "effects": {
-                "pitch_shift": 0,
-                "autotune_strength": 0,
-                "reverb_amount": 0,
-                "delay_time": 0
-            }
-        }
-    }
-    return jsonify(presets)
+    """Every preset, built-in and user, from a cached body that clients revalidate by ETag"""
+    body, etag = presets.response()
+    response = Response(body, mimetype='application/json', headers={'Cache-Control': 'no-cache'})
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+@app.route('/presets/<preset_id>', methods=['PUT', 'DELETE'])
+def user_preset(preset_id):
+    """Register a user preset from a JSON {name, description, effects} body, or delete one"""
+    if request.method == 'DELETE':
+        if not presets.delete(preset_id):
+            return jsonify({"error": "No user preset by that id"}), 404
+        return jsonify({"deleted": preset_id})
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('effects'), dict):
+        return jsonify({"error": "Send JSON with an 'effects' object"}), 400
+    try:
+        check_effects(data['effects'])  # Reject effects no render could use
+        presets.register(preset_id, data.get('name'), data.get('description'), data['effects'])
+    except ValueError as e:
+        return jsonify({"error": f"Invalid preset: {e}"}), 400
+    logger.info(f"🎛️ Registered preset {preset_id}")
+    return jsonify(presets.all()[preset_id]), 201
+
+@app.route('/instrumentals', methods=['GET'])
+def list_instrumentals():
+    return jsonify({"instrumentals": beats.ids()})
+
+@app.route('/instrumentals/<beat_id>', methods=['GET'])
+def instrumental_info(beat_id):
+    """Decode the instrumental on first use and report its rate, length and key"""
+    if not beats.exists(beat_id):
+        return jsonify({"error": "Instrumental not found"}), 404
+    try:
+        beats.key(beat_id)
+        return jsonify(beats.info(beat_id))
+    except Exception as e:
+        logger.error(f"Instrumental error: {e}")
+        return jsonify({"error": f"Instrumental could not be decoded: {str(e)}"}), 500
 
 @app.route('/upload', methods=['POST'])
 def upload_and_process():
@@ -316,53 +2558,41 @@ def upload_and_process():
             return jsonify({"error": "No file selected"}), 400
         
         # Get effect parameters
-        effects = {}
         try:
-            if 'effects' in request.form:
-                effects = json.loads(request.form['effects'])
-            else:
-                # Get individual parameters
-                effects = {
-                    'pitch_shift': int(request.form.get('pitch_shift', 0)),
-                    'autotune_strength': int(request.form.get('autotune_strength', 50)),
-                    'reverb_amount': int(request.form.get('reverb_amount', 30)),
-                    'delay_time': int(request.form.get('delay_time', 150))
-                }
+            effects = check_effects(effects_from_form(request.form))
         except (ValueError, json.JSONDecodeError) as e:
             return jsonify({"error": f"Invalid effect parameters: {e}"}), 400
         
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
             
-            # Save uploaded file temporarily
-            temp_input = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-            file.save(temp_input.name)
+            suffix = os.path.splitext(filename)[1].lower()
+            
+            audio_bytes = file.read()
+            key = render_key(audio_bytes, effects)
+            wav_bytes = result_cache.get(key)
+            
+            if wav_bytes is None:
+                try:
+                    # Render on the job scheduler and wait for it
+                    job_id = scheduler.submit(render_job, audio_bytes, suffix, effects, pin=True,
+                                              on_done=lambda data: result_cache.put(key, data))
+                except QueueFull as e:
+                    return busy_response(e)
             
             try:
-                # Load audio file
-                audio_data, sr = librosa.load(temp_input.name, sr=None)
-                
-                # Process audio with effects
-                processed_audio = processor.process_audio(audio_data, sr, effects)
-                
-                # Create output file
-                temp_output = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-                sf.write(temp_output.name, processed_audio, sr)
+                if wav_bytes is None:
+                    # Queueing plus the render in the worker
+                    with metrics.stage('job'):
+                        wav_bytes = scheduler.wait(job_id)
                 
-                # Clean up input file
-                os.unlink(temp_input.name)
-                
-                return send_file(
-                    temp_output.name,
+                return wav_response(
+                    key, wav_bytes,
                     as_attachment=True,
-                    download_name=f"autotuned_{filename}",
-                    mimetype='audio/wav'
+                    download_name=f"autotuned_{os.path.splitext(filename)[0]}.wav"
                 )
                 
             except Exception as e:
-                # Clean up files on error
-                if os.path.exists(temp_input.name):
-                    os.unlink(temp_input.name)
                 logger.error(f"Processing error: {e}")
                 return jsonify({"error": f"Audio processing failed: {str(e)}"}), 500
         
@@ -372,6 +2602,334 @@ def upload_and_process():
         logger.error(f"Upload error: {e}")
         return jsonify({"error": f"Upload failed: {str(e)}"}), 500
 
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue an upload for processing and return its job id right away
+
+    Same form fields as /upload. Poll GET /jobs/<id> for progress and fetch
+    the WAV from /jobs/<id>/result once the status is 'done'.
+    """
+    try:
+        if 'audio' not in request.files:
+            return jsonify({"error": "No audio file provided"}), 400
+        
+        file = request.files['audio']
+        if file.filename == '':
+            return jsonify({"error": "No file selected"}), 400
+        if not allowed_file(file.filename):
+            return jsonify({"error": "Invalid file type"}), 400
+        
+        try:
+            effects = check_effects(effects_from_form(request.form))
+        except (ValueError, json.JSONDecodeError) as e:
+            return jsonify({"error": f"Invalid effect parameters: {e}"}), 400
+        
+        suffix = os.path.splitext(secure_filename(file.filename))[1].lower()
+        audio_bytes = file.read()
+        key = render_key(audio_bytes, effects)
+        wav_bytes = result_cache.get(key)
+        try:
+            if wav_bytes is not None:
+                job_id = scheduler.completed(wav_bytes, tag=key)
+            else:
+                job_id = scheduler.submit(render_job, audio_bytes, suffix, effects, tag=key,
+                                          on_done=lambda data: result_cache.put(key, data))
+        except QueueFull as e:
+            return busy_response(e)
+        
+        logger.info(f"🎵 Queued job {job_id}, effects: {effects}")
+        return jsonify(scheduler.status(job_id)), 202, {'Location': f"/jobs/{job_id}"}
+    
+    except Exception as e:
+        logger.error(f"Job submit error: {e}")
+        return jsonify({"error": f"Job submission failed: {str(e)}"}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET', 'DELETE'])
+def job_status(job_id):
+    """Status and progress of a job; DELETE cancels it"""
+    if request.method == 'DELETE':
+        if not scheduler.cancel(job_id):
+            return jsonify({"error": "Job not found or already finished"}), 404
+    
+    status = scheduler.status(job_id)
+    if status is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    if status['status'] == 'done':
+        status['result'] = f"/jobs/{job_id}/result"
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Processed audio of a finished job; supports Range requests"""
+    status = scheduler.status(job_id)
+    if status is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    if status['status'] != 'done':
+        return jsonify(status), 409
+    
+    return wav_response(
+        scheduler.tag(job_id), scheduler.result(job_id),
+        as_attachment=True,
+        download_name=f"autotuned_{job_id}.wav"
+    )
+
+@app.route('/batch', methods=['POST'])
+def batch_process():
+    """Render every uploaded file with every requested config and return a zip
+
+    Form fields: one or more 'audio' files, 'presets' (comma separated names,
+    default all of them) and 'effects' (a JSON list of custom effect dicts).
+    Each file is one scheduler job, so files render in parallel across the
+    pool, and a batch can hold no more files than the scheduler queues. The
+    zip holds <file>/<config>.wav for every pair plus report.json.
+    """
+    try:
+        files = [file for file in request.files.getlist('audio') if file.filename]
+        if not files:
+            return jsonify({"error": "No audio file provided"}), 400
+        if not all(allowed_file(file.filename) for file in files):
+            return jsonify({"error": "Invalid file type"}), 400
+        if len(files) > scheduler.max_pending:
+            # Retrying can't help a batch that would never fit in the queue
+            return jsonify({"error": f"A batch holds at most {scheduler.max_pending} files"}), 413
+        
+        try:
+            preset_names = [name.strip() for name in request.form.get('presets', '').split(',') if name.strip()]
+            effects_list = json.loads(request.form['effects']) if 'effects' in request.form else []
+            configs = batch_configs(preset_names, effects_list)
+        except (ValueError, json.JSONDecodeError) as e:
+            return jsonify({"error": f"Invalid batch parameters: {e}"}), 400
+        
+        start = time.perf_counter()
+        job_ids = []
+        try:
+            for file in files:
+                suffix = os.path.splitext(secure_filename(file.filename))[1].lower()
+                job_ids.append(scheduler.submit(render_variants, file.read(), suffix, configs, pin=True))
+        except QueueFull as e:
+            for job_id in job_ids:
+                scheduler.cancel(job_id)
+            return busy_response(e)
+        
+        archive = io.BytesIO()
+        durations = []
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as zf:
+            for index, (file, job_id) in enumerate(zip(files, job_ids)):
+                try:
+                    duration, renders = scheduler.wait(job_id)
+                except Exception:
+                    # The batch has failed; free the pool of the files still queued
+                    for pending in job_ids[index + 1:]:
+                        scheduler.cancel(pending)
+                    raise
+                durations.append(duration)
+                stem = os.path.splitext(secure_filename(file.filename))[0]
+                for name, wav_bytes in renders:
+                    zf.writestr(f"{stem}/{name}.wav", wav_bytes)
+            report = batch_report(durations, len(configs), time.perf_counter() - start)
+            zf.writestr('report.json', json.dumps(report, indent=2))
+        
+        logger.info(f"✅ Batch done: {report}")
+        archive.seek(0)
+        return send_file(
+            archive,
+            as_attachment=True,
+            download_name='autotuned_batch.zip',
+            mimetype='application/zip'
+        )
+    
+    except Exception as e:
+        logger.error(f"Batch error: {e}")
+        return jsonify({"error": f"Batch processing failed: {str(e)}"}), 500
+
+@app.route('/sessions', methods=['POST'])
+def create_session():
+    """Decode an upload once and keep it for repeated renders
+
+    Renders through /sessions/<id>/render reuse the decoded audio, STFT and
+    pitch track, and when only reverb or delay change, the shifted audio too.
+    A keep_channels form field of 'true' keeps a multichannel upload's
+    channels instead of mixing it down.
+    """
+    try:
+        if 'audio' not in request.files:
+            return jsonify({"error": "No audio file provided"}), 400
+        
+        file = request.files['audio']
+        if file.filename == '':
+            return jsonify({"error": "No file selected"}), 400
+        if not allowed_file(file.filename):
+            return jsonify({"error": "Invalid file type"}), 400
+        
+        suffix = os.path.splitext(secure_filename(file.filename))[1].lower()
+        keep_channels = request.form.get('keep_channels', 'false').lower() == 'true'
+        audio_data, sr = uploads.load(file.read(), suffix, mono=not keep_channels)
+        if audio_data.size == 0:
+            return jsonify({"error": "No audio data could be loaded from the file"}), 400
+        
+        session_id = sessions.create(audio_data, sr)
+        channels = 1 if audio_data.ndim == 1 else audio_data.shape[0]
+        logger.info(f"🎵 Session {session_id}: {audio_data.shape[-1]} samples x {channels} channel(s) at {sr} Hz")
+        return jsonify({
+            "session_id": session_id,
+            "sample_rate": sr,
+            "channels": channels,
+            "duration": audio_data.shape[-1] / sr
+        }), 201, {'Location': f"/sessions/{session_id}"}
+    
+    except Exception as e:
+        logger.error(f"Session create error: {e}")
+        return jsonify({"error": f"Session creation failed: {str(e)}"}), 500
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    if not sessions.delete(session_id):
+        return jsonify({"error": "Session not found or expired"}), 404
+    return jsonify({"deleted": session_id})
+
+@app.route('/sessions/<session_id>/render', methods=['POST'])
+def render_session(session_id):
+    """Render a session's take with the effects in the JSON body, form or query string"""
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Session not found or expired"}), 404
+    
+    try:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            effects = data.get('effects', data)
+        else:
+            effects = effects_from_form(request.form or request.args)
+        check_effects(effects)
+    except (ValueError, json.JSONDecodeError) as e:
+        return jsonify({"error": f"Invalid effect parameters: {e}"}), 400
+    
+    try:
+        with processors.acquire() as render_processor, session.lock:
+            processed_audio = render_processor.process_audio(session.audio, session.sr, effects,
+                                                             analysis=session.analysis)
+            session.measure()
+        sessions.update()
+        sr = processor.output_rate(session.sr, effects)
+        return Response(
+            encode_wav(processed_audio, sr),
+            mimetype='audio/wav',
+            headers={'X-Sample-Rate': str(sr)}
+        )
+    except Overloaded as e:
+        return busy_response(e)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid effect parameters: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Session render error: {e}")
+        return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+
+@app.route('/process-stream', methods=['POST'])
+def process_stream():
+    """Process an uploaded file block by block and stream the WAV back
+
+    Memory stays bounded by STREAM_BLOCK_SIZE whatever the length of the
+    upload. Only formats soundfile can read incrementally are accepted.
+    """
+    try:
+        if 'audio' not in request.files:
+            return jsonify({"error": "No audio file provided"}), 400
+        
+        file = request.files['audio']
+        if file.filename == '':
+            return jsonify({"error": "No file selected"}), 400
+        
+        try:
+            effects = check_effects(effects_from_form(request.form))
+        except (ValueError, json.JSONDecodeError) as e:
+            return jsonify({"error": f"Invalid effect parameters: {e}"}), 400
+        
+        # Flask closes request files when this view returns, long before the
+        # response has been streamed, so take the upload's stream over
+        upload = file.stream
+        file.stream = io.BytesIO()
+        try:
+            sound_file = sf.SoundFile(upload)
+        except RuntimeError as e:
+            upload.close()
+            logger.error(f"Stream decode error: {e}")
+            return jsonify({"error": "Streaming supports WAV, FLAC and OGG uploads; use /upload for other formats"}), 415
+        
+        filename = secure_filename(file.filename).rsplit('.', 1)[0]
+        try:
+            # Held until the response closes, which also runs when the
+            # generator never started
+            stream_processor = processors.get()
+        except Overloaded as e:
+            sound_file.close()
+            upload.close()
+            return busy_response(e)
+        
+        def generate():
+            try:
+                with sound_file:
+                    stream = AutoTuneStream(stream_processor, sound_file.samplerate, effects)
+                    yield wav_header(sound_file.samplerate, sound_file.frames)
+                    for block in sound_file.blocks(blocksize=STREAM_BLOCK_SIZE, dtype='float32', always_2d=True):
+                        # Downmix to mono, as librosa.load does for /upload
+                        yield pcm16_bytes(stream.process(block.mean(axis=1)))
+                    yield pcm16_bytes(stream.flush())
+                logger.info(f"✅ Streamed {stream.samples_out} samples at {sound_file.samplerate} Hz")
+            finally:
+                upload.close()
+        
+        response = Response(
+            generate(),
+            mimetype='audio/wav',
+            headers={'Content-Disposition': f'attachment; filename="autotuned_{filename}.wav"'}
+        )
+        response.call_on_close(lambda: processors.put(stream_processor))
+        return response
+    
+    except Exception as e:
+        logger.error(f"Stream endpoint error: {e}")
+        return jsonify({"error": f"Streaming failed: {str(e)}"}), 500
+
+@app.route('/process-raw', methods=['POST'])
+def process_raw_audio():
+    """Process audio sent as the raw request body and return the WAV bytes
+
+    Effects come from the query string (an 'effects' JSON parameter or the
+    individual fields) or from an X-Effects JSON header. Nothing touches the
+    disk for formats soundfile can decode.
+    """
+    try:
+        audio_bytes = request.get_data()
+        if not audio_bytes:
+            return jsonify({"error": "No audio data provided"}), 400
+        
+        try:
+            if 'X-Effects' in request.headers:
+                effects = json.loads(request.headers['X-Effects'])
+            else:
+                effects = effects_from_form(request.args)
+            check_effects(effects)
+        except (ValueError, json.JSONDecodeError) as e:
+            return jsonify({"error": f"Invalid effect parameters: {e}"}), 400
+        
+        logger.info(f"🎵 Received {len(audio_bytes)} bytes, effects: {effects}")
+        
+        try:
+            key = render_key(audio_bytes, effects)
+            wav_bytes = render_cached(audio_bytes, effects, key)
+            response = wav_response(key, wav_bytes)
+            response.headers['X-Sample-Rate'] = str(wav_sample_rate(wav_bytes))
+            return response
+        except Overloaded as e:
+            return busy_response(e)
+        except Exception as e:
+            logger.error(f"Raw processing error: {e}")
+            return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+    
+    except Exception as e:
+        logger.error(f"Raw endpoint error: {e}")
+        return jsonify({"error": f"Request failed: {str(e)}"}), 500
+
 @app.route('/process-base64', methods=['POST'])
 def process_base64_audio():
     """Process audio sent as base64 data"""
@@ -390,58 +2948,23 @@ def process_base64_audio():
             'reverb_amount': 30,
             'delay_time': 150
         })
+        try:
+            check_effects(effects)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid effect parameters: {e}"}), 400
         logger.info(f"🎛️ Effects: {effects}")
         
         # Decode base64 audio data
-        import base64
         audio_bytes = base64.b64decode(data['audio_data'])
         
         # Log the data size for debugging
         logger.info(f"Received audio data: {len(audio_bytes)} bytes")
         
-        # Create temporary file - try to detect format from first few bytes
-        # WebM files start with specific magic bytes
-        if audio_bytes[:4] == b'\x1a\x45\xdf\xa3':
-            suffix = '.webm'
-        elif audio_bytes[:4] == b'RIFF':
-            suffix = '.wav'
-        elif audio_bytes[:3] == b'ID3' or audio_bytes[:2] == b'\xff\xfb':
-            suffix = '.mp3'
-        else:
-            # Default to webm as that's what MediaRecorder typically produces
-            suffix = '.webm'
-            
-        logger.info(f"Detected audio format: {suffix}")
-        
-        # Create temporary file with appropriate extension
-        temp_input = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-        temp_input.write(audio_bytes)
-        temp_input.close()
-        
         try:
-            # Load and process audio - librosa can handle multiple formats
-            audio_data, sr = librosa.load(temp_input.name, sr=None)
-            logger.info(f"Loaded audio: {len(audio_data)} samples at {sr} Hz")
-            
-            if len(audio_data) == 0:
-                raise ValueError("No audio data could be loaded from the file")
-                
-            processed_audio = processor.process_audio(audio_data, sr, effects)
-            
-            # Save processed audio
-            temp_output = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-            temp_output_name = temp_output.name
-            temp_output.close()
-            sf.write(temp_output_name, processed_audio, sr)
-            
-            # Read processed audio and encode as base64
-            with open(temp_output_name, 'rb') as f:
-                processed_bytes = f.read()
-                processed_b64 = base64.b64encode(processed_bytes).decode('utf-8')
-            
-            # Clean up
-            os.unlink(temp_input.name)
-            os.unlink(temp_output_name)
+            # Load and process audio
+            wav_bytes = render_cached(audio_bytes, effects)
+            sr = wav_sample_rate(wav_bytes)
+            processed_b64 = base64.b64encode(wav_bytes).decode('utf-8')
             
             logger.info("✅ Audio processing completed successfully")
             return jsonify({
@@ -450,12 +2973,9 @@ def process_base64_audio():
                 "effects_applied": effects
             })
             
+        except Overloaded as e:
+            return busy_response(e)
         except Exception as e:
-            # Clean up any created temp files
-            if os.path.exists(temp_input.name):
-                os.unlink(temp_input.name)
-            if 'temp_output_name' in locals() and os.path.exists(temp_output_name):
-                os.unlink(temp_output_name)
             logger.error(f"Base64 processing error: {e}")
             return jsonify({"error": f"Processing failed: {str(e)}"}), 500
             
@@ -463,8 +2983,61 @@ def process_base64_audio():
         logger.error(f"Base64 endpoint error: {e}")
         return jsonify({"error": f"Request failed: {str(e)}"}), 500
 
+def realtime_session(ws, args):
+    """Live processing over a WebSocket
+
+    Query string: sr (default 44100), frame (samples per message, default
+    REALTIME_FRAME_SIZE) and the effects, as for /process-raw. The server
+    first sends a JSON text message with the sample rate, frame size and
+    latency. After that every binary message must be exactly one frame of
+    little-endian float32 mono samples and is answered with one processed
+    frame in the same format. A text message {"effects": {...}} switches
+    effects; the processing state restarts. Bad query parameters get an
+    error message and the socket is closed.
+    """
+    try:
+        sr = args.get('sr', 44100, type=int)
+        low, high = REALTIME_SAMPLE_RATES
+        if not low <= sr <= high:
+            raise ValueError(f"sr must be between {low} and {high} Hz")
+        frame_size = args.get('frame', REALTIME_FRAME_SIZE, type=int)
+        if not 64 <= frame_size <= 8192:
+            raise ValueError("frame must be between 64 and 8192 samples")
+        effects = check_effects(effects_from_form(args))
+        live = AutoTuneRealtime(realtime_processor, sr, effects, frame_size)
+    except (ValueError, json.JSONDecodeError) as e:
+        ws.send(json.dumps({"error": f"Invalid parameters: {e}"}))
+        ws.close(reason=1008, message="Invalid parameters")  # 1008: policy violation
+        return
+    
+    ws.send(json.dumps({"sample_rate": sr, "frame_size": frame_size,
+                        "latency_ms": round(live.latency_ms, 1)}))
+    logger.info(f"🎤 Realtime session at {sr} Hz, {frame_size}-sample frames, {live.latency_ms:.1f} ms")
+    while True:
+        message = ws.receive()
+        try:
+            if isinstance(message, str):
+                data = json.loads(message)
+                if not isinstance(data, dict):
+                    raise ValueError('text messages must be a JSON object like {"effects": {...}}')
+                effects = check_effects(data.get('effects', effects))
+                live = AutoTuneRealtime(realtime_processor, sr, effects, frame_size)
+                ws.send(json.dumps({"sample_rate": sr, "frame_size": frame_size,
+                                    "latency_ms": round(live.latency_ms, 1)}))
+                continue
+            frame = np.frombuffer(message, dtype='<f4')
+            ws.send(live.process(frame).astype('<f4').tobytes())
+        except (ValueError, json.JSONDecodeError) as e:
+            ws.send(json.dumps({"error": str(e)}))
+
+@sock.route('/realtime')
+def realtime(ws):
+    """WebSocket endpoint of realtime_session"""
+    realtime_session(ws, request.args)
+
 if __name__ == '__main__':
     print("🎤 Starting 808s & Mic Breaks Auto-Tune Server...")
     print("🎵 Available at: http://localhost:5000")
     print("🎚️ Ready to process audio with auto-tune effects!")
+    start_warmup()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
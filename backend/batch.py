@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Batch renderer for 808s & Mic Breaks Auto-Tune Backend
+Renders every input file with every preset or effects config
+"""
+
+import argparse
+import json
+import os
+import time
+import zipfile
+from app import ALLOWED_EXTENSIONS, batch_configs, batch_report, render_variants
+from jobs import JobScheduler
+
+def _input_files(paths):
+    """The audio files named on the command line, with directories expanded"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.rsplit('.', 1)[-1].lower() in ALLOWED_EXTENSIONS:
+                    files.append(os.path.join(path, name))
+        else:
+            files.append(path)
+    return files
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('inputs', nargs='+', help='audio files or directories of them')
+    parser.add_argument('-o', '--output', default='batch_output',
+                        help='output directory, or a .zip file to write instead (default: batch_output)')
+    parser.add_argument('--presets', default='',
+                        help='comma separated preset names (default: all, unless --effects is given)')
+    parser.add_argument('--effects', help='JSON file holding a list of custom effect dicts')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='render processes (default: one per core)')
+    args = parser.parse_args()
+
+    files = _input_files(args.inputs)
+    if not files:
+        parser.error("no audio files found")
+    effects_list = []
+    if args.effects:
+        with open(args.effects) as f:
+            effects_list = json.load(f)
+    try:
+        configs = batch_configs([name.strip() for name in args.presets.split(',') if name.strip()], effects_list)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"🎤 Rendering {len(files)} file(s) x {len(configs)} config(s): {', '.join(name for name, _ in configs)}")
+    scheduler = JobScheduler(max_workers=args.workers, max_pending=len(files))
+    start = time.perf_counter()
+    try:
+        jobs = []
+        for path in files:
+            with open(path, 'rb') as f:
+                audio_bytes = f.read()
+            jobs.append((path, scheduler.submit(render_variants, audio_bytes, os.path.splitext(path)[1].lower(), configs, pin=True)))
+
+        to_zip = args.output.endswith('.zip')
+        archive = zipfile.ZipFile(args.output, 'w', zipfile.ZIP_STORED) if to_zip else None
+        durations = []
+        for index, (path, job_id) in enumerate(jobs):
+            try:
+                duration, renders = scheduler.wait(job_id)
+            except Exception as e:
+                # Stop at the first failure rather than keep the pool busy with the rest
+                for _, pending in jobs[index + 1:]:
+                    scheduler.cancel(pending)
+                print(f"❌ {path}: {e}; cancelled the remaining {len(jobs) - index - 1} file(s)")
+                if archive is not None:
+                    archive.close()
+                raise SystemExit(1)
+            durations.append(duration)
+            stem = os.path.splitext(os.path.basename(path))[0]
+            for name, wav_bytes in renders:
+                if archive is not None:
+                    archive.writestr(f"{stem}/{name}.wav", wav_bytes)
+                else:
+                    os.makedirs(os.path.join(args.output, stem), exist_ok=True)
+                    with open(os.path.join(args.output, stem, f"{name}.wav"), 'wb') as f:
+                        f.write(wav_bytes)
+            print(f"✅ {path} ({duration:.1f} s)")
+
+        if not durations:
+            print("❌ Nothing rendered")
+            return
+        report = batch_report(durations, len(configs), time.perf_counter() - start)
+        if archive is not None:
+            archive.writestr('report.json', json.dumps(report, indent=2))
+            archive.close()
+        else:
+            with open(os.path.join(args.output, 'report.json'), 'w') as f:
+                json.dump(report, f, indent=2)
+    finally:
+        scheduler.shutdown()
+
+    print(f"\n📊 {report['files']} files, {report['renders']} renders in {report['wall_seconds']} s")
+    print(f"   {report['files_per_second']} files/s, {report['renders_per_second']} renders/s, "
+          f"{report['realtime_factor']}x realtime")
+    print(f"📁 Output: {args.output}")
+
+if __name__ == "__main__":
+    main()
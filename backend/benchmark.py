@@ -0,0 +1,749 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for 808s & Mic Breaks Auto-Tune Backend
+Times the audio processing stages on synthetic input
+"""
+
+import argparse
+import base64
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import librosa
+import soundfile as sf
+from scipy.signal import lfilter
+from app import PRESETS, AutoTuneProcessor, AutoTuneRealtime, AutoTuneStream, BeatLibrary, PcmStore, PresetRegistry, ResultCache, app, decode_audio, render_job, reverb_impulse_response, reverb_ir_spectrum
+from jobs import JobScheduler
+from metrics import Metrics
+
+def _time_call(func, *args, repeat=3, **kwargs):
+    """Return the best wall-clock time of several calls, in seconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def _peak_memory(func, *args, **kwargs):
+    """Peak bytes allocated while running func, as seen by tracemalloc"""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _measure(func, *args, repeat=3, **kwargs):
+    """Best time and peak traced memory of func, as a record for the JSON report
+
+    The memory run is separate from the timed runs so tracing does not
+    slow down what is timed.
+    """
+    seconds = _time_call(func, *args, repeat=repeat, **kwargs)
+    return {"seconds": round(seconds, 6), "peak_bytes": _peak_memory(func, *args, **kwargs)}
+
+def synthetic_vocal(kind, duration, sr, seed=0):
+    """A synthetic vocal-like take of duration seconds
+
+    'sine' is a 445 Hz tone with harmonics and a 5 Hz vibrato, 'sweep' glides
+    over two octaves from 110 Hz with harmonics and 'noise' is breathy
+    band-limited noise. 'phrases' is the sine sung in 2 s phrases with 1.5 s
+    rests, after a 1 s lead-in and before a 1 s tail of -80 dB room noise.
+    All are float32 at 0.5 peak or below.
+    """
+    n = int(duration * sr)
+    t = np.arange(n) / sr
+    if kind == 'phrases':
+        sung = (t > 1) & (t < duration - 1) & ((t - 1) % 3.5 < 2)
+        # 10 ms fades at every phrase edge
+        fade = max(1, int(0.01 * sr))
+        envelope = np.convolve(sung.astype(np.float32), np.full(fade, 1.0 / fade, dtype=np.float32), 'same')
+        room = 1e-4 * np.random.default_rng(seed).standard_normal(n)
+        return (synthetic_vocal('sine', duration, sr) * envelope + room).astype(np.float32)
+    if kind == 'sine':
+        frequency = 445.0 * 2 ** (0.3 / 12 * np.sin(2 * np.pi * 5 * t))
+    elif kind == 'sweep':
+        frequency = 110.0 * 4 ** (t / max(duration, 1e-9))
+    elif kind == 'noise':
+        noise = np.random.default_rng(seed).standard_normal(n)
+        # One-pole lowpass so the noise sits where a voice would
+        noise = lfilter([0.1], [1.0, -0.9], noise)
+        return (0.5 * noise / max(np.max(np.abs(noise)), 1e-9)).astype(np.float32)
+    else:
+        raise ValueError(f"Unknown signal '{kind}'")
+    phase = 2 * np.pi * np.cumsum(frequency) / sr
+    voice = sum(0.5 / k * np.sin(k * phase) for k in range(1, 5))
+    return (0.5 * voice / np.max(np.abs(voice))).astype(np.float32)
+
+def _corpus(args):
+    """(signal, length, sample rate) for every combination the arguments ask for"""
+    for sr in args.rates:
+        for duration in args.lengths:
+            for kind in args.signals:
+                yield kind, duration, sr
+
+def _legacy_delay(audio, sr, delay_time, feedback, wet):
+    """The original per-sample shift-register delay, kept for comparison"""
+    delay_samples = int(delay_time * sr)
+    delay_buffer = np.zeros(delay_samples)
+    output = np.zeros_like(audio)
+    for i in range(len(audio)):
+        delayed_sample = delay_buffer[0]
+        output[i] = audio[i] + delayed_sample * wet
+        delay_buffer[1:] = delay_buffer[:-1]
+        delay_buffer[0] = audio[i] + delayed_sample * feedback
+    return output
+
+def bench_delay(args):
+    """Delay runtime as input length and delay time grow"""
+    processor = AutoTuneProcessor()
+    sr = args.sample_rate
+    rng = np.random.default_rng(0)
+
+    print(f"{'length (s)':>10} {'delay (ms)':>10} {'engine (ms)':>12} {'legacy (ms)':>12}")
+    for duration in (1, 10, 60, 180):
+        audio = rng.standard_normal(int(duration * sr)).astype(np.float32)
+        for delay_ms in (50, 120, 200, 500):
+            engine = _time_call(processor._apply_delay, audio, sr, delay_ms / 1000.0, 0.3, 0.3)
+            legacy = ''
+            # The legacy loop is O(N*D); only time it where it finishes in seconds
+            if args.legacy and duration <= 1:
+                legacy = f"{_time_call(_legacy_delay, audio, sr, delay_ms / 1000.0, 0.3, 0.3, repeat=1) * 1000:.1f}"
+            print(f"{duration:>10} {delay_ms:>10} {engine * 1000:>12.2f} {legacy:>12}")
+
+def _legacy_autotune(audio, sr, strength):
+    """The original analysis plus one global pitch_shift, kept for comparison"""
+    pitches, magnitudes = librosa.piptrack(y=audio, sr=sr, threshold=0.1)
+    pitch = pitches[magnitudes.argmax(axis=0), np.arange(pitches.shape[1])]
+    avg_pitch = np.mean(pitch[pitch > 0])
+    shift_semitones = (np.rint(12 * np.log2(avg_pitch / 440.0)) - 12 * np.log2(avg_pitch / 440.0)) * strength
+    return librosa.effects.pitch_shift(y=audio, sr=sr, n_steps=shift_semitones, bins_per_octave=12)
+
+def bench_autotune(args):
+    """Frame-wise pitch correction throughput on a vibrato tone"""
+    processor = AutoTuneProcessor()
+    sr = args.sample_rate
+
+    print(f"{'length (s)':>10} {'engine (ms)':>12} {'realtime x':>11} {'legacy (ms)':>12}")
+    for duration in (1, 10, 60, 180):
+        t = np.arange(int(duration * sr)) / sr
+        # 445 Hz with a 5 Hz, 30 cent vibrato so every frame needs its own correction
+        frequency = 445.0 * 2 ** (0.3 / 12 * np.sin(2 * np.pi * 5 * t))
+        audio = (0.5 * np.sin(2 * np.pi * np.cumsum(frequency) / sr)).astype(np.float32)
+        repeat = 3 if duration <= 10 else 1
+        engine = _time_call(processor._apply_autotune, audio, sr, 0.85, repeat=repeat)
+        legacy = ''
+        if args.legacy:
+            legacy = f"{_time_call(_legacy_autotune, audio, sr, 0.85, repeat=repeat) * 1000:.1f}"
+        print(f"{duration:>10} {engine * 1000:>12.1f} {duration / engine:>11.1f} {legacy:>12}")
+
+def bench_quantize(args):
+    """Note quantization of whole pitch tracks"""
+    processor = AutoTuneProcessor()
+    rng = np.random.default_rng(0)
+    note_freqs = list(processor.note_frequencies.values())
+
+    print(f"{'frames':>8} {'engine (us)':>12} {'legacy (ms)':>12}")
+    for n_frames in (1000, 10000, 50000):
+        pitches = rng.uniform(80.0, 1200.0, n_frames)
+        engine = _time_call(processor._quantize_pitch, pitches, 'A', 'minor')
+        legacy = ''
+        if args.legacy:
+            scan = lambda: [min(note_freqs, key=lambda x: abs(x - f)) for f in pitches]
+            legacy = f"{_time_call(scan, repeat=1) * 1000:.1f}"
+        print(f"{n_frames:>8} {engine * 1e6:>12.1f} {legacy:>12}")
+
+def _unfused_chain(processor, audio, sr, effects):
+    """The pre-fusion chain: librosa pitch_shift, then auto-tune, reverb and delay with copies"""
+    processed = audio.copy()
+    if effects.get('pitch_shift', 0) != 0:
+        processed = librosa.effects.pitch_shift(y=processed, sr=sr, n_steps=effects['pitch_shift'])
+    if effects.get('autotune_strength', 0) > 0:
+        processed = processor._apply_autotune(processed, sr, effects['autotune_strength'] / 100.0)
+    if effects.get('reverb_amount', 0) > 0:
+        processed = processor._apply_reverb(processed, sr, effects['reverb_amount'] / 100.0)
+    if effects.get('delay_time', 0) > 0:
+        processed = processor._apply_delay(processed, sr, effects['delay_time'] / 1000.0, 0.3, 0.3)
+    return processed / np.max(np.abs(processed)) * 0.95
+
+def bench_chain(args):
+    """Full preset latency, fused chain against the stage-by-stage chain"""
+    processor = AutoTuneProcessor()
+    presets = app.test_client().get('/presets').get_json()
+    sr = args.sample_rate
+    duration = 30
+    t = np.arange(duration * sr) / sr
+    audio = (0.5 * np.sin(2 * np.pi * 445.0 * t)).astype(np.float32)
+
+    print(f"{duration} s tone at {sr} Hz")
+    print(f"{'preset':>8} {'fused (ms)':>11} {'unfused (ms)':>13} {'speedup':>8}")
+    for name, preset in presets.items():
+        fused = _time_call(processor.process_audio, audio, sr, preset['effects'])
+        unfused = _time_call(_unfused_chain, processor, audio, sr, preset['effects'])
+        print(f"{name:>8} {fused * 1000:>11.1f} {unfused * 1000:>13.1f} {unfused / fused:>7.1f}x")
+
+def _legacy_reverb(audio, sr, amount):
+    """The original five-tap echo reverb, kept for comparison"""
+    delay_samples = int(0.03 * sr)
+    reverb_audio = audio.copy()
+    for i in range(1, 6):
+        delayed = np.zeros_like(audio)
+        delayed[delay_samples * i:] = audio[:-delay_samples * i] * (0.6 ** i) * amount
+        reverb_audio += delayed
+    return reverb_audio
+
+def bench_reverb(args):
+    """Convolution reverb runtime by length and room size"""
+    processor = AutoTuneProcessor()
+    sr = args.sample_rate
+    rng = np.random.default_rng(0)
+
+    print(f"{'length (s)':>10} {'room':>5} {'first (ms)':>11} {'cached (ms)':>12} {'legacy (ms)':>12}")
+    for duration in (1, 10, 60, 180):
+        audio = (0.1 * rng.standard_normal(int(duration * sr))).astype(np.float32)
+        for room_size in (0.2, 0.5, 0.9):
+            # First call pays for building the IR spectrum, later ones hit the cache
+            reverb_impulse_response.cache_clear()
+            reverb_ir_spectrum.cache_clear()
+            first = _time_call(processor._apply_reverb, audio, sr, 0.4, room_size, repeat=1)
+            cached = _time_call(processor._apply_reverb, audio, sr, 0.4, room_size)
+            legacy = ''
+            if args.legacy:
+                legacy = f"{_time_call(_legacy_reverb, audio, sr, 0.4) * 1000:.1f}"
+            print(f"{duration:>10} {room_size:>5} {first * 1000:>11.1f} {cached * 1000:>12.1f} {legacy:>12}")
+
+def _tone_blocks(duration, sr, block_size):
+    """Yield a long test tone block by block without ever holding all of it"""
+    for start in range(0, int(duration * sr), block_size):
+        t = np.arange(start, min(start + block_size, int(duration * sr))) / sr
+        yield (0.5 * np.sin(2 * np.pi * 445.0 * t)).astype(np.float32)
+
+def _render_stream(processor, sr, effects, duration, block_size=65536):
+    stream = AutoTuneStream(processor, sr, effects)
+    for block in _tone_blocks(duration, sr, block_size):
+        stream.process(block)
+    stream.flush()
+
+def _render_offline(processor, sr, effects, duration):
+    audio = np.concatenate(list(_tone_blocks(duration, sr, 65536)))
+    processor.process_audio(audio, sr, effects)
+
+def bench_stream(args):
+    """Peak memory and time of block-wise rendering against whole-file rendering"""
+    processor = AutoTuneProcessor()
+    effects = app.test_client().get('/presets').get_json()['tpain']['effects']
+    sr = args.sample_rate
+
+    print(f"{'length (s)':>10} {'stream (MB)':>12} {'offline (MB)':>13} {'stream (ms)':>12} {'offline (ms)':>13}")
+    for duration in (10, 60, 180):
+        stream_peak = _peak_memory(_render_stream, processor, sr, effects, duration)
+        offline_peak = _peak_memory(_render_offline, processor, sr, effects, duration)
+        stream_time = _time_call(_render_stream, processor, sr, effects, duration, repeat=1)
+        offline_time = _time_call(_render_offline, processor, sr, effects, duration, repeat=1)
+        print(f"{duration:>10} {stream_peak / 2**20:>12.1f} {offline_peak / 2**20:>13.1f} "
+              f"{stream_time * 1000:>12.0f} {offline_time * 1000:>13.0f}")
+
+def bench_jobs(args):
+    """Render throughput of the job scheduler as worker processes are added"""
+    effects = app.test_client().get('/presets').get_json()['tpain']['effects']
+    sr = args.sample_rate
+    t = np.arange(10 * sr) / sr
+    take = io.BytesIO()
+    sf.write(take, 0.5 * np.sin(2 * np.pi * 445.0 * t), sr, format='WAV')
+    n_jobs = 8
+
+    print(f"{n_jobs} renders of a 10 s take, {os.cpu_count()} cores")
+    print(f"{'workers':>8} {'wall (s)':>9} {'renders/s':>10}")
+    for workers in sorted({1, 2, os.cpu_count() or 1}):
+        scheduler = JobScheduler(max_workers=workers, max_pending=n_jobs)
+        try:
+            # Warm every worker up so process start and imports are not timed
+            for job_id in [scheduler.submit(render_job, take.getvalue(), '.wav', effects) for _ in range(workers)]:
+                scheduler.wait(job_id)
+            start = time.perf_counter()
+            for job_id in [scheduler.submit(render_job, take.getvalue(), '.wav', effects) for _ in range(n_jobs)]:
+                scheduler.wait(job_id)
+            wall = time.perf_counter() - start
+        finally:
+            scheduler.shutdown()
+        print(f"{workers:>8} {wall:>9.2f} {n_jobs / wall:>10.2f}")
+
+def bench_cache(args):
+    """Latency of a render against the same request served from the result cache"""
+    import app as app_module
+    effects = app.test_client().get('/presets').get_json()['kanye']['effects']
+    query = '&'.join(f"{name}={value}" for name, value in effects.items())
+    sr = args.sample_rate
+    client = app.test_client()
+
+    print(f"{'length (s)':>10} {'miss (ms)':>10} {'hit (ms)':>9}")
+    for duration in (10, 60, 180):
+        t = np.arange(duration * sr) / sr
+        take = io.BytesIO()
+        sf.write(take, 0.5 * np.sin(2 * np.pi * 445.0 * t), sr, format='WAV')
+        # A fresh memory-only cache so every length starts with a miss
+        app_module.result_cache = ResultCache(memory_budget=2**30)
+        miss = _time_call(client.post, f"/process-raw?{query}", data=take.getvalue(), repeat=1)
+        hit = _time_call(client.post, f"/process-raw?{query}", data=take.getvalue())
+        print(f"{duration:>10} {miss * 1000:>10.0f} {hit * 1000:>9.1f}")
+
+def bench_sessions(args):
+    """Render latency in an analysis session as different sliders are moved"""
+    effects = dict(app.test_client().get('/presets').get_json()['kanye']['effects'])
+    sr = args.sample_rate
+    client = app.test_client()
+    t = np.arange(60 * sr) / sr
+    take = io.BytesIO()
+    sf.write(take, 0.5 * np.sin(2 * np.pi * 445.0 * t), sr, format='WAV')
+    take.seek(0)
+
+    start = time.perf_counter()
+    session_url = client.post('/sessions', data={'audio': (take, 'take.wav')}).headers['Location']
+    print(f"60 s take, session created in {(time.perf_counter() - start) * 1000:.0f} ms")
+    print(f"{'render':>16} {'time (ms)':>10}")
+    steps = [('first', {}), ('reverb tweak', {'reverb_amount': 55}), ('delay tweak', {'delay_time': 250}),
+             ('strength tweak', {'autotune_strength': 60}), ('pitch tweak', {'pitch_shift': 3})]
+    for name, change in steps:
+        effects.update(change)
+        elapsed = _time_call(client.post, f"{session_url}/render", json={'effects': effects}, repeat=1)
+        print(f"{name:>16} {elapsed * 1000:>10.0f}")
+
+def bench_realtime(args):
+    """Per-frame processing time of the realtime renderer against the frame deadline"""
+    import app as app_module
+    processor = app_module.realtime_processor
+    sr = args.sample_rate
+    t = np.arange(10 * sr) / sr
+    frequency = 445.0 * 2 ** (0.3 / 12 * np.sin(2 * np.pi * 5 * t))
+    audio = (0.5 * np.sin(2 * np.pi * np.cumsum(frequency) / sr)).astype(np.float32)
+
+    print(f"{'preset':>8} {'frame':>6} {'deadline':>9} {'mean (ms)':>10} {'p99 (ms)':>9} {'max (ms)':>9} "
+          f"{'late':>5} {'latency (ms)':>13}")
+    for name, preset in app.test_client().get('/presets').get_json().items():
+        for frame_size in (256, 512, 1024):
+            live = AutoTuneRealtime(processor, sr, preset['effects'], frame_size)
+            times = []
+            for start in range(0, len(audio) - frame_size + 1, frame_size):
+                begin = time.perf_counter()
+                live.process(audio[start:start + frame_size])
+                times.append(time.perf_counter() - begin)
+            # The first frames pay for building the IR partitions
+            times = np.array(times[10:]) * 1000
+            deadline = frame_size / sr * 1000
+            print(f"{name:>8} {frame_size:>6} {deadline:>8.1f} {times.mean():>10.2f} "
+                  f"{np.percentile(times, 99):>9.2f} {times.max():>9.2f} {np.sum(times > deadline):>5} "
+                  f"{live.latency_ms:>13.1f}")
+
+def bench_pitch(args):
+    """Accuracy and time of the YIN and piptrack pitch detectors"""
+    processor = AutoTuneProcessor()
+    sr = args.sample_rate
+    n = 4 * sr
+    frequency = 100.0 * 10 ** (np.arange(n) / n)
+    phase = 2 * np.pi * np.cumsum(frequency) / sr
+    sweep = sum(0.5 / k * np.sin(k * phase) for k in range(1, 6)).astype(np.float32)
+    expected = frequency[np.minimum(np.arange(1 + n // processor.hop_length) * processor.hop_length, n - 1)]
+
+    def yin(audio):
+        return processor._yin_track(audio, sr)[0]
+
+    def piptrack(audio):
+        stft = librosa.stft(audio, n_fft=processor.n_fft, hop_length=processor.hop_length)
+        return processor._pitch_track(np.abs(stft), sr)
+
+    print(f"{'detector':>10} {'time (ms)':>10} {'median (cents)':>15} {'p95 (cents)':>12} {'voiced':>7}")
+    for name, detect in (('yin', yin), ('piptrack', piptrack)):
+        f0 = detect(sweep)[:len(expected)]
+        voiced = f0 > 0
+        cents = 1200 * np.abs(np.log2(f0[voiced] / expected[:len(f0)][voiced]))
+        elapsed = _time_call(detect, sweep)
+        print(f"{name:>10} {elapsed * 1000:>10.1f} {np.median(cents):>15.1f} "
+              f"{np.percentile(cents, 95):>12.1f} {voiced.mean():>7.0%}")
+
+def bench_stages(args):
+    """Time and peak memory of every effect stage and the full chain over the synthetic corpus"""
+    processor = AutoTuneProcessor()
+    effects = PRESETS['tpain']['effects']
+    stages = [
+        ('pitch_shift', lambda audio, sr: processor._apply_pitch_shift(audio, sr, effects['pitch_shift'])),
+        ('autotune', lambda audio, sr: processor._apply_autotune(audio, sr, effects['autotune_strength'] / 100.0)),
+        ('reverb', lambda audio, sr: processor._apply_reverb(audio, sr, effects['reverb_amount'] / 100.0)),
+        ('delay', lambda audio, sr: processor._apply_delay(audio, sr, effects['delay_time'] / 1000.0, 0.3, 0.2)),
+        ('chain', lambda audio, sr: processor.process_audio(audio, sr, effects)),
+    ]
+
+    records = []
+    print(f"{'signal':>6} {'length (s)':>10} {'rate':>6} {'stage':>12} {'time (ms)':>10} {'realtime x':>11} {'peak (MB)':>10}")
+    for kind, duration, sr in _corpus(args):
+        audio = synthetic_vocal(kind, duration, sr)
+        for name, stage in stages:
+            record = {"case": name, "signal": kind, "length_s": duration, "sample_rate": sr,
+                      **_measure(stage, audio, sr, repeat=3 if duration <= 10 else 1)}
+            records.append(record)
+            print(f"{kind:>6} {duration:>10} {sr:>6} {name:>12} {record['seconds'] * 1000:>10.1f} "
+                  f"{duration / record['seconds']:>11.1f} {record['peak_bytes'] / 2**20:>10.1f}")
+    return records
+
+def bench_endpoints(args):
+    """Request latency of /upload and /process-base64 through the Flask test client"""
+    import app as app_module
+    effects = PRESETS['kanye']['effects']
+    client = app.test_client()
+    # Memory budget 0 stores nothing, so every request renders
+    app_module.result_cache = ResultCache(memory_budget=0)
+    app_module.logger.setLevel(logging.WARNING)
+
+    def upload(wav_bytes):
+        response = client.post('/upload', data={'audio': (io.BytesIO(wav_bytes), 'take.wav'), 'effects': json.dumps(effects)})
+        assert response.status_code == 200, response.get_json()
+
+    def process_base64(wav_bytes):
+        response = client.post('/process-base64', json={'audio_data': base64.b64encode(wav_bytes).decode(), 'effects': effects})
+        assert response.status_code == 200, response.get_json()
+
+    # Start the worker pool so the first /upload does not time process start
+    warmup = io.BytesIO()
+    sf.write(warmup, synthetic_vocal('sine', 0.5, 22050), 22050, format='WAV')
+    upload(warmup.getvalue())
+
+    records = []
+    print(f"{'signal':>6} {'length (s)':>10} {'rate':>6} {'endpoint':>16} {'time (ms)':>10} {'peak (MB)':>10}")
+    for kind, duration, sr in _corpus(args):
+        take = io.BytesIO()
+        sf.write(take, synthetic_vocal(kind, duration, sr), sr, format='WAV', subtype='PCM_16')
+        for name, call in (('/upload', upload), ('/process-base64', process_base64)):
+            # /upload renders in a worker process, so its peak is only the request handling
+            record = {"case": name, "signal": kind, "length_s": duration, "sample_rate": sr,
+                      **_measure(call, take.getvalue(), repeat=3 if duration <= 10 else 1)}
+            records.append(record)
+            print(f"{kind:>6} {duration:>10} {sr:>6} {name:>16} {record['seconds'] * 1000:>10.1f} "
+                  f"{record['peak_bytes'] / 2**20:>10.1f}")
+    app_module.scheduler.shutdown()
+    return records
+
+def bench_metrics(args):
+    """Overhead of the stage instrumentation, disabled, enabled and tracing memory"""
+    import app as app_module
+    processor = AutoTuneProcessor()
+    sr = args.sample_rate
+    audio = synthetic_vocal('sine', 10, sr)
+    effects = PRESETS['kanye']['effects']
+    original = app_module.metrics
+
+    print(f"{'metrics':>10} {'stage call (us)':>16} {'10 s chain (ms)':>16}")
+    for name, registry in (('disabled', Metrics(enabled=False)), ('enabled', Metrics()),
+                           ('memory', Metrics(trace_memory=True))):
+        app_module.metrics = registry
+        if registry.trace_memory:
+            tracemalloc.start()
+        try:
+            def empty_stages():
+                for _ in range(10000):
+                    with registry.stage('noop', 1, sr):
+                        pass
+            per_call = _time_call(empty_stages) / 10000
+            chain = _time_call(processor.process_audio, audio, sr, effects)
+        finally:
+            if registry.trace_memory:
+                tracemalloc.stop()
+            app_module.metrics = original
+        print(f"{name:>10} {per_call * 1e6:>16.2f} {chain * 1000:>16.1f}")
+
+def bench_memory(args):
+    """Peak memory of the chain against the size of its input"""
+    processor = AutoTuneProcessor()
+    sr = args.sample_rate
+    audio = synthetic_vocal('sine', 60, sr)
+    chains = {'reverb+delay': {'reverb_amount': 40, 'delay_time': 120}}
+    chains.update((name, preset['effects']) for name, preset in PRESETS.items())
+    processor.process_audio(audio[:sr], sr, PRESETS['kanye']['effects'])
+
+    print(f"60 s take at {sr} Hz: {audio.nbytes / 2**20:.1f} MB as float32")
+    print(f"{'chain':>13} {'input':>8} {'peak (MB)':>10} {'x float32 input':>16}")
+    for name, effects in chains.items():
+        for dtype in (np.float32, np.float64):
+            peak = _peak_memory(processor.process_audio, audio.astype(dtype), sr, effects)
+            print(f"{name:>13} {np.dtype(dtype).name:>8} {peak / 2**20:>10.1f} {peak / audio.nbytes:>16.2f}")
+
+def bench_channels(args):
+    """Stereo against mono at 48 kHz, with pitch analysed at the native rate and at 16 kHz"""
+    processor = AutoTuneProcessor()
+    sr = 48000
+    duration = 30
+    mono = synthetic_vocal('sine', duration, sr)
+    stereo = np.stack([mono, 0.8 * synthetic_vocal('sine', duration, sr, seed=1)])
+    effects = PRESETS['tpain']['effects']
+    processor.process_audio(stereo[:, :sr], sr, effects)
+
+    records = []
+    print(f"{duration} s takes at {sr} Hz, {effects}")
+    print(f"{'analysis':>9} {'mono (ms)':>10} {'stereo (ms)':>12} {'stereo/mono':>12}")
+    for analysis_rate in (0, 16000):
+        config = dict(effects, analysis_rate=analysis_rate)
+        times = {}
+        for name, audio in (('mono', mono), ('stereo', stereo)):
+            record = {"case": f"{name}@{analysis_rate or 'native'}", "signal": 'sine', "length_s": duration,
+                      "sample_rate": sr, **_measure(processor.process_audio, audio, sr, config, repeat=2)}
+            records.append(record)
+            times[name] = record['seconds']
+        print(f"{analysis_rate or 'native':>9} {times['mono'] * 1000:>10.1f} {times['stereo'] * 1000:>12.1f} "
+              f"{times['stereo'] / times['mono']:>12.2f}")
+    return records
+
+def bench_mixdown(args):
+    """Mixing a take over a memory-mapped beat against decoding the beat for every mix"""
+    sr = args.sample_rate
+    with tempfile.TemporaryDirectory() as folder:
+        os.makedirs(os.path.join(folder, 'beats'))
+        os.makedirs(os.path.join(folder, 'cache'))
+        beat_path = os.path.join(folder, 'beats', 'beat.flac')
+        beat = synthetic_vocal('noise', 240, 44100)
+        sf.write(beat_path, np.stack([beat, beat], axis=1), 44100)
+        library = BeatLibrary(os.path.join(folder, 'beats'), os.path.join(folder, 'cache'))
+        processor = AutoTuneProcessor(beats=library)
+        vocal = synthetic_vocal('sine', 30, sr)
+        effects = {'instrumental': 'beat', 'instrumental_gain': 30, 'instrumental_offset': 60000}
+
+        first = _time_call(library.pcm, 'beat', sr, repeat=1)
+        first += _time_call(library.key, 'beat', repeat=1)
+
+        def decode_and_mix():
+            with open(beat_path, 'rb') as f:
+                audio, beat_sr = decode_audio(f, '.flac', mono=False)
+            audio = librosa.resample(audio, orig_sr=beat_sr, target_sr=sr) if beat_sr != sr else audio
+            start = 60 * sr
+            return vocal + 0.3 * audio[:, start:start + len(vocal)]
+
+        print(f"4 min stereo beat, 30 s take at {sr} Hz")
+        print(f"{'first use (decode, resample, key)':>34} {first * 1000:>8.0f} ms")
+        print(f"{'mix from memory map':>34} {_time_call(processor.process_audio, vocal, sr, effects) * 1000:>8.1f} ms")
+        print(f"{'decode and mix':>34} {_time_call(decode_and_mix, repeat=1) * 1000:>8.1f} ms")
+
+def bench_uploads(args):
+    """Loading a take from the upload store's memory map against decoding it again"""
+    sr = args.sample_rate
+    take = io.BytesIO()
+    sf.write(take, synthetic_vocal('sine', 60, sr), sr, format='FLAC')
+    audio_bytes = take.getvalue()
+    with tempfile.TemporaryDirectory() as folder:
+        store = PcmStore(folder, budget=2**30)
+        first = _time_call(store.load, audio_bytes, '.flac', repeat=1)
+        decode = _measure(decode_audio, audio_bytes, '.flac')
+        mapped = _measure(store.load, audio_bytes, '.flac')
+    print(f"60 s FLAC take at {sr} Hz ({len(audio_bytes) / 2**20:.1f} MB)")
+    print(f"{'':>16} {'time (ms)':>10} {'private MB':>11}")
+    print(f"{'first load':>16} {first * 1000:>10.1f}")
+    print(f"{'decode':>16} {decode['seconds'] * 1000:>10.1f} {decode['peak_bytes'] / 2**20:>11.1f}")
+    print(f"{'memory-mapped':>16} {mapped['seconds'] * 1000:>10.1f} {mapped['peak_bytes'] / 2**20:>11.1f}")
+
+def bench_quality(args):
+    """Final against preview renders of a 3 minute take, whole and windowed"""
+    sr = args.sample_rate
+    processor = AutoTuneProcessor()
+    processor.warmup()
+    take = synthetic_vocal('sine', 180, sr)
+    effects = PRESETS['kanye']['effects']
+    final = _time_call(processor.process_audio, take, sr, effects)
+    print(f"180 s take at {sr} Hz, kanye preset; previews render at {processor.output_rate(sr, {'quality': 'preview'})} Hz")
+    print(f"{'':>22} {'time (ms)':>10} {'of final':>9}")
+    print(f"{'final':>22} {final * 1000:>10.1f} {1:>8.0%}")
+    for label, window in (('preview', {}), ('preview, 15 s window', {'preview_start': 60000, 'preview_duration': 15000})):
+        preview = _time_call(processor.process_audio, take, sr, {**effects, 'quality': 'preview', **window})
+        print(f"{label:>22} {preview * 1000:>10.1f} {preview / final:>8.1%}")
+
+def bench_presets(args):
+    """Per-render setup and 1 s renders of each preset, by name against its raw effects"""
+    sr = args.sample_rate
+    registry = PresetRegistry(PRESETS, os.path.join(tempfile.mkdtemp(), 'presets.json'))
+    processor = AutoTuneProcessor(presets=registry)
+    take = synthetic_vocal('sine', 1, sr)
+    loops = 2000
+    print(f"1 s take at {sr} Hz; setup is planning plus kernel lookups, averaged over {loops} renders")
+    print(f"{'':>8} {'raw setup (us)':>15} {'named setup (us)':>17} {'1st compile (ms)':>17} "
+          f"{'raw render (ms)':>16} {'named render (ms)':>18}")
+    for name, preset in PRESETS.items():
+        effects = preset['effects']
+        reverb_ir_spectrum.cache_clear()
+        start = time.perf_counter()
+        processor._preset_chain(name, sr)
+        compile_time = time.perf_counter() - start
+    
+        def raw_setup():
+            plan = processor._plan_chain(effects)
+            if 'reverb' in plan:
+                processor._reverb_kernel(sr, plan['reverb']['room_size'])
+    
+        raw = _time_call(lambda: [raw_setup() for _ in range(loops)]) / loops
+        named = _time_call(lambda: [processor._preset_chain(name, sr) for _ in range(loops)]) / loops
+        raw_render = _time_call(processor.process_audio, take, sr, effects)
+        named_render = _time_call(processor.process_audio, take, sr, {'preset': name})
+        print(f"{name:>8} {raw * 1e6:>15.1f} {named * 1e6:>17.1f} {compile_time * 1000:>17.2f} "
+              f"{raw_render * 1000:>16.1f} {named_render * 1000:>18.1f}")
+
+def bench_silence(args):
+    """Shift stage and full chain with and without skipping silence, over the synthetic corpus"""
+    processor = AutoTuneProcessor()
+    effects = PRESETS['tpain']['effects']
+    print(f"{'signal':>7} {'length (s)':>10} {'rate':>6} {'voiced':>7} {'shift (ms)':>11} {'skipping':>9} "
+          f"{'speedup':>8} {'chain (ms)':>11} {'skipping':>9} {'speedup':>8}")
+    for kind, duration, sr in _corpus(args):
+        audio = synthetic_vocal(kind, duration, sr)
+        voiced = sum(end - start for start, end in processor._voiced_segments(audio, sr)) / max(len(audio), 1)
+        repeat = 3 if duration <= 10 else 1
+        timings = {}
+        for skip in (False, True):
+            processor.skip_silence = skip
+            timings['shift', skip] = _time_call(processor._apply_shift, audio, sr, effects['pitch_shift'],
+                                                effects['autotune_strength'] / 100.0, repeat=repeat)
+            timings['chain', skip] = _time_call(processor.process_audio, audio, sr, effects, repeat=repeat)
+        print(f"{kind:>7} {duration:>10} {sr:>6} {voiced:>7.0%} "
+              f"{timings['shift', False] * 1000:>11.1f} {timings['shift', True] * 1000:>9.1f} "
+              f"{timings['shift', False] / timings['shift', True]:>7.2f}x "
+              f"{timings['chain', False] * 1000:>11.1f} {timings['chain', True] * 1000:>9.1f} "
+              f"{timings['chain', False] / timings['chain', True]:>7.2f}x")
+
+_STARTUP_SCRIPT = """
+import json, logging, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+logging.disable(logging.INFO)
+if sys.argv[1] == 'warm':
+    app.warm_up()
+ready = time.perf_counter()
+from benchmark import synthetic_vocal
+sr = int(sys.argv[2])
+take = synthetic_vocal('sine', 10, sr)
+renders = []
+for _ in range(2):
+    render_start = time.perf_counter()
+    app.processor.process_audio(take, sr, app.PRESETS['kanye']['effects'])
+    renders.append(time.perf_counter() - render_start)
+print(json.dumps({'import': imported - start, 'ready': ready - start, 'renders': renders}))
+"""
+
+def bench_startup(args):
+    """Import time, time to ready and first-request latency of a fresh worker, cold against warmed up"""
+    sr = args.sample_rate
+    folder = os.path.dirname(os.path.abspath(__file__))
+    print(f"Fresh interpreter per row, 10 s take with the kanye preset at {sr} Hz")
+    print(f"{'':>8} {'import (s)':>11} {'ready (s)':>10} {'1st render (ms)':>16} {'2nd render (ms)':>16}")
+    for mode in ('cold', 'warm'):
+        output = subprocess.run([sys.executable, '-c', _STARTUP_SCRIPT, mode, str(sr)], capture_output=True,
+                                text=True, cwd=folder, check=True).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:>8} {timings['import']:>11.2f} {timings['ready']:>10.2f} "
+              f"{timings['renders'][0] * 1000:>16.1f} {timings['renders'][1] * 1000:>16.1f}")
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare_reports(report, baseline, tolerance):
+    """Records of report that are slower or use more memory than baseline by more than tolerance
+
+    Records are matched on suite, case, signal, length and sample rate.
+    Returns a list of (record, baseline record) pairs.
+    """
+    def keyed(results):
+        return {(suite, record['case'], record['signal'], record['length_s'], record['sample_rate']): record
+                for suite, records in results.items() for record in records}
+
+    previous = keyed(baseline['results'])
+    regressions = []
+    for key, record in keyed(report['results']).items():
+        old = previous.get(key)
+        if old is not None and (record['seconds'] > old['seconds'] * (1 + tolerance) or
+                                record['peak_bytes'] > old['peak_bytes'] * (1 + tolerance)):
+            regressions.append((key, record, old))
+    return regressions
+
+SUITES = {
+    'delay': bench_delay,
+    'autotune': bench_autotune,
+    'quantize': bench_quantize,
+    'reverb': bench_reverb,
+    'chain': bench_chain,
+    'stream': bench_stream,
+    'jobs': bench_jobs,
+    'cache': bench_cache,
+    'sessions': bench_sessions,
+    'realtime': bench_realtime,
+    'pitch': bench_pitch,
+    'stages': bench_stages,
+    'endpoints': bench_endpoints,
+    'metrics': bench_metrics,
+    'memory': bench_memory,
+    'channels': bench_channels,
+    'mixdown': bench_mixdown,
+    'uploads': bench_uploads,
+    'quality': bench_quality,
+    'presets': bench_presets,
+    'silence': bench_silence,
+    'startup': bench_startup,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('suites', nargs='*', default=list(SUITES), choices=list(SUITES),
+                        help='benchmark suites to run (default: all)')
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    parser.add_argument('--legacy', action='store_true',
+                        help='also time the replaced implementations on short inputs')
+    parser.add_argument('--lengths', type=lambda value: [float(item) for item in value.split(',')],
+                        default=[1, 10, 60, 600], help='corpus lengths in seconds (default: 1,10,60,600)')
+    parser.add_argument('--rates', type=lambda value: [int(item) for item in value.split(',')],
+                        default=[22050, 44100, 48000], help='corpus sample rates (default: 22050,44100,48000)')
+    parser.add_argument('--signals', type=lambda value: value.split(','), default=['sine', 'sweep', 'noise', 'phrases'],
+                        help='corpus signals (default: sine,sweep,noise,phrases)')
+    parser.add_argument('--json', help='write the results of the corpus suites (stages, endpoints) to this file')
+    parser.add_argument('--compare', help='report from an earlier run; exit 1 on a regression against it')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='slowdown or memory growth counted as a regression (default: 0.2)')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.suites:
+        print(f"\n🎚️ {name}: {SUITES[name].__doc__}")
+        records = SUITES[name](args)
+        if records is not None:
+            results[name] = records
+
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "librosa": librosa.__version__,
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📁 Results: {args.json}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.tolerance)
+        print(f"\n📊 Against {args.compare} (commit {baseline.get('commit')}): {len(regressions)} regression(s)")
+        for (suite, case, signal, length, sr), record, old in regressions:
+            print(f"   {suite} {case} {signal} {length} s {sr} Hz: "
+                  f"{old['seconds'] * 1000:.1f} -> {record['seconds'] * 1000:.1f} ms, "
+                  f"{old['peak_bytes'] / 2**20:.1f} -> {record['peak_bytes'] / 2**20:.1f} MB")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
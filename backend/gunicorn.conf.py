@@ -0,0 +1,36 @@
+"""
+Gunicorn config for 808s & Mic Breaks Auto-Tune Backend
+Production serving on Linux and macOS: gunicorn -c gunicorn.conf.py app:app
+(on Windows, python serve.py runs waitress instead)
+"""
+
+import os
+
+# Worker processes. Each one has its own job pool, result cache tier in
+# memory, jobs and analysis sessions, so clients of /jobs and /sessions need
+# sticky routing once there is more than one
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+# Threads per worker: enough that requests beyond the render slots reach the
+# app and get a quick 503 instead of queueing unseen in the listen backlog
+worker_class = 'gthread'
+threads = int(os.environ.get('REQUEST_THREADS', 16))
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+timeout = 120  # a long take can render for a while on a busy core
+graceful_timeout = 30
+keepalive = 5
+
+# Split the cores between the workers, each job pool getting its worker's
+# share less the render slots that worker runs in request threads, and keep
+# BLAS, OpenMP and numba at one thread per render: the render slots and job
+# processes already fill the cores, and nested thread pools would only
+# oversubscribe them. Set here, before any worker imports numpy.
+render_slots = int(os.environ.get('RENDER_SLOTS', 2))
+os.environ.setdefault('JOB_WORKERS', str(max(1, (os.cpu_count() or 1) // workers - render_slots)))
+for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                 'VECLIB_MAXIMUM_THREADS', 'NUMBA_NUM_THREADS'):
+    os.environ.setdefault(variable, '1')
+
+def post_worker_init(worker):
+    # /health answers 503 until this has run, so traffic waits for it
+    import app
+    app.start_warmup()
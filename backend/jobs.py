@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Background render jobs for 808s & Mic Breaks Auto-Tune Backend
+Runs renders on a process pool so long takes neither hold a request thread
+nor share one core
+"""
+
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Progress queue of the worker process, set by the pool initializer
+_progress_queue = None
+
+class QueueFull(Exception):
+    """The scheduler already holds its maximum number of unfinished jobs"""
+
+def _init_worker(progress_queue, warmup=None):
+    global _progress_queue
+    _progress_queue = progress_queue
+    if warmup is not None:
+        warmup()
+
+def _started():
+    """No-op job that returns once a worker has run its initializer"""
+
+def report_progress(job_id, fraction):
+    """Publish a job's progress (0-1) from inside a worker; no-op elsewhere"""
+    if _progress_queue is not None:
+        _progress_queue.put(('progress', job_id, fraction))
+
+def report_metrics(observations):
+    """Hand metric observations made inside a worker to the scheduler's on_metrics; no-op elsewhere"""
+    if _progress_queue is not None and observations:
+        _progress_queue.put(('metrics', None, observations))
+
+class JobScheduler:
+    """Process-pool job queue with bounded depth, cancellation and result TTL
+
+    submit(func, *args) runs func(job_id, *args) in a worker process; func
+    must be picklable by reference (a module-level function). Workers call
+    report_progress to move a job from queued to running and update its
+    progress. Finished jobs keep their result for result_ttl seconds and are
+    then forgotten; past max_finished of them the oldest go first. Workers
+    call report_metrics to pass observations to on_metrics, which runs in
+    this process. A job can carry a tag, any value the caller wants back
+    alongside its result. warmup, if given, runs once in each worker as it
+    starts, before the worker takes a job.
+
+    Workers come from forkserver (spawn where there is none), never a plain
+    fork: forking a threaded server process can copy a held lock into the
+    child and deadlock it. So warmup must be picklable by reference too.
+    """
+
+    def __init__(self, max_workers=None, max_pending=32, result_ttl=600, on_metrics=None, warmup=None,
+                 max_finished=64):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.max_finished = max_finished
+        self.on_metrics = on_metrics
+        self.warmup = warmup
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self._context = multiprocessing.get_context(method)
+        self._jobs = {}
+        # Reentrant: cancelling a queued future runs _finish on this thread
+        self._lock = threading.RLock()
+        self._executor = None
+        self._progress_queue = None
+
+    def _pool(self):
+        """The process pool, started on first use or after a worker died"""
+        if self._executor is None:
+            if self._progress_queue is None:
+                self._progress_queue = self._context.Queue()
+                threading.Thread(target=self._drain_progress, daemon=True).start()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=self._context,
+                initializer=_init_worker,
+                initargs=(self._progress_queue, self.warmup)
+            )
+        return self._executor
+
+    def _drain_progress(self):
+        while True:
+            kind, job_id, payload = self._progress_queue.get()
+            if kind == 'metrics':
+                if self.on_metrics is not None:
+                    self.on_metrics(payload)
+                continue
+            fraction = payload
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None and job['status'] in ('queued', 'running'):
+                    job['status'] = 'running'
+                    job['progress'] = max(job['progress'], fraction)
+
+    def _finish(self, job_id, future, on_done=None):
+        if on_done is not None and not future.cancelled() and future.exception() is None:
+            on_done(future.result())
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['finished'] = time.monotonic()
+            if job['status'] == 'cancelled' or future.cancelled():
+                job['status'] = 'cancelled'
+            elif future.exception() is not None:
+                job['status'] = 'failed'
+                job['error'] = str(future.exception())
+            else:
+                job['status'] = 'done'
+                job['progress'] = 1.0
+                job['result'] = future.result()
+            self._expire()
+
+    def _expire(self):
+        """Forget finished jobs older than result_ttl, then the oldest past max_finished; caller holds the lock"""
+        cutoff = time.monotonic() - self.result_ttl
+        finished = sorted((job['finished'], job_id) for job_id, job in self._jobs.items()
+                          if job['finished'] is not None and not job['pinned'])
+        expired = sum(finished_at < cutoff for finished_at, _ in finished)
+        expired = max(expired, len(finished) - self.max_finished)
+        for _, job_id in finished[:expired]:
+            del self._jobs[job_id]
+
+    def start(self, timeout=None):
+        """Start every worker of the pool and wait until each has warmed up
+
+        The pool only starts processes as jobs arrive, so without this the
+        first jobs pay for starting and warming their workers.
+        """
+        with self._lock:
+            try:
+                futures = [self._pool().submit(_started) for _ in range(self.max_workers)]
+            except BrokenProcessPool:
+                self._executor = None
+                futures = [self._pool().submit(_started) for _ in range(self.max_workers)]
+        for future in futures:
+            future.result(timeout)
+
+    def pending(self):
+        """Number of queued and running jobs"""
+        with self._lock:
+            return sum(job['finished'] is None for job in self._jobs.values())
+
+    def submit(self, func, *args, on_done=None, tag=None, pin=False):
+        """Queue func(job_id, *args) and return the job id
+
+        on_done, if given, is called in this process with the result when the
+        job succeeds. A pinned job is kept past result_ttl and max_finished
+        until wait() or cancel() is called on it, so a caller that will wait
+        can't find it expired. Raises QueueFull when max_pending jobs are
+        already unfinished.
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            if sum(job['finished'] is None for job in self._jobs.values()) >= self.max_pending:
+                raise QueueFull(f"{self.max_pending} jobs already pending")
+            try:
+                future = self._pool().submit(func, job_id, *args)
+            except BrokenProcessPool:
+                # A worker died and took the pool with it; start a fresh one
+                self._executor = None
+                future = self._pool().submit(func, job_id, *args)
+            self._jobs[job_id] = {
+                'status': 'queued', 'progress': 0.0,
+                'finished': None, 'result': None, 'error': None, 'future': future, 'tag': tag,
+                'pinned': pin
+            }
+        future.add_done_callback(lambda future: self._finish(job_id, future, on_done))
+        return job_id
+
+    def completed(self, result, tag=None):
+        """Register a job that is already done, e.g. a render served from a cache"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            self._jobs[job_id] = {
+                'status': 'done', 'progress': 1.0,
+                'finished': time.monotonic(), 'result': result, 'error': None, 'future': None, 'tag': tag,
+                'pinned': False
+            }
+        return job_id
+
+    def status(self, job_id):
+        """Status, progress and error of a job, or None if unknown or expired"""
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {
+                'id': job_id,
+                'status': job['status'],
+                'progress': round(job['progress'], 3),
+                'error': job['error'],
+            }
+
+    def result(self, job_id):
+        """Result of a finished job, or None if it is not done"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job['result'] if job is not None else None
+
+    def tag(self, job_id):
+        """The tag a job was submitted with, or None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job['tag'] if job is not None else None
+    
+    def wait(self, job_id, timeout=None):
+        """Block until a job finishes, forget it and return its result
+
+        Raises the job's exception if it failed and CancelledError if it was
+        cancelled.
+        """
+        with self._lock:
+            future = self._jobs[job_id]['future']
+        try:
+            return future.result(timeout)
+        finally:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+
+    def cancel(self, job_id):
+        """Cancel a job; returns False if it is unknown or already finished
+
+        A queued job never starts. A running job cannot be interrupted inside
+        its worker, so it runs to the end and its result is discarded.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job['pinned'] = False
+            if job is None or job['finished'] is not None:
+                return False
+            job['status'] = 'cancelled'
+            job['future'].cancel()
+            return True
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
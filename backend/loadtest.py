@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Load test for 808s & Mic Breaks Auto-Tune Backend
+Sends concurrent renders to a running server and reports throughput and latency
+"""
+
+import argparse
+import io
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import numpy as np
+import soundfile as sf
+from concurrent.futures import ThreadPoolExecutor
+
+def synthetic_take(duration, sr, seed):
+    """WAV bytes of a vibrato tone; each seed gives a different take, so the result cache never answers"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sr)) / sr
+    frequency = rng.uniform(200, 400)
+    audio = 0.3 * np.sin(2 * np.pi * frequency * t + 2 * np.sin(2 * np.pi * 5 * t))
+    audio += 0.01 * rng.standard_normal(len(t))
+    take = io.BytesIO()
+    sf.write(take, audio.astype(np.float32), sr, format='WAV', subtype='PCM_16')
+    return take.getvalue()
+
+def _request(url, endpoint, take, effects):
+    """(status, seconds) of one render"""
+    if endpoint == 'upload':
+        boundary = uuid.uuid4().hex
+        body = (f'--{boundary}\r\nContent-Disposition: form-data; name="effects"\r\n\r\n{json.dumps(effects)}\r\n'
+                f'--{boundary}\r\nContent-Disposition: form-data; name="audio"; filename="take.wav"\r\n'
+                f'Content-Type: audio/wav\r\n\r\n').encode() + take + f'\r\n--{boundary}--\r\n'.encode()
+        request = urllib.request.Request(f'{url}/upload', data=body, method='POST',
+                                         headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    else:
+        request = urllib.request.Request(f'{url}/process-raw', data=take, method='POST',
+                                         headers={'Content-Type': 'audio/wav', 'X-Effects': json.dumps(effects)})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except OSError:
+        status = 0  # connection refused or reset
+    return status, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--endpoint', choices=['process-raw', 'upload'], default='process-raw',
+                        help='process-raw renders in request threads, upload on the job pool (default: process-raw)')
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds of audio per take (default: 5)')
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    parser.add_argument('--preset', default='kanye')
+    args = parser.parse_args()
+
+    with urllib.request.urlopen(f'{args.url}/presets', timeout=30) as response:
+        effects = json.load(response)[args.preset]['effects']
+    # Fresh seeds on every run, so a repeated run is not served from the cache
+    first_seed = time.time_ns()
+    takes = [synthetic_take(args.duration, args.sample_rate, first_seed + index) for index in range(args.requests)]
+
+    print(f"🎤 {args.requests} renders of {args.duration:g} s at {args.sample_rate} Hz, "
+          f"{args.concurrency} at a time, to {args.url}/{args.endpoint}")
+    results = []
+    lock = threading.Lock()
+
+    def send(take):
+        result = _request(args.url, args.endpoint, take, effects)
+        with lock:
+            results.append(result)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(send, takes))
+    wall = time.perf_counter() - start
+
+    ok = np.array([seconds for status, seconds in results if status == 200])
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    print(f"\n📊 {len(ok)}/{len(results)} ok in {wall:.1f} s: {len(ok) / wall:.2f} requests/s, "
+          f"{len(ok) * args.duration / wall:.1f}x realtime")
+    counts = ', '.join(f"{status or 'error'}: {count}" for status, count in sorted(statuses.items()))
+    print(f"   statuses: {counts}")
+    if len(ok):
+        p50, p95, p99 = np.percentile(ok, [50, 95, 99])
+        print(f"   latency of ok requests: p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, "
+              f"p99 {p99 * 1000:.0f} ms, max {ok.max() * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
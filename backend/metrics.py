@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Stage metrics for 808s & Mic Breaks Auto-Tune Backend
+Times every processing stage into Prometheus histograms and collects
+per-request timings for the Server-Timing header
+"""
+
+import time
+import threading
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+REALTIME_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BYTES_BUCKETS = tuple(4 ** n for n in range(8, 16))  # 64 KiB to 1 GiB
+
+# Observations of the current request or job, when something is collecting them
+_collected = contextvars.ContextVar('collected', default=None)
+# Set inside Metrics.muted(): stages run there record nothing
+_muted = contextvars.ContextVar('muted', default=False)
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label set"""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, value, **labels):
+        """Add one value; caller holds the registry lock"""
+        series = self._series.setdefault(tuple(sorted(labels.items())), [[0] * len(self.buckets), 0.0, 0])
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_label_text(labels + (('le', _number(bound)),))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_label_text(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_label_text(labels)} {total!r}")
+            lines.append(f"{self.name}_count{_label_text(labels)} {count}")
+        return lines
+
+class Counter:
+    """Monotonic total with one series per label set"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._series = {}
+
+    def inc(self, value=1.0, **labels):
+        """Add value; caller holds the registry lock"""
+        key = tuple(sorted(labels.items()))
+        self._series[key] = self._series.get(key, 0.0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, total in sorted(self._series.items()):
+            lines.append(f"{self.name}{_label_text(labels)} {total!r}")
+        return lines
+
+class Metrics:
+    """Registry of stage and request metrics
+
+    Wrap each stage in `with metrics.stage(name, samples, sr):`; a stage
+    that only learns its length inside the block sets 'samples' and 'sr' in
+    the dict the with statement yields. The time, audio length and realtime
+    factor go into histograms labelled by stage and, while collect() or
+    begin() is active in the current context, into that context's list of
+    observations. With trace_memory the bytes
+    allocated at peak during the stage are recorded as well; that needs
+    tracemalloc running, slows every allocation down and is only exact when
+    one request runs at a time. A disabled registry with nothing collecting,
+    or any stage inside muted(), skips all of it.
+    """
+
+    def __init__(self, enabled=True, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self._lock = threading.Lock()
+        self.stage_seconds = Histogram(
+            'autotune_stage_seconds', 'Time spent in each processing stage', SECONDS_BUCKETS)
+        self.stage_realtime = Histogram(
+            'autotune_stage_realtime_factor', 'Seconds of audio processed per second of stage time',
+            REALTIME_BUCKETS)
+        self.stage_audio = Counter(
+            'autotune_stage_audio_seconds_total', 'Seconds of audio that went through each stage')
+        self.stage_bytes = Histogram(
+            'autotune_stage_allocated_bytes', 'Peak bytes allocated during each stage (tracemalloc)',
+            BYTES_BUCKETS)
+        self.request_seconds = Histogram(
+            'autotune_request_seconds', 'Time to handle each request', SECONDS_BUCKETS)
+
+    @contextmanager
+    def stage(self, name, samples=0, sr=None):
+        collected = _collected.get()
+        audio = {'samples': samples, 'sr': sr}
+        if (not self.enabled and collected is None) or _muted.get():
+            yield audio
+            return
+
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield audio
+        finally:
+            seconds = time.perf_counter() - start
+            allocated = max(tracemalloc.get_traced_memory()[1] - before, 0) if tracing else None
+            observation = (name, seconds, audio['samples'] / audio['sr'] if audio['sr'] else 0.0, allocated)
+            self.merge([observation])
+            if collected is not None:
+                collected.append(observation)
+
+    def merge(self, observations):
+        """Record (stage, seconds, audio seconds, allocated bytes or None) tuples
+
+        Also how observations made in a worker process reach this registry.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            for name, seconds, audio_seconds, allocated in observations:
+                self.stage_seconds.observe(seconds, stage=name)
+                if audio_seconds > 0:
+                    self.stage_audio.inc(audio_seconds, stage=name)
+                    self.stage_realtime.observe(audio_seconds / max(seconds, 1e-9), stage=name)
+                if allocated is not None:
+                    self.stage_bytes.observe(allocated, stage=name)
+
+    def observe_request(self, endpoint, method, status, seconds):
+        if self.enabled:
+            with self._lock:
+                self.request_seconds.observe(seconds, endpoint=endpoint, method=method, status=status)
+
+    def begin(self):
+        """Start collecting this context's observations; returns a token for end()"""
+        return _collected.set([])
+
+    def end(self, token):
+        """Stop collecting and return what was observed since begin()"""
+        collected = _collected.get()
+        _collected.reset(token)
+        return collected
+
+    @contextmanager
+    def collect(self):
+        """Collect the observations made inside the block into the yielded list"""
+        token = self.begin()
+        try:
+            yield _collected.get()
+        finally:
+            self.end(token)
+
+    @contextmanager
+    def muted(self):
+        """Record nothing for the stages run inside the block, e.g. a warmup render"""
+        token = _muted.set(True)
+        try:
+            yield
+        finally:
+            _muted.reset(token)
+
+    def render(self, extra=()):
+        """Prometheus text exposition of every metric plus (name, type, help, value) extras"""
+        with self._lock:
+            lines = []
+            for metric in (self.stage_seconds, self.stage_realtime, self.stage_audio,
+                           self.stage_bytes, self.request_seconds):
+                lines.extend(metric.render())
+        for name, kind, help_text, value in extra:
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value!r}"])
+        return '\n'.join(lines) + '\n'
+
+def server_timing(observations, total=None):
+    """Server-Timing header value: each stage's summed time in ms, then the total"""
+    durations = {}
+    for name, seconds, _, _ in observations:
+        durations[name] = durations.get(name, 0.0) + seconds
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(entries)
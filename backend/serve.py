@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Production server for 808s & Mic Breaks Auto-Tune Backend
+Serves the app with waitress in one process, on any platform; on Linux and
+macOS gunicorn -c gunicorn.conf.py app:app runs several worker processes
+"""
+
+import argparse
+import os
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=16,
+                        help='request threads; renders beyond RENDER_SLOTS wait or get 503 (default: 16)')
+    args = parser.parse_args()
+
+    # One BLAS, OpenMP and numba thread per render, as in gunicorn.conf.py;
+    # set before app imports numpy
+    for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                     'VECLIB_MAXIMUM_THREADS', 'NUMBA_NUM_THREADS'):
+        os.environ.setdefault(variable, '1')
+
+    from waitress import serve
+    import app
+
+    print(f"🎤 Serving 808s & Mic Breaks at http://{args.host}:{args.port} with {args.threads} threads")
+    app.start_warmup()
+    serve(app.app, host=args.host, port=args.port, threads=args.threads)
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,46 @@ Test script for 808s & Mic Breaks Auto-Tune Backend
 Tests the audio processing functionality
 """
 
+import base64
+import functools
+import io
+import json
+import os
+import time
+import tempfile
+import zipfile
 import sys
+import subprocess
+import threading
+import pytest
 import numpy as np
 import librosa
 import soundfile as sf
-from app import AutoTuneProcessor
+from scipy.signal import fftconvolve, get_window
+from jobs import JobScheduler, QueueFull
+from metrics import Metrics
+from app import AnalysisSession, AutoTuneProcessor, AutoTuneRealtime, BeatLibrary, Overloaded, PcmStore, PresetRegistry, ProcessorPool, ResultCache, AutoTuneStream, PRESETS, app, decode_audio, hann_window, realtime_session, reverb_ir_spectrum, reverb_impulse_response, warm_up
+
+def _isolate_worker(folder):
+    import app as app_module
+    app_module.uploads = PcmStore(folder, 2**30)
+
+@pytest.fixture(autouse=True)
+def isolated_storage(monkeypatch, tmp_path_factory):
+    """Keep the uploads and renders a test's requests store out of the real folders
+
+    Job workers load takes through their own module-level store, so each test
+    gets a scheduler whose workers are pointed at its folder as they start.
+    """
+    storage = tmp_path_factory.mktemp('storage')
+    (storage / 'uploads').mkdir()
+    (storage / 'processed').mkdir()
+    monkeypatch.setattr('app.uploads', PcmStore(str(storage / 'uploads'), 2**30))
+    monkeypatch.setattr('app.result_cache', ResultCache(2**24, str(storage / 'processed'), 2**30))
+    scheduler = JobScheduler(max_workers=1, warmup=functools.partial(_isolate_worker, str(storage / 'uploads')))
+    monkeypatch.setattr('app.scheduler', scheduler)
+    yield
+    scheduler.shutdown()
 
 def test_audio_processing():
     """Test the auto-tune processor with synthetic audio"""
@@ -59,6 +94,999 @@ def test_audio_processing():
         print(f"❌ Test failed: {e}")
         return False
 
+def _reference_delay(audio, delay_samples, feedback, wet):
+    """Per-sample circular-buffer delay used as the ground truth for _apply_delay"""
+    line = np.zeros(delay_samples)
+    output = np.zeros_like(audio)
+    pos = 0
+    for i in range(len(audio)):
+        delayed_sample = line[pos]
+        output[i] = audio[i] + delayed_sample * wet
+        line[pos] = audio[i] + delayed_sample * feedback
+        pos = (pos + 1) % delay_samples
+    return output
+
+def test_delay_matches_reference():
+    """The vectorized delay must be sample-identical to the per-sample loop"""
+    rng = np.random.default_rng(0)
+    audio = rng.standard_normal(4000)
+    processor = AutoTuneProcessor()
+    
+    for delay_samples in (1, 7, 300, 2500, 3999):
+        expected = _reference_delay(audio, delay_samples, 0.3, 0.3)
+        processed = processor._apply_delay(audio, 1000, delay_samples / 1000.0, feedback=0.3, wet=0.3)
+        assert np.allclose(processed, expected, atol=1e-12), f"delay of {delay_samples} samples diverged"
+    
+    # Chunked and in place, the line still matches
+    processor.work_size = 64
+    for delay_samples in (7, 300):
+        expected = _reference_delay(audio, delay_samples, 0.3, 0.3)
+        buffer = audio.copy()
+        processed = processor._apply_delay(buffer, 1000, delay_samples / 1000.0, feedback=0.3, wet=0.3, in_place=True)
+        assert processed is buffer and np.allclose(processed, expected, atol=1e-12)
+
+def test_autotune_corrects_detuned_tone():
+    """A sharp A4 should come out on A4, frame by frame"""
+    sample_rate = 22050
+    t = np.arange(sample_rate) / sample_rate
+    audio_signal = (0.5 * np.sin(2 * np.pi * 452.0 * t)).astype(np.float32)
+    processor = AutoTuneProcessor()
+    
+    processed = processor._apply_autotune(audio_signal, sample_rate, strength=1.0, retune_speed=0.0)
+    assert len(processed) == len(audio_signal)
+    
+    pitch_track = processor._pitch_track(np.abs(librosa.stft(processed)), sample_rate)
+    assert abs(np.median(pitch_track[4:-4]) - 440.0) < 3.0
+
+def test_yin_tracks_sweep_and_reports_voicing():
+    """YIN follows a harmonic sweep within a few cents and leaves noise and silence unvoiced"""
+    sample_rate = 22050
+    processor = AutoTuneProcessor()
+    frequency = 100.0 * 10 ** (np.arange(sample_rate * 2) / (sample_rate * 2))
+    phase = 2 * np.pi * np.cumsum(frequency) / sample_rate
+    sweep = sum(0.5 / k * np.sin(k * phase) for k in range(1, 6)).astype(np.float32)
+    
+    f0, confidence = processor._yin_track(sweep, sample_rate)
+    assert len(f0) == 1 + len(sweep) // processor.hop_length
+    expected = frequency[np.minimum(np.arange(len(f0)) * processor.hop_length, len(sweep) - 1)]
+    cents = 1200 * np.abs(np.log2(f0[4:-4] / expected[4:-4]))
+    assert np.median(cents) < 10 and np.all(confidence[4:-4] > 0.8)
+    
+    noise = np.random.default_rng(0).standard_normal(sample_rate).astype(np.float32) * 0.1
+    for unvoiced in (noise, np.zeros(sample_rate, dtype=np.float32)):
+        f0, confidence = processor._yin_track(unvoiced, sample_rate)
+        assert np.all(f0 == 0) and np.all(confidence == 0)
+
+def test_autotune_with_yin_detector():
+    """pitch_detector='yin' corrects a sharp A4, offline and block by block alike"""
+    sample_rate = 22050
+    t = np.arange(sample_rate) / sample_rate
+    audio_signal = (0.5 * np.sin(2 * np.pi * 452.0 * t)).astype(np.float32)
+    processor = AutoTuneProcessor()
+    effects = {"autotune_strength": 100, "retune_speed": 0, "pitch_detector": "yin"}
+    
+    processed = processor.process_audio(audio_signal, sample_rate, effects)
+    f0, _ = processor._yin_track(processed, sample_rate)
+    assert abs(np.median(f0[4:-4]) - 440.0) < 3.0
+    
+    stream = AutoTuneStream(processor, sample_rate, effects, limit=False)
+    streamed = np.concatenate([stream.process(audio_signal[:10000]), stream.process(audio_signal[10000:]), stream.flush()])
+    f0, _ = processor._yin_track(streamed, sample_rate)
+    assert abs(np.median(f0[4:-4]) - 440.0) < 3.0
+
+def test_benchmark_corpus_and_regression_check():
+    """The benchmark corpus has the requested shape and the JSON comparison flags regressions"""
+    from benchmark import compare_reports, synthetic_vocal
+    
+    for kind in ('sine', 'sweep', 'noise'):
+        audio = synthetic_vocal(kind, 1.5, 48000)
+        assert audio.dtype == np.float32 and len(audio) == 72000
+        assert 0.1 < np.max(np.abs(audio)) <= 0.5
+    
+    record = {"case": "chain", "signal": "sine", "length_s": 10, "sample_rate": 44100, "seconds": 1.0, "peak_bytes": 100}
+    baseline = {"results": {"stages": [record]}}
+    assert compare_reports({"results": {"stages": [dict(record, seconds=1.1)]}}, baseline, 0.2) == []
+    assert len(compare_reports({"results": {"stages": [dict(record, seconds=1.5)]}}, baseline, 0.2)) == 1
+    assert len(compare_reports({"results": {"stages": [dict(record, peak_bytes=200)]}}, baseline, 0.2)) == 1
+
+def test_quantize_pitch_matches_scalar_lookup():
+    """Array quantization agrees with a brute-force nearest-note scan"""
+    processor = AutoTuneProcessor()
+    rng = np.random.default_rng(1)
+    frequencies = rng.uniform(60.0, 1500.0, 2000)
+    
+    for key, scale in (('C', 'chromatic'), ('A', 'minor'), ('Eb', 'major_pentatonic')):
+        notes = np.array(list(processor._get_note_frequencies(key, scale).values()))
+        expected = notes[np.argmin(np.abs(np.log2(notes[None, :] / frequencies[:, None])), axis=1)]
+        assert np.allclose(processor._quantize_pitch(frequencies, key, scale), expected)
+    
+    # Unvoiced frames pass through and scalar lookups still work
+    assert processor._quantize_pitch([0.0, 452.0])[0] == 0.0
+    assert abs(processor._find_nearest_note(452.0) - 440.0) < 1e-9
+    assert abs(processor._find_nearest_note(277.0, 'C', 'major') - 261.6256) < 1e-3
+
+def test_fused_shift_corrects_after_static_shift():
+    """pitch_shift + autotune in one pass lands on the note nearest the shifted pitch"""
+    sample_rate = 22050
+    t = np.arange(sample_rate) / sample_rate
+    audio_signal = (0.5 * np.sin(2 * np.pi * 430.0 * t)).astype(np.float32)
+    processor = AutoTuneProcessor()
+    
+    # 430 Hz up 2 semitones is ~482.7 Hz, whose nearest note is B4 (493.9 Hz)
+    processed = processor._apply_shift(audio_signal, sample_rate, semitones=2, strength=1.0, retune_speed=0.0)
+    pitch_track = processor._pitch_track(np.abs(librosa.stft(processed)), sample_rate)
+    assert abs(np.median(pitch_track[4:-4]) - 493.88) < 4.0
+    
+    # A chain with nothing to do must not touch the input
+    clear = {"pitch_shift": 0, "autotune_strength": 0, "reverb_amount": 0, "delay_time": 0}
+    assert processor._plan_chain(clear) == {}
+    assert processor._plan_chain({"autotune_strength": 50, "key": "bb", "scale": "minor"})['shift']['key'] == 'bb'
+    for bad in ({"pitch_shift": 3, "autotune_strength": 50, "scale": "dorian"}, {"key": "H"}, {"key": 7}):
+        with pytest.raises(ValueError):
+            processor._plan_chain(bad)
+    processed = processor.process_audio(audio_signal, sample_rate, clear)
+    assert processed is not audio_signal and np.array_equal(audio_signal, (0.5 * np.sin(2 * np.pi * 430.0 * t)).astype(np.float32))
+
+def test_reverb_matches_direct_convolution():
+    """Overlap-add reverb equals one big convolution, and reuses cached IR spectra"""
+    sample_rate = 8000
+    rng = np.random.default_rng(2)
+    audio_signal = (0.01 * rng.standard_normal(3 * sample_rate)).astype(np.float32)
+    processor = AutoTuneProcessor()
+    processor.reverb_block_size = 4096
+    
+    impulse_response = reverb_impulse_response(sample_rate, 0.3)
+    expected = audio_signal + 0.4 * fftconvolve(audio_signal, impulse_response)[:len(audio_signal)]
+    processed = processor._apply_reverb(audio_signal, sample_rate, amount=0.4, room_size=0.3)
+    assert np.allclose(processed, expected, atol=1e-5)
+    buffer = audio_signal.copy()
+    assert processor._apply_reverb(buffer, sample_rate, amount=0.4, room_size=0.3, in_place=True) is buffer
+    assert np.allclose(buffer, expected, atol=1e-5)
+    
+    hits = reverb_ir_spectrum.cache_info().hits
+    processor._apply_reverb(audio_signal, sample_rate, amount=0.4, room_size=0.3)
+    assert reverb_ir_spectrum.cache_info().hits == hits + 1
+
+def test_float32_chain_memory():
+    """The chain works in float32, matches librosa's ISTFT and copies the input at most once"""
+    import tracemalloc
+    sample_rate = 22050
+    t = np.arange(10 * sample_rate) / sample_rate
+    audio_signal = (0.5 * np.sin(2 * np.pi * 445.0 * t)).astype(np.float32)
+    processor = AutoTuneProcessor()
+    
+    stft = librosa.stft(audio_signal[:30000], n_fft=processor.n_fft, hop_length=processor.hop_length)
+    expected = librosa.istft(stft, n_fft=processor.n_fft, hop_length=processor.hop_length, length=30000)
+    assert np.allclose(processor._istft(stft, 30000), expected, atol=1e-6)
+    
+    processed = processor.process_audio(audio_signal.astype(np.float64), sample_rate,
+                                        {"pitch_shift": 2, "autotune_strength": 85})
+    assert processed.dtype == np.float32
+    
+    processor.process_audio(audio_signal[:sample_rate], sample_rate, {"pitch_shift": 2, "reverb_amount": 40})
+    # One output buffer (five with the STFT) plus chunk-sized work buffers
+    for effects, budget in (({"reverb_amount": 40, "delay_time": 120}, 1.0),
+                            ({"pitch_shift": 2, "autotune_strength": 85, "reverb_amount": 40, "delay_time": 120}, 5.0)):
+        tracemalloc.start()
+        try:
+            processor.process_audio(audio_signal, sample_rate, effects)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert peak < budget * audio_signal.nbytes + 4 * 2**20, f"{effects}: peak {peak / audio_signal.nbytes:.1f}x the input"
+
+def test_stream_matches_offline_chain():
+    """Rendering in odd-sized blocks gives the same audio as the whole-file stages"""
+    sample_rate = 22050
+    t = np.arange(3 * sample_rate) / sample_rate
+    audio_signal = (0.2 * np.sin(2 * np.pi * (445 + 20 * np.sin(2 * np.pi * t)) * t)).astype(np.float32)
+    effects = {"pitch_shift": 2, "autotune_strength": 85, "reverb_amount": 40, "delay_time": 120}
+    processor = AutoTuneProcessor()
+    
+    plan = processor._plan_chain(effects)
+    expected = processor._apply_shift(audio_signal, sample_rate, **plan['shift'])
+    expected = processor._apply_reverb(expected, sample_rate, **plan['reverb'])
+    expected = processor._apply_delay(expected, sample_rate, **plan['delay'])
+    
+    stream = AutoTuneStream(processor, sample_rate, effects, limit=False)
+    rng = np.random.default_rng(3)
+    blocks, start = [], 0
+    while start < len(audio_signal):
+        size = int(rng.integers(1, 5000))
+        blocks.append(stream.process(audio_signal[start:start + size]))
+        start += size
+    blocks.append(stream.flush())
+    streamed = np.concatenate(blocks)
+    
+    assert len(streamed) == len(audio_signal)
+    # FFT rounding can move a bin across a rounding boundary of the shifter,
+    # so compare energies rather than individual samples
+    error = np.sqrt(np.mean((streamed - expected) ** 2)) / np.sqrt(np.mean(expected ** 2))
+    assert error < 1e-2
+
+def test_process_stream_endpoint():
+    """/process-stream returns a complete WAV of the same length as the upload"""
+    sample_rate = 22050
+    t = np.arange(sample_rate * 2) / sample_rate
+    upload = io.BytesIO()
+    sf.write(upload, 0.5 * np.sin(2 * np.pi * 440.0 * t), sample_rate, format='WAV')
+    upload.seek(0)
+    
+    response = app.test_client().post('/process-stream', data={
+        'audio': (upload, 'take.wav'),
+        'effects': '{"pitch_shift": 2, "autotune_strength": 85, "reverb_amount": 40, "delay_time": 120}'
+    })
+    assert response.status_code == 200
+    processed, processed_rate = sf.read(io.BytesIO(response.data))
+    assert processed_rate == sample_rate and len(processed) == len(t)
+    assert 0 < np.max(np.abs(processed)) <= 0.95 + 1e-3
+
+def test_process_raw_endpoint():
+    """/process-raw takes the bytes as the body and answers with the WAV itself"""
+    sample_rate = 22050
+    t = np.arange(sample_rate) / sample_rate
+    upload = io.BytesIO()
+    sf.write(upload, 0.5 * np.sin(2 * np.pi * 440.0 * t), sample_rate, format='FLAC')
+    
+    client = app.test_client()
+    response = client.post('/process-raw?pitch_shift=2&autotune_strength=85&reverb_amount=40',
+                           data=upload.getvalue(), content_type='application/octet-stream')
+    assert response.status_code == 200 and response.mimetype == 'audio/wav'
+    processed, processed_rate = sf.read(io.BytesIO(response.data))
+    assert processed_rate == sample_rate and len(processed) == len(t)
+    assert 0 < np.max(np.abs(processed)) <= 0.95 + 1e-3
+    
+    response = client.post('/process-raw', data=upload.getvalue(),
+                           headers={'X-Effects': 'not json'})
+    assert response.status_code == 400
+
+def test_upload_decodes_in_memory(monkeypatch):
+    """/upload of a WAV never creates a temp file and returns the processed WAV"""
+    def no_temp_files(*args, **kwargs):
+        raise AssertionError("temp file created")
+    monkeypatch.setattr(tempfile, 'NamedTemporaryFile', no_temp_files)
+    
+    sample_rate = 22050
+    t = np.arange(sample_rate) / sample_rate
+    upload = io.BytesIO()
+    sf.write(upload, 0.5 * np.sin(2 * np.pi * 440.0 * t), sample_rate, format='WAV')
+    upload.seek(0)
+    
+    response = app.test_client().post('/upload', data={
+        'audio': (upload, 'take.wav'),
+        'effects': '{"pitch_shift": 2, "autotune_strength": 85, "reverb_amount": 40, "delay_time": 120}'
+    })
+    assert response.status_code == 200
+    processed, processed_rate = sf.read(io.BytesIO(response.data))
+    assert processed_rate == sample_rate and len(processed) == len(t)
+
+def test_job_api_round_trip():
+    """POST /jobs answers at once; the result is served once the job is done"""
+    sample_rate = 22050
+    t = np.arange(sample_rate) / sample_rate
+    upload = io.BytesIO()
+    sf.write(upload, 0.5 * np.sin(2 * np.pi * 440.0 * t), sample_rate, format='WAV')
+    upload.seek(0)
+    
+    client = app.test_client()
+    response = client.post('/jobs', data={
+        'audio': (upload, 'take.wav'),
+        'effects': '{"pitch_shift": 2, "autotune_strength": 85, "reverb_amount": 40, "delay_time": 120}'
+    })
+    assert response.status_code == 202
+    job_url = response.headers['Location']
+    
+    deadline = time.monotonic() + 60
+    while (status := client.get(job_url).get_json())['status'] in ('queued', 'running'):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert status['status'] == 'done' and status['progress'] == 1.0
+    
+    processed, processed_rate = sf.read(io.BytesIO(client.get(status['result']).data))
+    assert processed_rate == sample_rate and len(processed) == len(t)
+    assert client.get('/jobs/unknown').status_code == 404
+
+def _sleep_job(job_id, seconds):
+    time.sleep(seconds)
+    return seconds
+
+def test_scheduler_bounds_cancels_and_expires():
+    """Queue depth is enforced, queued jobs cancel and results expire"""
+    scheduler = JobScheduler(max_workers=1, max_pending=3, result_ttl=0.2)
+    try:
+        running = scheduler.submit(_sleep_job, 0.5)
+        scheduler.submit(_sleep_job, 0.0)
+        queued = scheduler.submit(_sleep_job, 0.0)
+        with pytest.raises(QueueFull):
+            scheduler.submit(_sleep_job, 0.0)
+        
+        # The pool hands one call beyond its workers to a process right away,
+        # so the third job is the one still waiting in the queue
+        assert scheduler.cancel(queued)
+        assert scheduler.status(queued)['status'] == 'cancelled'
+        
+        assert scheduler.wait(running) == 0.5
+        time.sleep(0.3)
+        assert scheduler.pending() == 0 and scheduler.status(queued) is None
+    finally:
+        scheduler.shutdown()
+    
+    # Past max_finished the oldest finished jobs go, whatever their age
+    scheduler = JobScheduler(max_workers=1, max_finished=2)
+    oldest, *newest = [scheduler.completed(index) for index in range(3)]
+    assert scheduler.status(oldest) is None
+    assert [scheduler.result(job_id) for job_id in newest] == [1, 2]
+    
+    # ...except pinned jobs, which stay until they are waited on
+    try:
+        pinned = [scheduler.submit(_sleep_job, 0.0, pin=True) for _ in range(4)]
+        while scheduler.pending():
+            time.sleep(0.01)
+        scheduler.completed(None)
+        assert [scheduler.wait(job_id) for job_id in pinned] == [0.0] * 4
+        assert scheduler.status(pinned[0]) is None
+    finally:
+        scheduler.shutdown()
+
+def test_result_cache_tiers_and_eviction(tmp_path):
+    """The cache evicts by size in both tiers and serves disk entries after a restart"""
+    plan = AutoTuneProcessor()._plan_chain({'pitch_shift': 2, 'delay_time': 0})
+    key = ResultCache.key(b'take', plan)
+    assert key == ResultCache.key(b'take', AutoTuneProcessor()._plan_chain({'pitch_shift': 2.0}))
+    assert key != ResultCache.key(b'take', plan, sr=44100)
+    
+    cache = ResultCache(memory_budget=250, folder=str(tmp_path), disk_budget=250)
+    assert cache.get(key) is None
+    cache.put(key, b'a' * 100)
+    cache.put('b' * 64, b'b' * 100)
+    assert cache.get(key) == b'a' * 100
+    cache.put('c' * 64, b'c' * 100)  # evicts 'b', the least recently used
+    assert cache.get('b' * 64) is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+    assert sorted(os.listdir(tmp_path)) == sorted([f"{key}.wav", f"{'c' * 64}.wav"])
+    
+    restarted = ResultCache(memory_budget=250, folder=str(tmp_path), disk_budget=250)
+    assert restarted.get(key) == b'a' * 100 and restarted.stats()['disk_hits'] == 1
+    
+    # Caches sharing the folder keep it to one budget between them
+    restarted.put('d' * 64, b'd' * 100)  # evicts 'c', which the other cache holds in memory
+    assert sorted(os.listdir(tmp_path)) == sorted([f"{key}.wav", f"{'d' * 64}.wav"])
+    assert cache.path('c' * 64) is None and cache.get('c' * 64) == b'c' * 100
+
+def test_repeated_render_is_served_from_cache(monkeypatch):
+    """A second identical /process-raw request is a cache hit with the same bytes, each hashing the upload once"""
+    import app as app_module
+    monkeypatch.setattr('app.result_cache', ResultCache(memory_budget=2**24))
+    keys = []
+    original_render_key = app_module.render_key
+    def render_key(audio_bytes, effects):
+        keys.append(1)
+        return original_render_key(audio_bytes, effects)
+    monkeypatch.setattr('app.render_key', render_key)
+    sample_rate = 22050
+    t = np.arange(sample_rate) / sample_rate
+    upload = io.BytesIO()
+    sf.write(upload, 0.5 * np.sin(2 * np.pi * 431.0 * t), sample_rate, format='WAV')
+    
+    client = app.test_client()
+    url = '/process-raw?pitch_shift=3&autotune_strength=70&reverb_amount=25&delay_time=90'
+    first = client.post(url, data=upload.getvalue())
+    second = client.post(url, data=upload.getvalue())
+    assert first.status_code == second.status_code == 200
+    assert second.data == first.data
+    assert client.get('/cache').get_json()['hits'] == 1
+    assert len(keys) == 2
+
+def test_stage_metrics_and_server_timing(monkeypatch, tmp_path):
+    """Every stage of a render shows up in /metrics and, when enabled, in Server-Timing"""
+    monkeypatch.setattr('app.result_cache', ResultCache(memory_budget=0))
+    monkeypatch.setattr('app.uploads', PcmStore(str(tmp_path), 2**30))
+    monkeypatch.setattr('app.SERVER_TIMING', True)
+    sample_rate = 22050
+    t = np.arange(sample_rate) / sample_rate
+    upload = io.BytesIO()
+    sf.write(upload, 0.5 * np.sin(2 * np.pi * 431.0 * t), sample_rate, format='WAV')
+    
+    client = app.test_client()
+    response = client.post('/process-raw?pitch_shift=3&autotune_strength=70&reverb_amount=25&delay_time=90',
+                           data=upload.getvalue())
+    assert response.status_code == 200
+    timings = dict(entry.split(';dur=') for entry in response.headers['Server-Timing'].split(', '))
+    assert set(timings) == {'queue', 'decode', 'segment', 'stft', 'piptrack', 'pitch_shift', 'reverb', 'delay', 'encode', 'total'}
+    assert sum(float(value) for name, value in timings.items() if name != 'total') <= float(timings['total'])
+    
+    exposition = client.get('/metrics').get_data(as_text=True)
+    for stage in ('decode', 'segment', 'stft', 'piptrack', 'pitch_shift', 'reverb', 'delay', 'encode'):
+        assert f'autotune_stage_seconds_bucket{{stage="{stage}",le="+Inf"}}' in exposition
+        assert f'autotune_stage_realtime_factor_count{{stage="{stage}"}}' in exposition
+    assert 'autotune_request_seconds_count{endpoint="process_raw_audio",method="POST",status="200"}' in exposition
+    
+    disabled = Metrics(enabled=False)
+    with disabled.stage('reverb', sample_rate, sample_rate):
+        pass
+    assert 'stage=' not in disabled.render()
+    with disabled.collect() as observations:
+        with disabled.stage('reverb', sample_rate, sample_rate):
+            pass
+    assert [name for name, *_ in observations] == ['reverb']
+
+def test_session_renders_reuse_analysis(monkeypatch):
+    """Session renders match one-off renders and reverb/delay tweaks skip the STFT"""
+    sample_rate = 22050
+    t = np.arange(sample_rate * 2) / sample_rate
+    tone = 0.5 * np.sin(2 * np.pi * 445.0 * t)
+    upload = io.BytesIO()
+    sf.write(upload, tone, sample_rate, format='WAV', subtype='FLOAT')
+    upload.seek(0)
+    
+    client = app.test_client()
+    response = client.post('/sessions', data={'audio': (upload, 'take.wav')})
+    assert response.status_code == 201
+    session_url = response.headers['Location']
+    render_url = f"{session_url}/render"
+    
+    stft_calls = []
+    stft = librosa.stft
+    monkeypatch.setattr(librosa, 'stft', lambda *args, **kwargs: stft_calls.append(1) or stft(*args, **kwargs))
+    
+    effects = {"pitch_shift": 2, "autotune_strength": 85, "reverb_amount": 40, "delay_time": 120}
+    for reverb_amount in (40, 10, 70):
+        effects['reverb_amount'] = reverb_amount
+        response = client.post(render_url, json={'effects': effects})
+        assert response.status_code == 200
+        rendered, _ = sf.read(io.BytesIO(response.data))
+        expected = AutoTuneProcessor().process_audio(tone.astype(np.float32), sample_rate, effects)
+        assert np.max(np.abs(rendered - expected)) < 1e-3
+    # One STFT for the session's first render and one per one-off reference
+    assert len(stft_calls) == 1 + 3
+    
+    assert client.delete(session_url).status_code == 200
+    assert client.post(render_url, json={'effects': effects}).status_code == 404
+
+def test_batch_endpoint_renders_every_pair(monkeypatch):
+    """/batch returns one WAV per (file, config) pair plus a throughput report"""
+    sample_rate = 22050
+    t = np.arange(sample_rate) / sample_rate
+    uploads = []
+    for name, frequency in (('first.wav', 440.0), ('second.flac', 330.0)):
+        upload = io.BytesIO()
+        sf.write(upload, 0.5 * np.sin(2 * np.pi * frequency * t), sample_rate,
+                 format=name.rsplit('.', 1)[1].upper())
+        upload.seek(0)
+        uploads.append((upload, name))
+    
+    response = app.test_client().post('/batch', data={
+        'audio': uploads,
+        'presets': 'kanye,robot',
+        'effects': '[{"pitch_shift": 1, "reverb_amount": 20}]'
+    })
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        expected = {f"{stem}/{config}.wav" for stem in ('first', 'second') for config in ('kanye', 'robot', 'custom1')}
+        assert set(zf.namelist()) == expected | {'report.json'}
+        processed, processed_rate = sf.read(io.BytesIO(zf.read('second/robot.wav')))
+        assert processed_rate == sample_rate and len(processed) == len(t)
+        report = json.loads(zf.read('report.json'))
+    assert report['files'] == 2 and report['renders'] == 6 and report['realtime_factor'] > 0
+    
+    assert app.test_client().post('/batch', data={
+        'audio': (io.BytesIO(b''), 'x.wav'), 'presets': 'nope'
+    }).status_code == 400
+    
+    import app as app_module
+    def takes():
+        takes = []
+        for name in ('first.wav', 'second.wav'):
+            take = io.BytesIO()
+            sf.write(take, 0.5 * np.sin(2 * np.pi * 440.0 * t), sample_rate, format='WAV')
+            take.seek(0)
+            takes.append((take, name))
+        return takes
+    
+    # The first file failing cancels the files still queued behind it
+    cancelled = []
+    def fail(job_id):
+        raise RuntimeError("render failed")
+    monkeypatch.setattr(app_module.scheduler, 'wait', fail)
+    monkeypatch.setattr(app_module.scheduler, 'cancel', cancelled.append)
+    response = app.test_client().post('/batch', data={'audio': takes(), 'presets': 'kanye'})
+    assert response.status_code == 500 and len(cancelled) == 1
+    
+    # A batch bigger than the queue could never run, so it isn't told to retry
+    monkeypatch.setattr(app_module.scheduler, 'max_pending', 1)
+    response = app.test_client().post('/batch', data={'audio': takes(), 'presets': 'kanye'})
+    assert response.status_code == 413 and 'Retry-After' not in response.headers
+    assert '1 files' in response.get_json()['error']
+
+def test_realtime_frames_match_stream_at_fixed_latency():
+    """Realtime frames equal the block stream's output delayed by the reported latency"""
+    sample_rate, frame_size = 44100, 512
+    processor = AutoTuneProcessor(n_fft=1024, hop_length=256)
+    t = np.arange(sample_rate // frame_size * frame_size) / sample_rate
+    tone = (0.5 * np.sin(2 * np.pi * 445.0 * t)).astype(np.float32)
+    effects = {"pitch_shift": 2, "autotune_strength": 85, "reverb_amount": 40, "delay_time": 120}
+    
+    live = AutoTuneRealtime(processor, sample_rate, effects, frame_size, limit=False)
+    frames = [live.process(tone[start:start + frame_size]) for start in range(0, len(tone), frame_size)]
+    assert all(len(frame) == frame_size for frame in frames)
+    assert live.latency_ms < 50
+    
+    stream = AutoTuneStream(processor, sample_rate, effects, limit=False)
+    reference = np.concatenate([stream.process(tone), stream.flush()])
+    rendered = np.concatenate(frames)
+    assert np.max(np.abs(rendered[:live.latency])) < 1e-6
+    assert np.max(np.abs(rendered[live.latency:] - reference[:len(tone) - live.latency])) < 1e-4
+    
+    with pytest.raises(ValueError):
+        live.process(tone[:100])
+
+def test_multichannel_chain_matches_per_channel_mono():
+    """Stereo reverb and delay equal the mono stages per channel (below the clip guard); the shift is shared"""
+    rng = np.random.default_rng(1)
+    stereo = (0.05 * rng.standard_normal((2, 30000))).astype(np.float32)
+    processor = AutoTuneProcessor()
+    processor.work_size = 4096
+    
+    reverb = processor._apply_reverb(stereo, 22050, 0.4, 0.6)
+    delay = processor._apply_delay(stereo, 22050, 0.05, feedback=0.4, wet=0.3)
+    for channel in range(2):
+        assert np.allclose(reverb[channel], processor._apply_reverb(stereo[channel], 22050, 0.4, 0.6), atol=1e-5)
+        assert np.allclose(delay[channel], processor._apply_delay(stereo[channel], 22050, 0.05, feedback=0.4, wet=0.3), atol=1e-5)
+    
+    # Both channels are shifted by the curve of their mid signal
+    t = np.arange(22050) / 22050
+    tone = (0.5 * np.sin(2 * np.pi * 452.0 * t)).astype(np.float32)
+    effects = {"autotune_strength": 100, "retune_speed": 0}
+    processed = processor.process_audio(np.stack([tone, 0.5 * tone]), 22050, effects)
+    assert processed.shape == (2, len(tone))
+    assert np.allclose(processed[1], 0.5 * processed[0], atol=1e-4)
+    f0, _ = processor._yin_track(processed[0], 22050)
+    assert abs(np.median(f0[4:-4]) - 440.0) < 3.0
+
+def test_analysis_rate_renders_at_native_rate():
+    """Pitch analysed at a lower rate still corrects a 48 kHz take, which keeps its rate"""
+    sample_rate = 48000
+    t = np.arange(sample_rate) / sample_rate
+    audio_signal = (0.5 * np.sin(2 * np.pi * 452.0 * t)).astype(np.float32)
+    processor = AutoTuneProcessor()
+    
+    for detector in ('piptrack', 'yin'):
+        effects = {"autotune_strength": 100, "retune_speed": 0, "pitch_detector": detector, "analysis_rate": 16000}
+        processed = processor.process_audio(audio_signal, sample_rate, effects)
+        assert len(processed) == len(audio_signal)
+        f0, _ = processor._yin_track(processed, sample_rate)
+        assert abs(np.median(f0[4:-4]) - 440.0) < 3.0, detector
+
+def test_stereo_upload_keeps_its_channels():
+    """keep_channels renders a stereo file as stereo; by default it is mixed down"""
+    sample_rate = 22050
+    t = np.arange(sample_rate) / sample_rate
+    left = 0.5 * np.sin(2 * np.pi * 440.0 * t)
+    upload = io.BytesIO()
+    sf.write(upload, np.stack([left, 0.25 * left], axis=1), sample_rate, format='WAV')
+    
+    client = app.test_client()
+    effects = {"pitch_shift": 2, "reverb_amount": 30, "keep_channels": True}
+    response = client.post('/process-raw', data=upload.getvalue(), headers={'X-Effects': json.dumps(effects)})
+    assert response.status_code == 200
+    processed, processed_rate = sf.read(io.BytesIO(response.data))
+    assert processed_rate == sample_rate and processed.shape == (len(t), 2)
+    # Each channel has its own phase vocoder, so compare level and shape
+    levels = np.sqrt(np.mean(processed ** 2, axis=0))
+    assert abs(levels[1] / levels[0] - 0.25) < 0.01
+    assert np.corrcoef(processed.T)[0, 1] > 0.999
+    
+    effects.pop('keep_channels')
+    response = client.post('/process-raw', data=upload.getvalue(), headers={'X-Effects': json.dumps(effects)})
+    processed, _ = sf.read(io.BytesIO(response.data))
+    assert processed.ndim == 1 and len(processed) == len(t)
+
+def _chord_beat(chords, sample_rate):
+    """A stereo beat of one-second chords, each a tuple of semitones from middle C"""
+    t = np.arange(sample_rate) / sample_rate
+    mono = np.concatenate([
+        sum(np.sin(2 * np.pi * 440.0 * 2 ** ((note - 9) / 12) * harmonic * t) / harmonic
+            for note in chord for harmonic in (1, 2, 3))
+        for chord in chords
+    ]) / 10
+    return np.stack([mono, 0.5 * mono], axis=1)
+
+def test_beat_library_maps_decoded_beats_and_detects_key(tmp_path, monkeypatch):
+    """Beats decode once into memory-mapped PCM per rate, with the key cached beside them"""
+    (tmp_path / 'beats').mkdir()
+    sf.write(tmp_path / 'beats' / 'minor-loop.wav', _chord_beat([(-3, 0, 4), (2, 5, 9), (4, 7, 11), (-3, 0, 4)], 44100), 44100)
+    library = BeatLibrary(str(tmp_path / 'beats'), str(tmp_path / 'cache'))
+    (tmp_path / 'cache').mkdir()
+    
+    assert library.ids() == ['minor-loop'] and not library.exists('../minor-loop')
+    native = library.pcm('minor-loop', 44100)
+    assert isinstance(native, np.memmap) and native.shape == (2, 4 * 44100)
+    assert library.pcm('minor-loop', 44100) is native
+    assert library.pcm('minor-loop', 22050).shape == (2, 4 * 22050)
+    assert library.key('minor-loop') == ('A', 'minor')
+    
+    # A fresh library (another process) reuses the files without decoding
+    monkeypatch.setattr('app.decode_audio', lambda *args, **kwargs: pytest.fail("beat decoded twice"))
+    reopened = BeatLibrary(str(tmp_path / 'beats'), str(tmp_path / 'cache'))
+    assert reopened.key('minor-loop') == ('A', 'minor')
+    assert reopened.info('minor-loop')['channels'] == 2
+    assert np.array_equal(reopened.pcm('minor-loop', 22050), library.pcm('minor-loop', 22050))
+
+def test_mixdown_over_instrumental(tmp_path):
+    """The tuned vocal is mixed over the beat at its gain and offset; key_lock takes the beat's key"""
+    (tmp_path / 'beats').mkdir()
+    (tmp_path / 'cache').mkdir()
+    sf.write(tmp_path / 'beats' / 'loop.wav', _chord_beat([(0, 4, 7), (5, 9, 12), (7, 11, 14), (0, 4, 7)], 22050), 22050)
+    processor = AutoTuneProcessor(beats=BeatLibrary(str(tmp_path / 'beats'), str(tmp_path / 'cache')))
+    sample_rate = 22050
+    t = np.arange(sample_rate) / sample_rate
+    vocal = (0.1 * np.sin(2 * np.pi * 450.0 * t)).astype(np.float32)
+    
+    effects = {"reverb_amount": 20, "instrumental": "loop", "instrumental_gain": 50, "instrumental_offset": 500}
+    dry = processor.process_audio(vocal, sample_rate, dict(effects, instrumental=None))
+    mixed = processor.process_audio(vocal, sample_rate, effects)
+    beat = processor.beats.pcm('loop', sample_rate)
+    assert mixed.shape == (2, len(vocal))
+    expected = dry + 0.5 * beat[:, sample_rate // 2:sample_rate // 2 + len(vocal)]
+    expected *= min(1.0, 0.95 / np.max(np.abs(expected)))
+    assert np.allclose(mixed, expected, atol=1e-5)
+    
+    # A negative offset brings the beat in late
+    late = processor.process_audio(vocal, sample_rate, dict(effects, instrumental_offset=-250))
+    expected = np.stack([dry, dry])
+    expected[:, sample_rate // 4:] += 0.5 * beat[:, :len(vocal) - sample_rate // 4]
+    expected *= min(1.0, 0.95 / np.max(np.abs(expected)))
+    assert np.allclose(late, expected, atol=1e-5)
+    
+    plan = processor._plan_chain({"autotune_strength": 80, "instrumental": "loop", "key_lock": True})
+    assert (plan['shift']['key'], plan['shift']['scale']) == ('C', 'major')
+    with pytest.raises(ValueError):
+        processor._plan_chain({"instrumental": "missing"})
+    with pytest.raises(ValueError):
+        processor._plan_chain({"autotune_strength": 80, "key_lock": True})
+
+def test_instrumental_endpoints_and_mixed_render(tmp_path, monkeypatch):
+    """/instrumentals lists the beats and /process-raw mixes the one named in the effects"""
+    (tmp_path / 'beats').mkdir()
+    (tmp_path / 'cache').mkdir()
+    sf.write(tmp_path / 'beats' / 'loop.wav', _chord_beat([(-3, 0, 4), (2, 5, 9), (4, 7, 11)], 22050), 22050)
+    library = BeatLibrary(str(tmp_path / 'beats'), str(tmp_path / 'cache'))
+    monkeypatch.setattr('app.beats', library)
+    monkeypatch.setattr('app.processor.beats', library)
+    monkeypatch.setattr('app.processors', ProcessorPool(1, 0, 1, lambda: AutoTuneProcessor(beats=library)))
+    monkeypatch.setattr('app.result_cache', ResultCache(memory_budget=0))
+    
+    client = app.test_client()
+    assert client.get('/instrumentals').get_json() == {"instrumentals": ["loop"]}
+    info = client.get('/instrumentals/loop').get_json()
+    assert info['key'] == 'A' and info['scale'] == 'minor' and info['channels'] == 2
+    assert client.get('/instrumentals/nope').status_code == 404
+    
+    sample_rate = 22050
+    t = np.arange(sample_rate) / sample_rate
+    upload = io.BytesIO()
+    sf.write(upload, 0.3 * np.sin(2 * np.pi * 452.0 * t), sample_rate, format='WAV')
+    effects = {"autotune_strength": 90, "instrumental": "loop", "instrumental_gain": 40, "key_lock": True}
+    response = client.post('/process-raw', data=upload.getvalue(), headers={'X-Effects': json.dumps(effects)})
+    assert response.status_code == 200
+    processed, _ = sf.read(io.BytesIO(response.data))
+    assert processed.shape == (len(t), 2)
+    # A beat the library doesn't have is the client's mistake, not a failed render
+    unknown = json.dumps(dict(effects, instrumental='nope'))
+    for route, send in (('/process-raw', dict(data=upload.getvalue(), headers={'X-Effects': unknown})),
+                        ('/upload', dict(data={'audio': (io.BytesIO(upload.getvalue()), 'take.wav'), 'effects': unknown}))):
+        response = client.post(route, **send)
+        assert response.status_code == 400 and "Unknown instrumental" in response.get_json()['error']
+
+def test_upload_store_decodes_once_and_maps(tmp_path, monkeypatch):
+    """Uploads decode once into read-only memory maps that processing never writes to"""
+    decodes = []
+    monkeypatch.setattr('app.decode_audio', lambda *args, **kwargs: decodes.append(1) or decode_audio(*args, **kwargs))
+    sample_rate = 22050
+    t = np.arange(sample_rate) / sample_rate
+    takes = []
+    for frequency in (440.0, 330.0):
+        upload = io.BytesIO()
+        sf.write(upload, 0.5 * np.sin(2 * np.pi * frequency * t), sample_rate, format='FLAC')
+        takes.append(upload.getvalue())
+    
+    store = PcmStore(str(tmp_path), budget=2**30)
+    audio, sr = store.load(takes[0], '.flac')
+    again, _ = store.load(takes[0], '.flac')
+    assert len(decodes) == 1 and sr == sample_rate
+    assert isinstance(again, np.memmap) and not again.flags.writeable
+    assert np.allclose(again, 0.5 * np.sin(2 * np.pi * 440.0 * t), atol=1e-4)
+    
+    stored = np.array(again)
+    processed = AutoTuneProcessor().process_audio(again, sr, {"reverb_amount": 40, "delay_time": 120})
+    assert not np.array_equal(processed, stored)
+    assert np.array_equal(np.load(next(tmp_path.glob('*.npy'))), stored)
+    
+    # Past the budget the least recently loaded take goes
+    small = PcmStore(str(tmp_path), budget=audio.nbytes + 1024)
+    small.load(takes[1], '.flac')
+    assert small.stats()['entries'] == 1
+    small.load(takes[0], '.flac')
+    assert len(decodes) == 3
+
+def test_job_result_range_requests(tmp_path, monkeypatch):
+    """A finished job's WAV is served from the result cache's file and honours Range"""
+    monkeypatch.setattr('app.result_cache', ResultCache(2**24, str(tmp_path), 2**30))
+    sample_rate = 22050
+    t = np.arange(sample_rate) / sample_rate
+    upload = io.BytesIO()
+    sf.write(upload, 0.5 * np.sin(2 * np.pi * 440.0 * t), sample_rate, format='WAV')
+    upload.seek(0)
+    
+    client = app.test_client()
+    response = client.post('/jobs', data={'audio': (upload, 'take.wav'), 'effects': '{"reverb_amount": 35}'})
+    job_url = response.headers['Location']
+    deadline = time.monotonic() + 60
+    while (status := client.get(job_url).get_json())['status'] in ('queued', 'running'):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    
+    full = client.get(status['result'])
+    assert full.status_code == 200 and full.headers['Accept-Ranges'] == 'bytes'
+    assert full.data == next(tmp_path.glob('*.wav')).read_bytes()
+    header = client.get(status['result'], headers={'Range': 'bytes=0-43'})
+    assert header.status_code == 206 and header.data == full.data[:44]
+    assert header.headers['Content-Range'] == f"bytes 0-43/{len(full.data)}"
+
+def test_import_defers_heavy_modules():
+    """Importing the app leaves scipy.signal and librosa's submodules for first use"""
+    loaded = subprocess.run(
+        [sys.executable, '-c', "import sys, app; print(sorted(m for m in ('scipy.signal', 'librosa.core', 'pydub') if m in sys.modules))"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+    ).stdout.split('\n')[-2]
+    assert loaded == '[]'
+    assert np.allclose(hann_window(2048), get_window('hann', 2048))
+
+_worker_warm = False
+
+def _warm_test_worker():
+    global _worker_warm
+    _worker_warm = True
+
+def _is_worker_warm(job_id):
+    return _worker_warm
+
+def test_health_waits_for_warmup(monkeypatch):
+    """/health answers 503 until the warmup render has run and the job workers are up; it records no metrics"""
+    import app as app_module
+    started = []
+    monkeypatch.setattr('app.ready', threading.Event())
+    monkeypatch.setattr('app.start_warmup', lambda: started.append(1))
+    client = app.test_client()
+    response = client.get('/health')
+    assert response.status_code == 503 and response.get_json()['status'] == 'warming'
+    assert started == [1]
+    
+    def stage_lines():
+        return [line for line in client.get('/metrics').get_data(as_text=True).splitlines()
+                if line.startswith('autotune_stage')]
+    before = stage_lines()
+    warm_up()
+    assert stage_lines() == before
+    assert len(app_module.scheduler._executor._processes) == app_module.scheduler.max_workers
+    response = client.get('/health')
+    assert response.status_code == 200 and response.get_json()['status'] == 'healthy'
+    assert response.get_json()['warmup_seconds'] > 0
+    
+    scheduler = JobScheduler(max_workers=1, warmup=_warm_test_worker)
+    try:
+        assert scheduler.wait(scheduler.submit(_is_worker_warm), timeout=30) is True
+    finally:
+        scheduler.shutdown()
+
+def test_render_pool_admission_control(monkeypatch):
+    """Renders beyond the pool's slots and queue get 503 with Retry-After, and slots come back"""
+    pool = ProcessorPool(1, 1, 0.2, AutoTuneProcessor)
+    held = pool.get()
+    with pytest.raises(Overloaded):
+        pool.get()  # waits 0.2 s in the one queue place
+    assert pool.stats() == {'slots': 1, 'busy': 1, 'waiting': 0, 'rejected': 1}
+    
+    monkeypatch.setattr('app.processors', pool)
+    monkeypatch.setattr('app.result_cache', ResultCache(memory_budget=0))
+    take = io.BytesIO()
+    sf.write(take, 0.3 * np.sin(2 * np.pi * 440 * np.arange(22050) / 22050), 22050, format='WAV')
+    client = app.test_client()
+    response = client.post('/process-raw?pitch_shift=3', data=take.getvalue())
+    assert response.status_code == 503 and response.headers['Retry-After'] == '5'
+    assert 'Server busy' in response.get_json()['error']
+    
+    pool.put(held)
+    response = client.post('/process-raw?pitch_shift=3', data=take.getvalue())
+    assert response.status_code == 200
+    response = client.post('/process-stream', data={'audio': (io.BytesIO(take.getvalue()), 'take.wav')})
+    assert response.status_code == 200 and len(response.get_data()) > 44
+    response.close()
+    assert pool.stats()['busy'] == 0
+
+def test_preview_renders_a_window_at_the_preview_rate(monkeypatch):
+    """quality='preview' renders only the window, at PREVIEW_SAMPLE_RATE, and sessions keep its memo"""
+    sample_rate = 44100
+    t = np.arange(4 * sample_rate) / sample_rate
+    take = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    processor = AutoTuneProcessor()
+    effects = {"pitch_shift": 3, "reverb_amount": 20, "quality": "preview",
+               "preview_start": 1000, "preview_duration": 2000}
+    assert processor.output_rate(sample_rate, effects) == 22050
+    preview = processor.process_audio(take, sample_rate, effects)
+    assert preview.shape == (2 * 22050,)
+    assert processor.process_audio(take, sample_rate, {**effects, "preview_duration": 0}).shape == (3 * 22050,)
+    # Three semitones up, as the final render would be
+    spectrum = np.abs(np.fft.rfft(preview[4096:-4096] * np.hanning(len(preview) - 8192)))
+    peak = np.argmax(spectrum) * 22050 / (len(preview) - 8192)
+    assert abs(peak - 440 * 2 ** (3 / 12)) < 10
+    with pytest.raises(ValueError):
+        processor._plan_chain({"quality": "draft"})
+    
+    session = AnalysisSession(take, sample_rate)
+    processor.process_audio(take, sample_rate, effects, analysis=session.analysis)
+    memo = session.analysis['preview']
+    processor.process_audio(take, sample_rate, {**effects, "reverb_amount": 60}, analysis=session.analysis)
+    assert session.analysis['preview'] is memo and 'shifted' in memo['analysis']
+    session.measure()
+    assert session.nbytes() > take.nbytes + memo['audio'].nbytes
+    
+    monkeypatch.setattr('app.result_cache', ResultCache(memory_budget=0))
+    upload = io.BytesIO()
+    sf.write(upload, take, sample_rate, format='WAV')
+    response = app.test_client().post('/process-raw', data=upload.getvalue(),
+                                      headers={'X-Effects': json.dumps(effects)})
+    assert response.status_code == 200 and response.headers['X-Sample-Rate'] == '22050'
+    audio, sr = sf.read(io.BytesIO(response.get_data()))
+    assert sr == 22050 and len(audio) == 2 * 22050
+
+def test_user_presets_compile_once_and_persist(monkeypatch, tmp_path):
+    """PUT /presets registers a preset on disk, renders by name match the raw effects, /presets revalidates by ETag"""
+    import app as app_module
+    path = tmp_path / 'presets.json'
+    monkeypatch.setattr(app_module.presets, 'path', str(path))
+    monkeypatch.setattr('app.result_cache', ResultCache(memory_budget=0))
+    client = app.test_client()
+    response = client.get('/presets')
+    etag = response.headers['ETag']
+    assert response.status_code == 200 and 'kanye' in response.get_json()
+    assert client.get('/presets', headers={'If-None-Match': etag}).status_code == 304
+    
+    effects = {"pitch_shift": 2, "reverb_amount": 40, "room_size": 80, "delay_time": 120}
+    assert client.put('/presets/kanye', json={"effects": effects}).status_code == 400
+    assert client.put('/presets/Loud', json={"effects": effects}).status_code == 400
+    assert client.put('/presets/x', json={"effects": {**effects, "quality": "preview"}}).status_code == 400
+    for bad in ({"pitch_detector": "ears"}, {"key": "H"}, {"scale": "dorian"}, {"pitch_shift": "2"}, {"reverb": 40}):
+        assert client.put('/presets/x', json={"effects": {**effects, **bad}}).status_code == 400
+    assert not path.exists()
+    response = client.put('/presets/dark-room', json={"name": "Dark Room", "effects": effects})
+    assert response.status_code == 201 and response.get_json()['custom']
+    assert PresetRegistry(app_module.PRESETS, str(path)).effects('dark-room') == effects
+    response = client.get('/presets', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+    assert response.get_json()['dark-room']['name'] == 'Dark Room'
+    
+    sample_rate = 22050
+    take = (0.5 * np.sin(2 * np.pi * 330 * np.arange(sample_rate) / sample_rate)).astype(np.float32)
+    processor = AutoTuneProcessor(presets=app_module.presets)
+    by_name = processor.process_audio(take, sample_rate, {"preset": "dark-room"})
+    np.testing.assert_allclose(by_name, AutoTuneProcessor().process_audio(take, sample_rate, effects), atol=1e-6)
+    plan, kernels = processor._preset_chains['dark-room', sample_rate]
+    assert 'reverb' in kernels and processor._preset_chain('dark-room', sample_rate)[0] is plan
+    assert 'reverb' not in processor._plan_chain({"preset": "dark-room", "reverb_amount": 0})
+    # Re-registering recompiles
+    client.put('/presets/dark-room', json={"effects": {**effects, "delay_time": 0}})
+    assert 'delay' not in processor._preset_chain('dark-room', sample_rate)[0]
+    preview = {"quality": "preview", "preview_start": 250}
+    np.testing.assert_array_equal(processor.process_audio(take, sample_rate, {"preset": "kanye", **preview}),
+                                  processor.process_audio(take, sample_rate, {**PRESETS['kanye']['effects'], **preview}))
+    
+    upload = io.BytesIO()
+    sf.write(upload, take, sample_rate, format='WAV')
+    assert client.post('/process-raw?preset=dark-room', data=upload.getvalue()).status_code == 200
+    
+    assert client.delete('/presets/dark-room').status_code == 200
+    assert client.delete('/presets/dark-room').status_code == 404
+    assert client.delete('/presets/kanye').status_code == 404
+    with pytest.raises(ValueError):
+        processor._plan_chain({"preset": "dark-room"})
+
+def test_shift_skips_silence_between_phrases():
+    """Only voiced segments are shifted; silence passes through and reverb/delay tails still ring into it"""
+    sample_rate = 22050
+    t = np.arange(int(6.5 * sample_rate)) / sample_rate
+    sung = ((t > 1) & (t < 2.5)) | ((t > 4) & (t < 5.5))
+    take = (0.5 * np.sin(2 * np.pi * 440 * t) * sung).astype(np.float32)
+    take += 1e-4 * np.random.default_rng(0).standard_normal(len(t)).astype(np.float32)
+    processor = AutoTuneProcessor()
+    segments = processor._voiced_segments(take, sample_rate)
+    assert len(segments) == 2 and all(start % processor.hop_length == 0 for start, _ in segments)
+    assert segments[0][0] < sample_rate < 2.5 * sample_rate < segments[0][1] < 4 * sample_rate
+    
+    shifted = processor._apply_shift(take, sample_rate, semitones=3)
+    outside = np.ones(len(take), dtype=bool)
+    for start, end in segments:
+        outside[start:end] = False
+    assert np.array_equal(shifted[outside], take[outside])
+    phrase = shifted[int(1.5 * sample_rate):int(2 * sample_rate)]
+    peak = np.argmax(np.abs(np.fft.rfft(phrase))) * sample_rate / len(phrase)
+    assert abs(peak - 440 * 2 ** (3 / 12)) < 5
+    
+    # A take with no silence to skip renders exactly as one pass over it
+    voiced = (0.5 * np.sin(2 * np.pi * 440 * t[:sample_rate])).astype(np.float32)
+    whole = AutoTuneProcessor()
+    whole.skip_silence = False
+    np.testing.assert_array_equal(processor._apply_shift(voiced, sample_rate, semitones=3),
+                                  whole._apply_shift(voiced, sample_rate, semitones=3))
+    
+    session = AnalysisSession(take, sample_rate)
+    rendered = processor.process_audio(take, sample_rate, {"pitch_shift": 3, "reverb_amount": 40, "delay_time": 200},
+                                       analysis=session.analysis)
+    assert ('segment',) + segments[0] in session.analysis
+    after = rendered[segments[0][1]:segments[0][1] + sample_rate // 5]
+    assert np.sqrt(np.mean(after ** 2)) > 0.01
+
+def test_invalid_effects_are_rejected_with_400(monkeypatch):
+    """Effects _plan_chain rejects give 400 on every render route, and process_audio raises instead of passing audio through"""
+    monkeypatch.setattr('app.result_cache', ResultCache(memory_budget=0))
+    sample_rate = 22050
+    take = io.BytesIO()
+    sf.write(take, 0.3 * np.sin(2 * np.pi * 440 * np.arange(sample_rate) / sample_rate), sample_rate, format='WAV')
+    take = take.getvalue()
+    client = app.test_client()
+    session_id = client.post('/sessions', data={'audio': (io.BytesIO(take), 'take.wav')}).get_json()['session_id']
+    for bad in ({"autotune_strength": 50, "pitch_detector": "ears"}, {"quality": "draft"}, {"preset": "nope"}, [1]):
+        form = {'audio': (io.BytesIO(take), 'take.wav'), 'effects': json.dumps(bad)}
+        responses = [
+            client.post('/upload', data=form),
+            client.post('/jobs', data={**form, 'audio': (io.BytesIO(take), 'take.wav')}),
+            client.post('/process-raw', data=take, headers={'X-Effects': json.dumps(bad)}),
+            client.post('/process-base64', json={'audio_data': base64.b64encode(take).decode(), 'effects': bad}),
+            client.post(f'/sessions/{session_id}/render', json={'effects': bad}),
+        ]
+        assert [response.status_code for response in responses] == [400] * 5, bad
+        if isinstance(bad, dict):
+            with pytest.raises(ValueError):
+                AutoTuneProcessor().process_audio(np.zeros(1024, dtype=np.float32), sample_rate, bad)
+    client.delete(f'/sessions/{session_id}')
+
+def test_realtime_session_over_a_fake_socket():
+    """The /realtime handler answers every frame and reports bad messages without dropping the connection"""
+    from simple_websocket import ConnectionClosed
+    from werkzeug.datastructures import MultiDict
+    
+    class FakeSocket:
+        def __init__(self, messages):
+            self.messages = list(messages)
+            self.sent = []
+            self.closed = None
+        
+        def receive(self):
+            if not self.messages:
+                raise ConnectionClosed()
+            return self.messages.pop(0)
+        
+        def send(self, message):
+            self.sent.append(message)
+        
+        def close(self, reason=None, message=None):
+            self.closed = reason
+    
+    frame = (0.3 * np.sin(2 * np.pi * 440 * np.arange(256) / 22050)).astype('<f4').tobytes()
+    ws = FakeSocket([frame, '[1]', '{"effects": {"key": "H"}}', 'not json', frame[:100],
+                     '{"effects": {"pitch_shift": 2}}', frame])
+    with pytest.raises(ConnectionClosed):
+        realtime_session(ws, MultiDict({'sr': '22050', 'frame': '256', 'pitch_shift': '3'}))
+    hello, processed, *errors, switched, last = ws.sent
+    assert json.loads(hello)['frame_size'] == 256 and json.loads(switched)['sample_rate'] == 22050
+    assert len(processed) == len(last) == len(frame)
+    assert len(errors) == 4 and all('error' in json.loads(error) for error in errors)
+    
+    for query in ({'frame': '8'}, {'sr': '0'}, {'sr': '-44100'}, {'sr': '10000000'}):
+        ws = FakeSocket([])
+        realtime_session(ws, MultiDict(query))
+        assert len(ws.sent) == 1 and 'error' in json.loads(ws.sent[0]) and ws.closed == 1008
+
 def test_dependencies():
     """Test if all required dependencies are installed"""
     print("📦 Testing Dependencies...")
@@ -66,11 +1094,11 @@ def test_dependencies():
     dependencies = [
         ('flask', 'Flask'),
         ('flask_cors', 'Flask-CORS'),
+        ('flask_sock', 'Flask-Sock'),
         ('numpy', 'NumPy'),
         ('scipy', 'SciPy'),
         ('librosa', 'Librosa'),
         ('soundfile', 'SoundFile'),
-        ('pydub', 'PyDub'),
     ]
     
     all_good = True
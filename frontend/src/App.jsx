@@ -31,6 +31,11 @@ function App() {
     const checkBackend = async () => {
       try {
         const health = await autoTuneAPI.healthCheck();
+        if (health.status === 'warming') {
+          // The backend answers once it has warmed up; ask again shortly
+          setTimeout(checkBackend, 1000);
+          return;
+        }
         setBackendStatus(health.status === 'healthy' ? 'connected' : 'error');
       } catch (error) {
         setBackendStatus('disconnected');
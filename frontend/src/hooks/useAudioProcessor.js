@@ -14,50 +14,22 @@ const useAudioProcessor = (effects, setStatus, selectedInstrumental = null, inst
   
   const playerRef = useRef(null);
   const instrumentalRef = useRef(null);
-  const audioContextRef = useRef(null);
-  const mixedStreamRef = useRef(null);
+  const beatOffsetRef = useRef(0);
+  // Id of the beat that actually played under the take, null when none did
+  const playedBeatRef = useRef(null);
 
-  // Create mixed audio stream with microphone and instrumental
-  const createMixedStream = useCallback(async (micStream, instrumentalAudio) => {
-    try {
-      // Create or reuse audio context
-      if (!audioContextRef.current) {
-        audioContextRef.current = new (window.AudioContext || window.webkitAudioContext)();
-      }
-      const audioContext = audioContextRef.current;
-      
-      // Resume context if suspended
-      if (audioContext.state === 'suspended') {
-        await audioContext.resume();
-      }
-
-      // Create audio nodes
-      const micSource = audioContext.createMediaStreamSource(micStream);
-      const instrumentalSource = audioContext.createMediaElementSource(instrumentalAudio);
-      const gainNode = audioContext.createGain();
-      const mixNode = audioContext.createGain();
-      
-      // Set instrumental volume
-      gainNode.gain.value = instrumentalVolume;
-      
-      // Connect nodes: instrumental -> gain -> mixer
-      instrumentalSource.connect(gainNode);
-      gainNode.connect(mixNode);
-      
-      // Connect microphone directly to mixer
-      micSource.connect(mixNode);
-      
-      // Create output stream
-      const destination = audioContext.createMediaStreamDestination();
-      mixNode.connect(destination);
-      
-      console.log('✅ Audio mixing setup complete');
-      return destination.stream;
-      
-    } catch (error) {
-      console.error('❌ Error creating mixed stream:', error);
-      throw error;
+  // Mixdown settings for the backend: the recording is the dry vocal, the
+  // backend tunes it and mixes the instrumental in at this gain and offset.
+  // Beats that failed to load (e.g. demo mode) leave the take mic-only
+  const instrumentalMix = useCallback(() => {
+    if (!playedBeatRef.current) {
+      return null;
     }
+    return {
+      instrumental: playedBeatRef.current,
+      instrumental_gain: Math.round(instrumentalVolume * 100),
+      instrumental_offset: Math.round(beatOffsetRef.current * 1000),
+    };
   }, [instrumentalVolume]);
 
   const initializeAudio = useCallback(async () => {
@@ -218,19 +190,22 @@ const useAudioProcessor = (effects, setStatus, selectedInstrumental = null, inst
         } 
       });
       
-      let recordingStream = micStream;
+      const recordingStream = micStream;
       let mediaRecorder;
+      beatOffsetRef.current = 0;
+      playedBeatRef.current = null;
       
-      // If instrumental is selected, create mixed stream
+      // If instrumental is selected, play it to sing along to; the recording
+      // stays dry and the backend mixes the beat in
       if (selectedInstrumental && selectedInstrumental.audioUrl) {
         try {
-          console.log('🎵 Setting up mixed recording with:', selectedInstrumental.title);
+          console.log('🎵 Playing instrumental for recording:', selectedInstrumental.title);
           
           // Create and setup instrumental audio
           const audio = new Audio();
           audio.src = selectedInstrumental.audioUrl;
           audio.volume = instrumentalVolume;
-          audio.loop = true;
+          audio.loop = false; // The backend mixes the beat once through
           audio.crossOrigin = "anonymous";
           
           instrumentalRef.current = audio;
@@ -244,18 +219,15 @@ const useAudioProcessor = (effects, setStatus, selectedInstrumental = null, inst
           
           // Start playing instrumental
           await audio.play();
+          playedBeatRef.current = selectedInstrumental.audioUrl.split('/').pop().replace(/\.[^.]+$/, '');
           console.log('✅ Instrumental playback started');
           
-          // Create mixed stream with both mic and instrumental
-          recordingStream = await createMixedStream(micStream, audio);
-          mixedStreamRef.current = recordingStream;
-          
           setStatus(`Recording with "${selectedInstrumental.title}" instrumental...`);
           
         } catch (error) {
-          console.warn('⚠️ Instrumental mixing failed, recording mic only:', error);
-          setStatus('Recording started (instrumental mixing failed)...');
-          recordingStream = micStream;
+          console.warn('⚠️ Instrumental playback failed, recording mic only:', error);
+          setStatus('Recording started (instrumental playback failed)...');
+          instrumentalRef.current = null;
         }
       }
       
@@ -276,6 +248,10 @@ const useAudioProcessor = (effects, setStatus, selectedInstrumental = null, inst
       
       mediaRecorder.onstart = () => {
         console.log('✅ MediaRecorder started successfully at', new Date().toLocaleTimeString());
+        // Where in the beat the take starts, for lining it up in the mixdown
+        if (instrumentalRef.current) {
+          beatOffsetRef.current = instrumentalRef.current.currentTime;
+        }
       };
       
       mediaRecorder.ondataavailable = (event) => {
@@ -309,7 +285,7 @@ const useAudioProcessor = (effects, setStatus, selectedInstrumental = null, inst
           console.log('🔄 Processing audio with effects...');
           
           setIsProcessing(true);
-          const processedBlob = await autoTuneAPI.processRecording(blob, effects);
+          const processedBlob = await autoTuneAPI.processRecording(blob, effects, instrumentalMix());
           
           if (processedBlob && processedBlob.size > 0) {
             setProcessedBlob(processedBlob);
@@ -349,13 +325,10 @@ const useAudioProcessor = (effects, setStatus, selectedInstrumental = null, inst
       if (instrumentalRef.current) {
         instrumentalRef.current.pause();
       }
-      if (mixedStreamRef.current) {
-        mixedStreamRef.current.getTracks().forEach(track => track.stop());
-      }
       
       throw error;
     }
-  }, [recorder, selectedInstrumental, instrumentalVolume, effects, createMixedStream]);
+  }, [recorder, selectedInstrumental, instrumentalVolume, effects, instrumentalMix]);
 
   const stopRecording = useCallback(() => {
     try {
@@ -368,13 +341,6 @@ const useAudioProcessor = (effects, setStatus, selectedInstrumental = null, inst
         instrumentalRef.current.currentTime = 0;
       }
       
-      // Clean up mixed stream
-      if (mixedStreamRef.current) {
-        console.log('🔄 Stopping mixed audio stream');
-        mixedStreamRef.current.getTracks().forEach(track => track.stop());
-        mixedStreamRef.current = null;
-      }
-      
       if (recorder?.state === 'recording') {
         console.log('📀 MediaRecorder state before stop:', recorder.state);
         
@@ -412,7 +378,7 @@ const useAudioProcessor = (effects, setStatus, selectedInstrumental = null, inst
           setIsProcessing(true);
           
           // Mock backend processing
-          const processedBlob = await autoTuneAPI.processRecording(recordedBlob, effects);
+          const processedBlob = await autoTuneAPI.processRecording(recordedBlob, effects, instrumentalMix());
           setProcessedBlob(processedBlob);
           
           const arrayBuffer = await processedBlob.arrayBuffer();
@@ -453,7 +419,7 @@ const useAudioProcessor = (effects, setStatus, selectedInstrumental = null, inst
       setStatus('Error playing audio: ' + error.message);
       setIsProcessing(false);
     }
-  }, [recordedBlob, audioBuffer, effects, setStatus]);
+  }, [recordedBlob, audioBuffer, effects, setStatus, instrumentalMix]);
 
   const downloadRecording = useCallback(() => {
     try {
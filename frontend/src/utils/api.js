@@ -97,6 +97,41 @@ class AutoTuneAPI {
     }
   }
 
+  // Process raw audio bytes; effects travel in the query string
+  async processAudioRaw(audioBlob, effects) {
+    try {
+      const params = new URLSearchParams({ effects: JSON.stringify(effects) });
+      const url = `${this.baseURL}/process-raw?${params}`;
+      console.log('📤 Sending to backend:', url);
+      console.log('📦 Request payload size:', audioBlob.size, 'bytes');
+
+      const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/octet-stream',
+        },
+        body: audioBlob,
+      });
+
+      console.log('📡 Response status:', response.status);
+
+      if (!response.ok) {
+        const errorText = await response.text();
+        console.error('❌ Backend error response:', errorText);
+        throw new Error(`Backend returned status ${response.status}: ${errorText}`);
+      }
+
+      // The body is the processed WAV file itself
+      return await response.blob();
+    } catch (error) {
+      console.error('❌ Backend request failed:', error);
+      if (error.message.includes('fetch') || error.name === 'TypeError') {
+        throw new Error('Network error - backend unreachable');
+      }
+      throw error;
+    }
+  }
+
   // Convert audio blob to base64
   async blobToBase64(blob) {
     return new Promise((resolve, reject) => {
@@ -121,31 +156,21 @@ class AutoTuneAPI {
   }
 
   // Convert MediaRecorder recording to processable format
-  async processRecording(recordedBlob, effects) {
+  // mix, if given, names the instrumental the backend mixes the tuned vocal over
+  // ({ instrumental, instrumental_gain, instrumental_offset })
+  async processRecording(recordedBlob, effects, mix = null) {
     try {
       console.log('🎵 Processing recording with effects:', effects);
       console.log('📊 Blob size:', recordedBlob.size, 'bytes');
       
       // Convert effects to backend format
-      const backendEffects = this.convertEffectsToBackendFormat(effects);
+      const backendEffects = { ...this.convertEffectsToBackendFormat(effects), ...(mix || {}) };
       console.log('🔄 Backend effects format:', backendEffects);
       
-      // Convert blob to base64
-      const base64Audio = await this.blobToBase64(recordedBlob);
-      console.log('🔄 Converted to base64, length:', base64Audio.length);
-      
-      // Process with backend
-      const result = await this.processAudioBase64(base64Audio, backendEffects);
+      // Send the recording as-is and get the WAV back as a blob
+      const processedBlob = await this.processAudioRaw(recordedBlob, backendEffects);
       console.log('✅ Backend processing complete');
       
-      // Convert result back to blob for playback
-      const processedAudioData = atob(result.processed_audio);
-      const processedBytes = new Uint8Array(processedAudioData.length);
-      for (let i = 0; i < processedAudioData.length; i++) {
-        processedBytes[i] = processedAudioData.charCodeAt(i);
-      }
-      
-      const processedBlob = new Blob([processedBytes], { type: 'audio/wav' });
       console.log('🎧 Processed audio blob size:', processedBlob.size, 'bytes');
       return processedBlob;
     } catch (error) {